@@ -1,10 +1,141 @@
 #XPS ASC2コンバーター
+import os
 import csv
+import warnings
 import numpy as np
 
-def load_allspe(path):
+import XPSBIN
+import XPSSET
+
+def load_allspe(path, binary_cache=True, write_binary=False):
+    """
+    指定されたパスのCSVファイルを読み込み、タグとデータを XPSSET.SpectrumSet で返す関数
+    tags, x, y = load_allspe(path) と従来どおりリストにも分けられる
+    まず一括読み込み (load_allspe_fast) を試し、解釈できない行があれば1行ずつの読み込みに切り替える
+    binary_cache: True なら隣に最新の .xpsb (XPSBIN形式) があるときはそちらから読む (読むだけで作らない)
+    write_binary: True なら .xpsb が無い・古いときに、CSVを読んだ後で隣に作っておく (次回から高速に読める)
+                  データのフォルダにファイルが増えるので既定では作らない (.xpsb は binary_scan が書く)
+    """
+    bin_path = XPSBIN.binary_path_for(path)
+    if binary_cache and os.path.exists(path) and XPSBIN.is_fresh(bin_path, path):
+        try:
+            return XPSBIN.load_binary(bin_path)
+        except (OSError, ValueError):
+            pass
+
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        print("ファイルが見つかりませんでした。")
+        return XPSSET.SpectrumSet.from_lists([], [], [])
+
+    result = parse_allspe_bytes(raw)
+    if result is None:
+        result = XPSSET.SpectrumSet.from_lists(*load_allspe_rows(path))
+
+    if write_binary and result.n_regions:
+        try:
+            XPSBIN.save_spectra(bin_path, result, source_path=path)
+        except OSError:
+            pass # 書き込めない場所 (読み取り専用など) では作らない
+    return result
+
+def load_allspe_fast(path):
+    """
+    CSVファイルを一括で読み込む関数 (戻り値は load_allspe と同じ)
+    数値は1つの連続したfloat配列に変換し、x, y の連結配列と各領域の区切りを SpectrumSet にする
+    解釈できない場合は None を返す
+    """
+    with open(path, 'rb') as f:
+        return parse_allspe_bytes(f.read())
+
+def parse_allspe_bytes(raw):
+    """
+    CSVの内容 (bytes) を解析する関数
+    1. バイト列からカンマの数で行を分類する (1個 = データ行, 0個 = 区切り/タグ行)
+    2. データ行だけを抜き出し、改行をカンマに置き換えて np.fromstring で一括変換する
+    3. 区切り行の位置から各領域の範囲を決め、x, y の連結配列と合わせて SpectrumSet で返す
+    数値に変換できない行などがあれば None を返す (呼び出し側で1行ずつの読み込みを行う)
+    """
+    # 改行コードを \n にそろえる (\r\n の \r は空白として無視される)
+    if b'\r' in raw and b'\n' not in raw:
+        raw = raw.replace(b'\r', b'\n')
+
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    if len(buf) == 0:
+        return XPSSET.SpectrumSet.from_lists([], [], [])
+
+    # --- 1. 行の分類 ---
+    newline = np.flatnonzero(buf == ord('\n'))
+    if len(newline) > 0 and newline[-1] == len(buf) - 1:
+        line_end = newline
+    else:
+        line_end = np.append(newline, len(buf))  # 最終行に改行がない場合
+    line_start = np.concatenate(([0], line_end[:-1] + 1))
+
+    comma = np.flatnonzero(buf == ord(','))
+    n_comma = np.searchsorted(comma, line_end) - np.searchsorted(comma, line_start)
+
+    is_data = n_comma == 1
+    is_sep = n_comma == 0
+
+    # --- 2. データ行を一括で数値に変換 ---
+    line_len = np.diff(np.append(line_start, len(buf)))  # 改行を含む各行のバイト数
+    byte_mask = np.repeat(is_data, line_len)
+    data = buf[byte_mask].copy()
+    data[data == ord('\n')] = ord(',')
+
+    n_rows = int(is_data.sum())
+    if n_rows > 0:
+        data_bytes = data.tobytes().rstrip().rstrip(b',')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                values = np.fromstring(data_bytes, dtype=float, sep=',')
+            except (DeprecationWarning, ValueError):
+                return None
+        if len(values) != 2 * n_rows:
+            return None
+    else:
+        values = np.zeros(0)
+    xy = values.reshape(-1, 2)
+
+    # --- 3. 領域の切り出し (区切り行ごとに、それまでのデータを1領域とする) ---
+    tags = []
+    offsets = []
+    lengths = []
+    current_tag = "Unknown"
+
+    row_index = np.cumsum(is_data)  # 各行までのデータ行数
+    block_start = 0
+    for line in np.flatnonzero(is_sep):
+        n_before = row_index[line]
+        if n_before > block_start:
+            offsets.append(block_start)
+            lengths.append(n_before - block_start)
+            tags.append(current_tag)
+            block_start = n_before
+
+        # 新しいタグを取得
+        label = raw[line_start[line]:line_end[line]].decode('utf-8', errors='replace').strip()
+        if len(label) >= 2 and label.startswith('"') and label.endswith('"'):
+            label = label[1:-1].strip()
+        if label not in ['1', '', ' ']:
+            current_tag = label
+
+    # --- 最後のブロックを保存 ---
+    if n_rows > block_start:
+        offsets.append(block_start)
+        lengths.append(n_rows - block_start)
+        tags.append(current_tag)
+
+    # 領域はデータ行の順に並んでいるので、連結配列は x 列, y 列そのもの
+    return XPSSET.SpectrumSet(tags, xy[:, 0], xy[:, 1], offsets, lengths)
+
+def load_allspe_rows(path):
     """
-    指定されたパスのCSVファイルを読み込み、タグとデータをリストで返す関数
+    CSVファイルを csv.reader で1行ずつ読み込む関数 (load_allspe の予備)
     """
     all_data_x = []
     all_data_y = []
@@ -0,0 +1,580 @@
+#バッチ処理用 (ダイアログなしで複数ファイルを一括解析)
+import os
+import csv
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import XPSASC
+import XPSCAL
+import XPSFIT
+import XPSOUTPUTXL
+import XPSCACHE
+import XPSPROF
+import XPSINCR
+import XPSBOOT
+import XPSMULTI
+import XPSPLOTUI
+
+# 設定ファイルの既定の場所 (このファイルと同じフォルダ)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RSF_PATH = os.path.join(BASE_DIR, 'RSF.json')
+DEFAULT_PEAKFIT_PATH = os.path.join(BASE_DIR, 'peakfit.json')
+
+# 出力形式 (--format) : xlsx = 通常のExcel, xlsx-stream = 省メモリのExcel, csv/parquet = フォルダ出力
+EXPORT_FORMATS = ["xlsx", "xlsx-stream", "csv", "parquet"]
+
+# フィッティングしない領域 (0番目のSurveyは別途スキップ)
+SKIP_FIT_TAGS = ["CuLMM"]
+
+
+def load_config(rsf_path=DEFAULT_RSF_PATH, peakfit_path=DEFAULT_PEAKFIT_PATH):
+    """
+    RSF.json と peakfit.json を読み込んで返す関数
+    ファイルが無い場合は空リストを返す (その工程はスキップされる)
+    """
+    configs = []
+    for path in (rsf_path, peakfit_path):
+        try:
+            with open(path, 'r') as f:
+                configs.append(json.load(f))
+        except FileNotFoundError:
+            print(f"警告: '{path}' が見つかりません。該当する処理をスキップします。")
+            configs.append([])
+    return configs[0], configs[1]
+
+
+def collect_files(inputs, pattern="*.csv"):
+    """
+    ディレクトリ・globパターン・ファイルパスのリストから処理対象のファイル一覧を作る関数
+    ディレクトリの場合は pattern に一致するファイルを再帰的に探す
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files.extend(glob.glob(os.path.join(item, '**', pattern), recursive=True))
+        else:
+            files.extend(glob.glob(item))
+
+    # 重複を除いて順序を固定
+    return sorted(set(os.path.abspath(p) for p in files))
+
+
+def fit_targets(tags, peak_db):
+    """フィッティングの対象になる領域の番号のリスト"""
+    targets = []
+    for i in range(len(tags)):
+        # --- スキップ条件 ---
+        # 0番目 (Survey/Su1s) と CuLMM はフィッティングしない
+        if i == 0:
+            continue
+        if tags[i] in SKIP_FIT_TAGS:
+            continue
+        # JSONに設定がなければスキップ（サイレント）
+        if not any(p["level"] == tags[i] for p in peak_db):
+            continue
+        targets.append(i)
+    return targets
+
+
+def fit_regions(tags, x, y, peak_db, verbose=True, cache=None, indices=None,
+                backgrounds=None, baselines=None, bootstrap=0, bootstrap_method="residual",
+                bootstrap_workers=None, multistart=0, multistart_seed=0, multistart_time=None,
+                multistart_workers=None, engine="curve_fit"):
+    """
+    各領域のバックグラウンドを除去し、peakfit.jsonの設定でフィッティングする関数
+    XPSSET.SpectrumSet は tags, x, y = spectra と分けて渡す (各領域はビューなのでコピーしない)
+    cache: XPSCACHE.FitCache (None なら既定のキャッシュを使う)
+    indices: 計算する領域の番号 (None なら fit_targets のすべて)
+    backgrounds: {level: バックグラウンドの種類} (XPSCAL.background_methods で作る。無いlevelはShirley)
+    baselines: 1回の解析で共有するベースラインの辞書 (XPSCAL.region_areas を参照)
+               atomic_percent で計算済みの領域は再計算せず、同じバックグラウンドを使う
+    bootstrap: 0 より大きければ、その回数だけ再フィットして各成分に信頼区間を付ける (XPSBOOT.bootstrap_fit)
+    bootstrap_method: "residual" (残差の再抽出) / "poisson" (ポアソンノイズ)
+    bootstrap_workers: 再フィットのワーカープロセス数 (None ならCPU数)
+    multistart: 1 より大きければ、その数の初期値から並列にフィットして最良の結果を使う (XPSMULTI.multistart_fit)
+                時間切れで結果が変わりうるので、このときはキャッシュを使わない
+    multistart_seed: 初期値を選ぶ乱数シード, multistart_time: 1領域あたりの制限時間 (秒)
+    multistart_workers: マルチスタートのワーカープロセス数 (None ならCPU数)
+    engine: フィッティングの方法 ("curve_fit" / "varpro"、XPSFIT.perform_fitting を参照)
+    戻り値: 領域ごとの結果辞書 (peaks, y_total, y_bg) のリスト。対象外の領域は None
+    """
+    if cache is None:
+        cache = XPSCACHE.FitCache()
+    hits, misses = cache.hits, cache.misses
+
+    if backgrounds is None:
+        backgrounds = {}
+    if baselines is None:
+        baselines = {}
+
+    fit_results_list = [None] * len(tags)
+    targets = fit_targets(tags, peak_db)
+    if indices is not None:
+        indices = set(indices)
+        targets = [i for i in targets if i in indices]
+
+    # マルチスタートのプロセスプールは全領域で使い回す (領域ごとに作り直さない)
+    start_pool = XPSMULTI.StartPool(multistart_workers) if multistart > 1 and multistart_workers != 1 else None
+    try:
+        for i in targets:
+            current_tag = tags[i]
+
+            # JSONから設定を探す
+            target_peaks_config = [p for p in peak_db if p["level"] == current_tag]
+
+            # --- バックグラウンド処理 (Shirley法 / Tougaard法) ---
+            # フィッティング精度向上のため、バックグラウンドを引いたデータを使用する
+            method = backgrounds.get(current_tag, XPSCAL.DEFAULT_BACKGROUND)
+            if (i, method) in baselines:
+                XPSPROF.count("baselines_shared")
+            else:
+                with XPSPROF.stage("background", region=current_tag, index=i):
+                    baselines[(i, method)] = XPSCACHE.cached_background_baseline(x[i], y[i], method=method,
+                                                                                 cache=cache)
+            y_bg = baselines[(i, method)][0]
+            y_pure = y[i] - y_bg
+
+            # マイナス値は0にクリップ（計算エラー防止）
+            y_pure[y_pure < 0] = 0
+
+            # --- フィッティング実行 ---
+            if verbose:
+                print(f"\n【 {current_tag} Fitting Results 】")
+            multistart_info = None
+            with XPSPROF.stage("fit", region=current_tag, index=i):
+                if multistart > 1:
+                    fitted_peaks, y_total_fit, info = XPSMULTI.multistart_fit(
+                        x[i], y_pure, target_peaks_config, n_starts=multistart, seed=multistart_seed,
+                        time_budget=multistart_time, workers=multistart_workers, verbose=verbose,
+                        engine=engine, pool=start_pool)
+                    multistart_info = {k: info[k] for k in ("chi2", "n_starts", "n_best", "timed_out")}
+                else:
+                    fitted_peaks, y_total_fit = XPSCACHE.cached_perform_fitting(
+                        x[i], y_pure, target_peaks_config, cache=cache, verbose=verbose, engine=engine)
+
+            if fitted_peaks and bootstrap > 0:
+                with XPSPROF.stage("bootstrap", region=current_tag, index=i):
+                    XPSBOOT.bootstrap_fit(x[i], y_pure, target_peaks_config, fitted_peaks, y_total_fit, y_bg=y_bg,
+                                          n=bootstrap, method=bootstrap_method, workers=bootstrap_workers,
+                                          engine=engine)
+                if verbose:
+                    XPSBOOT.print_ci_table(fitted_peaks)
+
+            if fitted_peaks:
+                fit_results_list[i] = {
+                    "peaks": fitted_peaks,
+                    "y_total": y_total_fit,
+                    "y_bg": y_bg
+                }
+                if multistart_info is not None:
+                    fit_results_list[i]["multistart"] = multistart_info
+    finally:
+        if start_pool is not None:
+            start_pool.close()
+
+    XPSPROF.count("cache_hits", cache.hits - hits)
+    XPSPROF.count("cache_misses", cache.misses - misses)
+    return fit_results_list
+
+
+def analyze_spectra(spectra, rsf_list, peak_db, x_min=280, x_max=290, standard=284.4, verbose=False,
+                    cache=None, fit_options=None, baselines=None):
+    """
+    読み込み済みのスペクトルを解析する関数 (帯電補正 → 原子組成比 → フィッティング)
+    spectra: XPSSET.SpectrumSet (x はその場で補正される)
+    baselines: 計算したベースラインを入れる辞書 (None なら新しく作る。図を描くときに使い回せる)
+    戻り値: (原子組成比のリスト, fit_regions の結果)
+    """
+    if baselines is None:
+        baselines = {}
+    # バックグラウンドの種類 (RSF.json / peakfit.json)。原子組成比とフィッティングで同じものを使う
+    backgrounds = XPSCAL.background_methods(rsf_list, peak_db)
+
+    # 帯電補正 (C1s基準。spectra の x をその場で補正する)
+    with XPSPROF.stage("shift"):
+        XPSCAL.shift_spectra(spectra, x_min=x_min, x_max=x_max, standard=standard)
+
+    # 原子組成比 (計算したベースラインは baselines に入り、フィッティングでそのまま使う)
+    if rsf_list:
+        with XPSPROF.stage("atomic_percent"):
+            pp = XPSCAL.atomic_percent_spectra(spectra, rsf_list, baselines=baselines, backgrounds=backgrounds)
+    else:
+        pp = [0.0] * spectra.n_regions
+
+    # ピークフィッティング
+    tags, x_list, y_list = spectra
+    fit_results_list = fit_regions(tags, x_list, y_list, peak_db, verbose=verbose, cache=cache,
+                                   backgrounds=backgrounds, baselines=baselines, **(fit_options or {}))
+    return pp, fit_results_list
+
+
+def summarize_results(tags, pp, fit_results_list):
+    """
+    原子組成比とフィッティング結果をスカラー値だけにまとめる関数 (プロセス間の受け渡し・JSON用)
+    戻り値: ({タグ: 原子組成比}, 成分ごとの行の辞書のリスト)
+    """
+    atomic = {}
+    fits = []
+    for i, tag in enumerate(tags):
+        atomic[tag] = float(pp[i])
+        res = fit_results_list[i]
+        if res is not None:
+            for peak in res['peaks']:
+                row = {
+                    'Spectrum': tag,
+                    'Component Name': peak['name'],
+                    'Area Ratio (%)': float(peak['ratio']),
+                    'Position (eV)': float(peak['center']),
+                    'FWHM (eV)': float(peak['fwhm']),
+                    'Area': float(peak['area'])
+                }
+                if 'ratio_ci' in peak:
+                    row.update({k: float(v) for k, v in XPSOUTPUTXL.ci_columns(peak).items()})
+                if 'multistart' in res:
+                    row.update(XPSOUTPUTXL.multistart_columns(res['multistart']))
+                fits.append(row)
+    return atomic, fits
+
+
+def analyze_file(path, rsf_list, peak_db, out_dir=None,
+                 x_min=280, x_max=290, standard=284.4, export=True, verbose=False, use_cache=True,
+                 export_format="xlsx", profile=False, cprofile_dir=None, incremental=False, fit_options=None,
+                 plot_format=None, plot_workers=None, binary_cache=False):
+    """
+    1ファイル分の解析 (読み込み → 帯電補正 → 原子組成比 → フィッティング → Excel出力) を行う関数
+    use_cache: False ならフィッティング結果のキャッシュを使わない
+    export_format: EXPORT_FORMATS のいずれか
+    profile: True なら工程ごとの時間・回数を計測し、summary["profile"] に入れる
+    cprofile_dir: 指定するとこのフォルダに cProfile の統計 (<ファイル名>.prof) も保存する
+    incremental: True なら前回の結果 (out_dir/<ファイル名>_state.pkl) を読み、入力が変わった領域だけ計算し直す
+    fit_options: fit_regions に渡す追加の設定 (bootstrap など)
+    plot_format: "png" / "svg" を指定すると、領域ごとの図を out_dir/<ファイル名>_plots/ に保存する
+    plot_workers: 図を描くワーカープロセス数 (None ならCPU数)
+    binary_cache: True なら読み込んだCSVの隣に .xpsb を作る (次回から高速に読める。既定では作らない)
+    戻り値: まとめ用の辞書 (配列は含まないのでプロセス間で軽く受け渡せる)
+    """
+    if profile or cprofile_dir:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        cprofile_path = None
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+            cprofile_path = os.path.join(cprofile_dir, stem + ".prof")
+        with XPSPROF.RunProfile(name=os.path.basename(path), cprofile_path=cprofile_path) as prof:
+            summary = analyze_file(path, rsf_list, peak_db, out_dir=out_dir, x_min=x_min, x_max=x_max,
+                                   standard=standard, export=export, verbose=verbose,
+                                   use_cache=use_cache, export_format=export_format, incremental=incremental,
+                                   fit_options=fit_options, plot_format=plot_format, plot_workers=plot_workers,
+                                   binary_cache=binary_cache)
+        summary["profile"] = prof.report()
+        return summary
+
+    summary = {
+        "file": path,
+        "status": "ok",
+        "output": None,
+        "error": None,
+        "atomic_percent": {},
+        "fits": [],
+        "incremental": None,
+        "plots": None
+    }
+
+    try:
+        with XPSPROF.stage("load"):
+            spectra = XPSASC.load_allspe(path=path, write_binary=binary_cache)
+        tags = spectra.tags
+        XPSPROF.count("regions", len(tags))
+        if not tags:
+            summary["status"] = "error"
+            summary["error"] = "no data"
+            return summary
+
+        # 各領域のバックグラウンド (原子組成比で計算したものをフィッティング・図でもそのまま使う)
+        baselines = {}
+        if incremental:
+            pp, fit_results_list, summary["incremental"] = _analyze_incremental(
+                path, spectra, rsf_list, peak_db, out_dir, x_min, x_max, standard, verbose, use_cache,
+                fit_options or {}, baselines)
+        else:
+            pp, fit_results_list = analyze_spectra(
+                spectra, rsf_list, peak_db, x_min=x_min, x_max=x_max, standard=standard, verbose=verbose,
+                cache=XPSCACHE.FitCache(enabled=use_cache), fit_options=fit_options, baselines=baselines)
+
+        # 帯電補正後の各領域のビュー (読み取り専用の .xpsb は補正で x がコピーされるので、ここで取り出す)
+        _, x_list, y_list = spectra
+
+        # Excel出力
+        if export:
+            if out_dir is None:
+                out_dir = os.path.dirname(path)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            export_args = dict(tags=tags, x_list=x_list, y_list=y_list, fit_results_list=fit_results_list,
+                               atomic_percent=pp)
+            with XPSPROF.stage("export"):
+                if export_format in ("csv", "parquet"):
+                    save_path = os.path.join(out_dir, stem + "_result")
+                    saved = XPSOUTPUTXL.export_to_folder(save_dir=save_path, fmt=export_format, **export_args)
+                elif export_format == "xlsx-stream":
+                    save_path = os.path.join(out_dir, stem + "_result.xlsx")
+                    saved = XPSOUTPUTXL.export_to_excel_streaming(save_path=save_path, **export_args)
+                else:
+                    save_path = os.path.join(out_dir, stem + "_result.xlsx")
+                    saved = XPSOUTPUTXL.export_to_excel(save_path=save_path, **export_args)
+            if saved:
+                summary["output"] = save_path
+            else:
+                # 出力に失敗したファイルは成功扱いにしない (原子組成比・フィット結果はまとめCSVに残す)
+                summary["status"] = "error"
+                summary["error"] = f"{export_format} 出力に失敗しました: {save_path}"
+
+        # 図の画像出力 (画面なし)
+        if plot_format:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            plot_dir = os.path.join(out_dir if out_dir is not None else os.path.dirname(path), stem + "_plots")
+            with XPSPROF.stage("plot"):
+                XPSPLOTUI.render_spectra(plot_dir, tags, x_list, y_list, fit_results_list=fit_results_list,
+                                         fmt=plot_format, workers=plot_workers,
+                                         backgrounds=XPSCAL.background_methods(rsf_list, peak_db),
+                                         baselines=baselines)
+            summary["plots"] = plot_dir
+
+        # まとめ (スカラー値のみ)
+        summary["atomic_percent"], summary["fits"] = summarize_results(tags, pp, fit_results_list)
+
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    return summary
+
+
+def _analyze_incremental(path, spectra, rsf_list, peak_db, out_dir,
+                         x_min, x_max, standard, verbose, use_cache, fit_options, baselines):
+    """
+    analyze_file の帯電補正 → 原子組成比 → フィッティングを、前回の結果を再利用しながら行う
+    spectra: 帯電補正前の XPSSET.SpectrumSet (その場で補正される)
+    baselines: 計算したベースラインを入れる辞書 (XPSCAL.region_areas を参照)
+    戻り値: (pp, fit_results_list, 再利用・再計算した領域数の辞書)
+    """
+    state_path = XPSINCR.state_path_for(path, out_dir)
+    state = XPSINCR.load_state(state_path)
+    tags = spectra.tags
+
+    # 帯電補正 (C1s基準)。依存関係は補正前のデータで記録する
+    with XPSPROF.stage("shift"):
+        shift_value = XPSCAL.find_shift_value_spectra(spectra, x_min=x_min, x_max=x_max, standard=standard)
+    _, x_raw, y_raw = spectra
+    deps = XPSINCR.region_deps(tags, x_raw, y_raw, shift_value, rsf_list, peak_db, fit_options)
+    if shift_value is not None:
+        spectra.shift_energy(shift_value)
+    _, x_list, y_list = spectra
+
+    # 原子組成比 (面積は変わった領域だけ計算。RSFでの割り算と規格化は毎回行う)
+    rsf_dict = {item["level"]: item["rsf"] for item in rsf_list}
+    backgrounds = XPSCAL.background_methods(rsf_list, peak_db)
+    area_targets = [i for i in range(len(tags)) if rsf_dict.get(tags[i], 0.0) > 0]
+    areas = {i: a for i, a in XPSINCR.reusable_areas(state, deps).items() if i in area_targets}
+    todo_areas = [i for i in area_targets if i not in areas]
+    if rsf_list:
+        with XPSPROF.stage("atomic_percent"):
+            if todo_areas:
+                areas.update(XPSCAL.region_areas(x_list, y_list, todo_areas, baselines=baselines,
+                                                 methods={i: backgrounds[tags[i]] for i in todo_areas}))
+            pp = XPSCAL.atomic_percent_from_areas(tags, areas, rsf_list)
+    else:
+        pp = [0.0] * len(tags)
+
+    # ピークフィッティング (設定か入力が変わった領域だけ)
+    fit_targets_list = fit_targets(tags, peak_db)
+    fits = {i: f for i, f in XPSINCR.reusable_fits(state, deps).items() if i in fit_targets_list}
+    todo_fits = [i for i in fit_targets_list if i not in fits]
+    cache = XPSCACHE.FitCache(enabled=use_cache)
+    fit_results_list = fit_regions(tags, x_list, y_list, peak_db, verbose=verbose, cache=cache, indices=todo_fits,
+                                   backgrounds=backgrounds, baselines=baselines, **fit_options)
+    for i in todo_fits:
+        fits[i] = fit_results_list[i]
+    for i, f in fits.items():
+        fit_results_list[i] = f
+
+    XPSINCR.save_state(state_path, deps, areas, fits)
+
+    stats = {
+        "areas_reused": len(area_targets) - len(todo_areas),
+        "areas_computed": len(todo_areas),
+        "fits_reused": len(fit_targets_list) - len(todo_fits),
+        "fits_computed": len(todo_fits)
+    }
+    for name, n in stats.items():
+        XPSPROF.count(name, n)
+    return pp, fit_results_list, stats
+
+
+def _analyze_worker(args):
+    """ProcessPoolExecutor用のラッパー (引数をタプルで受け取る)"""
+    path, kwargs = args
+    return analyze_file(path, **kwargs)
+
+
+def write_summary(results, out_dir):
+    """
+    全ファイルの結果をまとめたCSVを出力する関数
+    batch_atomic_percent.csv : 1ファイル1行の原子組成比
+    batch_fit_summary.csv    : 成分ごとのフィッティング結果
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 元素名の列 (登場順)
+    elements = []
+    for res in results:
+        for tag in res["atomic_percent"]:
+            if tag not in elements:
+                elements.append(tag)
+
+    atomic_path = os.path.join(out_dir, "batch_atomic_percent.csv")
+    with open(atomic_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['File', 'Status', 'Error'] + elements)
+        for res in results:
+            row = [os.path.basename(res["file"]), res["status"], res["error"] or ""]
+            row += [res["atomic_percent"].get(tag, "") for tag in elements]
+            writer.writerow(row)
+
+    fit_path = os.path.join(out_dir, "batch_fit_summary.csv")
+    fit_columns = ['Spectrum', 'Component Name', 'Area Ratio (%)', 'Position (eV)', 'FWHM (eV)', 'Area']
+    # 信頼区間など、結果によって増える列は後ろに追加する
+    for res in results:
+        for fit in res["fits"]:
+            fit_columns += [c for c in fit if c not in fit_columns]
+    with open(fit_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['File'] + fit_columns)
+        for res in results:
+            for fit in res["fits"]:
+                writer.writerow([os.path.basename(res["file"])] + [fit.get(c, "") for c in fit_columns])
+
+    return atomic_path, fit_path
+
+
+def run_batch(inputs, out_dir, workers=None, pattern="*.csv",
+              rsf_path=DEFAULT_RSF_PATH, peakfit_path=DEFAULT_PEAKFIT_PATH, profile_path=None, **kwargs):
+    """
+    複数ファイルをプロセスプールで並列に解析し、まとめCSVを出力する関数
+    inputs: ディレクトリ・globパターン (またはそのリスト)
+    workers: ワーカープロセス数 (None ならCPU数, 1 なら並列化しない)
+    profile_path: 指定すると各ファイルの計測結果をまとめてこのJSONに保存し、集計を表示する
+    kwargs: analyze_file にそのまま渡すオプション
+    """
+    files = collect_files(inputs, pattern=pattern)
+    if not files:
+        print("処理対象のファイルが見つかりませんでした。")
+        return []
+
+    rsf_list, peak_db = load_config(rsf_path, peakfit_path)
+    os.makedirs(out_dir, exist_ok=True)
+    kwargs = dict(kwargs, rsf_list=rsf_list, peak_db=peak_db, out_dir=out_dir)
+    if profile_path:
+        kwargs["profile"] = True
+
+    print(f"対象ファイル数: {len(files)}")
+    results = []
+
+    if workers == 1:
+        for path in files:
+            results.append(analyze_file(path, **kwargs))
+            print(f"  [{len(results)}/{len(files)}] {os.path.basename(path)} : {results[-1]['status']}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_analyze_worker, (path, kwargs)) for path in files]
+            for future in as_completed(futures):
+                results.append(future.result())
+                print(f"  [{len(results)}/{len(files)}] {os.path.basename(results[-1]['file'])} : {results[-1]['status']}")
+
+    # 出力順をファイル順にそろえる
+    order = {path: n for n, path in enumerate(files)}
+    results.sort(key=lambda r: order[r["file"]])
+
+    atomic_path, fit_path = write_summary(results, out_dir)
+    n_error = sum(1 for r in results if r["status"] != "ok")
+    print(f"完了: {len(results) - n_error} 件成功 / {n_error} 件失敗")
+    print(f"まとめ: {atomic_path}, {fit_path}")
+
+    # 計測結果 (ワーカーごとに計測したものを集める)
+    reports = [r["profile"] for r in results if r.get("profile")]
+    if reports:
+        XPSPROF.print_summary(reports)
+        if profile_path:
+            XPSPROF.save_report(reports, profile_path)
+            print(f"プロファイル: {profile_path}")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XPSスペクトル(CSV)の一括解析")
+    parser.add_argument('inputs', nargs='+', help="ディレクトリまたはglobパターン (例: 'data/*.csv')")
+    parser.add_argument('-o', '--out-dir', default='xps_results', help="結果の出力先フォルダ")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="ワーカープロセス数 (既定: CPU数)")
+    parser.add_argument('--pattern', default='*.csv', help="ディレクトリ指定時のファイルパターン")
+    parser.add_argument('--rsf', default=DEFAULT_RSF_PATH, help="RSF.json のパス")
+    parser.add_argument('--peakfit', default=DEFAULT_PEAKFIT_PATH, help="peakfit.json のパス")
+    parser.add_argument('--x-min', type=float, default=280, help="帯電補正のC1s探索範囲 (下限)")
+    parser.add_argument('--x-max', type=float, default=290, help="帯電補正のC1s探索範囲 (上限)")
+    parser.add_argument('--standard', type=float, default=284.4, help="C1sの基準位置 (eV)")
+    parser.add_argument('--no-export', action='store_true', help="ファイルごとのExcel出力を行わない")
+    parser.add_argument('--no-cache', action='store_true', help="フィッティング結果のキャッシュを使わない")
+    parser.add_argument('--binary-cache', action='store_true',
+                        help="読み込んだCSVの隣に .xpsb を作り、次回から高速に読む (既定では作らない)")
+    parser.add_argument('--format', default='xlsx', choices=EXPORT_FORMATS,
+                        help="ファイルごとの出力形式 (xlsx-stream: 省メモリExcel, csv/parquet: フォルダ出力)")
+    parser.add_argument('--profile', default=None, metavar='JSON',
+                        help="工程ごとの時間・Shirley反復回数・curve_fitのnfevなどを計測してJSONに保存する")
+    parser.add_argument('--incremental', action='store_true',
+                        help="前回の結果 (<出力先>/<ファイル名>_state.pkl) を使い、入力や設定が変わった領域だけ計算し直す")
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help="N回の再フィットで各成分の95%%信頼区間を求める (0なら行わない)")
+    parser.add_argument('--bootstrap-method', default='residual', choices=XPSBOOT.BOOTSTRAP_METHODS,
+                        help="再フィット用データの作り方 (residual: 残差の再抽出, poisson: ポアソンノイズ)")
+    parser.add_argument('--multistart', type=int, default=0, metavar='K',
+                        help="K個の初期値 (ラテン超方格法) からフィットし、カイ二乗最小の結果を使う")
+    parser.add_argument('--multistart-time', type=float, default=None, metavar='SEC',
+                        help="マルチスタートの1領域あたりの制限時間 (秒)")
+    parser.add_argument('--engine', default='curve_fit', choices=XPSFIT.FIT_ENGINES,
+                        help="フィッティングの方法 (varpro: 振幅を線形に解き、center/FWHM/mixだけを非線形最適化)")
+    parser.add_argument('--plots', default=None, choices=XPSPLOTUI.PLOT_FORMATS,
+                        help="領域ごとの図 (生データ・バックグラウンド・フィット・各成分) を画像で保存する")
+    parser.add_argument('--seed', type=int, default=0, help="マルチスタートの乱数シード")
+    parser.add_argument('--cprofile', default=None, metavar='DIR',
+                        help="ファイルごとの cProfile の統計 (.prof) をこのフォルダに保存する")
+    args = parser.parse_args(argv)
+
+    # ファイル単位で並列化している場合は、再フィット・マルチスタートは各ワーカーの中で順に行う (プロセスの増えすぎを防ぐ)
+    fit_options = {}
+    if args.engine != 'curve_fit':
+        fit_options.update(engine=args.engine)
+    if args.bootstrap > 0:
+        fit_options.update(bootstrap=args.bootstrap, bootstrap_method=args.bootstrap_method,
+                           bootstrap_workers=None if args.workers == 1 else 1)
+    if args.multistart > 1:
+        fit_options.update(multistart=args.multistart, multistart_seed=args.seed,
+                           multistart_time=args.multistart_time,
+                           multistart_workers=None if args.workers == 1 else 1)
+
+    results = run_batch(
+        args.inputs, args.out_dir, workers=args.workers, pattern=args.pattern,
+        rsf_path=args.rsf, peakfit_path=args.peakfit,
+        x_min=args.x_min, x_max=args.x_max, standard=args.standard,
+        export=not args.no_export, use_cache=not args.no_cache, export_format=args.format,
+        binary_cache=args.binary_cache,
+        profile_path=args.profile, cprofile_dir=args.cprofile, incremental=args.incremental,
+        fit_options=fit_options, plot_format=args.plots, plot_workers=None if args.workers == 1 else 1
+    )
+    return 0 if results and all(r["status"] == "ok" for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,417 @@
+#ベンチマーク用
+import io
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import sys
+import numpy as np
+
+import XPSFIT
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PEAKFIT_PATH = os.path.join(BASE_DIR, 'peakfit.json')
+DEFAULT_RSF_PATH = os.path.join(BASE_DIR, 'RSF.json')
+
+# 解析モジュールの import 時に読み込まれてはいけない重いライブラリ (描画・出力・ダイアログ・フィッティング時だけ読み込む)
+HEAVY_MODULES = ["matplotlib", "pandas", "openpyxl", "tkinter", "scipy.optimize"]
+# import 時間を測るモジュール
+IMPORT_MODULES = ["XPSBATCH", "XPSASC", "XPSCAL", "XPSFIT", "XPSOUTPUTXL", "XPSPLOTUI", "XPSSERIES", "XPSSERVE"]
+
+
+def load_peak_db(path=DEFAULT_PEAKFIT_PATH):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def synthetic_region(peak_infos, n_points=401, peak_height=20000.0, mix_ratio=0.3, seed=0,
+                     background=False, bg_low=1000.0, bg_step=0.3, center_jitter=0.0):
+    """
+    peakfit.json の成分から合成スペクトルを作る関数 (正解データとしても使う)
+    background: True なら Shirley型の段差バックグラウンド (低BE側 bg_low, 高BE側へ信号面積の bg_step 倍だけ上がる) を加える
+    center_jitter: 各成分の位置を center_error × この値 の範囲でランダムにずらす
+    戻り値: (x, y, truth) truth は各成分の真のパラメータ (amplitude, center, fwhm, mix_ratio, area, ratio)
+    """
+    rng = np.random.default_rng(seed)
+    centers = [p["center"] for p in peak_infos]
+    x = np.linspace(max(centers) + 8.0, min(centers) - 8.0, n_points)
+
+    truth = []
+    y = np.zeros(n_points)
+    for p in peak_infos:
+        amp = peak_height * rng.uniform(0.3, 1.0)
+        center = p["center"] + rng.uniform(-1, 1) * p["center_error"] * center_jitter
+        y_comp = XPSFIT.pseudo_voigt(x, amp, center, p["FWHM"], mix_ratio)
+        truth.append({"name": p["name"], "amplitude": amp, "center": center,
+                      "fwhm": p["FWHM"], "mix_ratio": mix_ratio,
+                      "area": float(np.abs(np.trapz(y_comp, x)))})
+        y += y_comp
+
+    total_area = sum(t["area"] for t in truth)
+    for t in truth:
+        t["ratio"] = t["area"] / total_area * 100 if total_area > 0 else 0.0
+
+    if background:
+        # xは高BE → 低BE の順なので、逆順の累積和が「それより低BE側の信号量」
+        cumsum = np.cumsum(y[::-1])[::-1]
+        step = bg_step * peak_height
+        y = y + bg_low + step * cumsum / cumsum[0]
+
+    y = rng.poisson(y).astype(float)
+    return x, y, truth
+
+
+def synthetic_measurement(peak_db, n_points=401, n_regions=None, seed=0, survey_points=1101):
+    """
+    1測定分の合成データ (0番目にサーベイ、以降に peakfit.json の各level) を作る関数
+    n_regions: サーベイを除いた領域数。level数より多い場合は同じlevelを繰り返す (深さ方向分析のように)
+    戻り値: (tags, x_list, y_list, truths) truths は領域ごとの正解 (サーベイは None)
+    """
+    levels = list(dict.fromkeys(p["level"] for p in peak_db))
+    if n_regions is None:
+        n_regions = len(levels)
+
+    rng = np.random.default_rng(seed)
+    tags, x_list, y_list, truths = [], [], [], []
+
+    # サーベイ (フィッティングしない広域スペクトル)
+    x_survey = np.linspace(1100.0, 0.0, survey_points)
+    y_survey = np.full(survey_points, 2000.0)
+    for p in peak_db:
+        y_survey += XPSFIT.pseudo_voigt(x_survey, 3000.0, p["center"], 2.0, 0.3)
+    tags.append("Su1s")
+    x_list.append(x_survey)
+    y_list.append(rng.poisson(y_survey).astype(float))
+    truths.append(None)
+
+    for k in range(n_regions):
+        level = levels[k % len(levels)]
+        peak_infos = [p for p in peak_db if p["level"] == level]
+        x, y, truth = synthetic_region(peak_infos, n_points=n_points, seed=seed + 1 + k,
+                                       background=True, center_jitter=0.5)
+        tags.append(level)
+        x_list.append(x)
+        y_list.append(y)
+        truths.append(truth)
+
+    return tags, x_list, y_list, truths
+
+
+def write_csv(path, tags, x_list, y_list):
+    """load_allspe で読める形式 (タグ行 + x,y 行) でCSVに書き出す"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for tag, x, y in zip(tags, x_list, y_list):
+            f.write(tag + "\n")
+            np.savetxt(f, np.column_stack([x, y]), delimiter=',', fmt='%.6f')
+
+
+def fit_accuracy(fitted_peaks, truth):
+    """フィッティング結果と正解の差 (成分名で対応付け)"""
+    by_name = {t["name"]: t for t in truth}
+    errors = []
+    for p in fitted_peaks:
+        t = by_name[p["name"]]
+        errors.append({
+            "name": p["name"],
+            "center_error": float(p["center"] - t["center"]),
+            "fwhm_error": float(p["fwhm"] - t["fwhm"]),
+            "ratio_error": float(p["ratio"] - t["ratio"])
+        })
+    return errors
+
+
+def _timeit(func, repeats):
+    """func を repeats 回実行し、(実行時間の中央値, 最後の戻り値) を返す"""
+    times = []
+    result = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), result
+
+
+def _environment():
+    info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "commit": None
+    }
+    try:
+        info["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def bench_imports(modules=IMPORT_MODULES, repeats=3):
+    """
+    新しいPythonプロセスで各モジュールを import する時間を測る関数
+    (ワーカープロセスの起動ごとにかかる時間。numpy の読み込みも含む)
+    戻り値: {モジュール名: {"import_s": 中央値, "heavy": 読み込まれた重いライブラリのリスト}}
+    """
+    code = ("import sys, time, json; t0 = time.perf_counter(); import {module}; "
+            "t = time.perf_counter() - t0; "
+            "print(json.dumps([t, [m for m in {heavy!r} if m in sys.modules]]))")
+    results = {}
+    for module in modules:
+        times = []
+        heavy = []
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, "-c", code.format(module=module, heavy=HEAVY_MODULES)],
+                                 cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout
+            t, heavy = json.loads(out)
+            times.append(t)
+        results[module] = {"import_s": float(np.median(times)), "heavy": heavy}
+    return results
+
+
+def print_imports(imports):
+    print(f"{'Module':<14} | {'import (ms)':>11} | heavy modules loaded")
+    for module, r in imports.items():
+        print(f"{module:<14} | {r['import_s'] * 1000:>11.1f} | {', '.join(r['heavy']) or '-'}")
+
+
+def run_benchmarks(n_points=401, n_regions=None, repeats=3, seed=0, peak_db=None, rsf_path=DEFAULT_RSF_PATH):
+    """
+    各工程 (load_allspe, shift, shirley_baseline, atomic_percent, perform_fitting, export_to_excel) の
+    実行時間を個別に測る関数。合成データの正解とのずれ (フィッティング精度) も記録する
+    戻り値: 結果の辞書 (save_results でJSONに保存できる)
+    """
+    import XPSASC
+    import XPSCAL
+    import XPSOUTPUTXL
+
+    if peak_db is None:
+        peak_db = load_peak_db()
+    with open(rsf_path, 'r') as f:
+        rsf_list = json.load(f)
+
+    tags, x_list, y_list, truths = synthetic_measurement(peak_db, n_points=n_points,
+                                                         n_regions=n_regions, seed=seed)
+    timings = {}
+    # 0. import (新しいプロセスで XPSBATCH を読み込む時間)
+    timings["import_XPSBATCH"] = bench_imports(["XPSBATCH"], repeats)["XPSBATCH"]["import_s"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "synthetic.csv")
+        write_csv(csv_path, tags, x_list, y_list)
+
+        # 1. 読み込み (バイナリキャッシュは使わない)
+        timings["load_allspe"], (tags_r, x_r, y_r) = _timeit(
+            lambda: XPSASC.load_allspe(csv_path, binary_cache=False), repeats)
+
+        # 2. 帯電補正 (SpectrumSet はその場で補正するので、別に読み込んだものを使う / リストは全領域をコピー)
+        spectra = XPSASC.load_allspe(csv_path, binary_cache=False)
+        timings["shift"], _ = _timeit(
+            lambda: XPSCAL.shift_spectra(spectra, x_min=280, x_max=290), repeats)
+        timings["shift_lists"], _ = _timeit(
+            lambda: XPSCAL.shift(tags_r, x_r, y_r, 280, 290), repeats)
+
+        # 3. Shirleyバックグラウンド (1領域ずつ / まとめて)
+        timings["shirley_baseline"], baselines = _timeit(
+            lambda: [XPSCAL.shirley_baseline(x_r[i], y_r[i]) for i in range(len(tags_r))], repeats)
+        timings["shirley_baseline_batch"], _ = _timeit(
+            lambda: XPSCAL.shirley_baseline_batch(x_r, y_r), repeats)
+        timings["tougaard_baseline"], _ = _timeit(
+            lambda: [XPSCAL.tougaard_baseline(x_r[i], y_r[i]) for i in range(len(tags_r))], repeats)
+
+        # 4. 原子組成比
+        timings["atomic_percent"], pp = _timeit(
+            lambda: XPSCAL.atomic_percent(x_r, y_r, tags_r, rsf_list), repeats)
+
+        # 5. フィッティング (正解と比べるため、帯電補正前のデータを使う)
+        fit_inputs = []
+        for i in range(1, len(tags_r)):
+            peak_infos = [p for p in peak_db if p["level"] == tags_r[i]]
+            y_pure = y_r[i] - baselines[i][0]
+            y_pure[y_pure < 0] = 0
+            fit_inputs.append((i, peak_infos, y_pure))
+
+        def fit_all(engine="curve_fit"):
+            return [XPSFIT.perform_fitting(x_r[i], y_pure, peak_infos, verbose=False, full_output=True,
+                                           engine=engine)
+                    for i, peak_infos, y_pure in fit_inputs]
+        timings["perform_fitting"], fits = _timeit(fit_all, repeats)
+        # 振幅を線形に解く方法 (比較用。精度は curve_fit の結果で評価する)
+        timings["perform_fitting_varpro"], fits_varpro = _timeit(lambda: fit_all("varpro"), repeats)
+
+        fit_results_list = [None] * len(tags_r)
+        accuracy = []
+        nfev = 0
+        for (i, _, _), (peaks, y_total, info) in zip(fit_inputs, fits):
+            nfev += info["nfev"]
+            if peaks is None:
+                continue
+            fit_results_list[i] = {"peaks": peaks, "y_total": y_total, "y_bg": baselines[i][0]}
+            for err in fit_accuracy(peaks, truths[i]):
+                accuracy.append(dict(err, region=i, level=tags_r[i]))
+
+        # 6. Excel出力
+        xlsx_path = os.path.join(tmp, "synthetic.xlsx")
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings["export_to_excel"], _ = _timeit(
+                lambda: XPSOUTPUTXL.export_to_excel(xlsx_path, tags_r, x_r, y_r, fit_results_list, pp), repeats)
+
+    abs_center = [abs(a["center_error"]) for a in accuracy]
+    abs_ratio = [abs(a["ratio_error"]) for a in accuracy]
+    results = {
+        "environment": _environment(),
+        "parameters": {"n_points": n_points, "n_regions": len(tags) - 1, "repeats": repeats, "seed": seed},
+        "timings_s": timings,
+        "fit": {
+            "nfev_total": int(nfev),
+            "failed_regions": int(sum(1 for f in fits if f[0] is None)),
+            "nfev_total_varpro": int(sum(f[2]["nfev"] for f in fits_varpro)),
+            "failed_regions_varpro": int(sum(1 for f in fits_varpro if f[0] is None)),
+            "mean_abs_center_error_eV": float(np.mean(abs_center)) if abs_center else None,
+            "mean_abs_ratio_error_pct": float(np.mean(abs_ratio)) if abs_ratio else None,
+            "components": accuracy
+        }
+    }
+    return results
+
+
+def _format_optional(value, spec, unit=""):
+    """None (すべてのフィットが失敗したときなど) は n/a と表示する"""
+    return "n/a" if value is None else f"{value:{spec}}{unit}"
+
+
+def print_results(results):
+    p = results["parameters"]
+    print(f"--- Benchmark: {p['n_regions']} regions x {p['n_points']} points (median of {p['repeats']}) ---")
+    for stage, t in results["timings_s"].items():
+        print(f"{stage:<24} | {t * 1000:>10.2f} ms")
+    fit = results["fit"]
+    print(f"fit: nfev={fit['nfev_total']} failed={fit['failed_regions']} "
+          f"|Δcenter|={_format_optional(fit['mean_abs_center_error_eV'], '.4f', ' eV')} "
+          f"|Δratio|={_format_optional(fit['mean_abs_ratio_error_pct'], '.2f', ' %')}")
+    if "nfev_total_varpro" in fit:
+        print(f"fit (varpro): nfev={fit['nfev_total_varpro']} failed={fit['failed_regions_varpro']}")
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def compare_results(base, new, threshold=1.10):
+    """
+    2つの結果 (save_results で保存したJSONの辞書) の工程ごとの実行時間を比べる関数
+    threshold 倍以上遅くなった工程を返す
+    """
+    regressions = []
+    print(f"{'Stage':<24} | {'base (ms)':>10} | {'new (ms)':>10} | {'ratio':>6}")
+    for stage, t_new in new["timings_s"].items():
+        t_base = base["timings_s"].get(stage)
+        if t_base is None:
+            continue
+        ratio = t_new / t_base if t_base > 0 else float('inf')
+        mark = "  <-- slower" if ratio >= threshold else ""
+        print(f"{stage:<24} | {t_base * 1000:>10.2f} | {t_new * 1000:>10.2f} | {ratio:>6.2f}{mark}")
+        if ratio >= threshold:
+            regressions.append(stage)
+    return regressions
+
+
+class _CallCounter:
+    """XPSFIT.multi_peak_model の呼び出し回数を数えるためのラッパー"""
+
+    def __init__(self, func):
+        self.func = func
+        self.calls = 0
+
+    def __call__(self, x, *params):
+        self.calls += 1
+        return self.func(x, *params)
+
+
+def bench_jacobian(level="Cu2p3", peak_db=None, n_points=401, repeats=5, seed=0):
+    """
+    perform_fitting の解析的ヤコビアン (use_jac=True) と差分近似 (use_jac=False) を比較する関数
+    モデル関数の実際の評価回数 (差分近似の分も含む) と実行時間を測る
+    """
+    if peak_db is None:
+        peak_db = load_peak_db()
+    peak_infos = [p for p in peak_db if p["level"] == level]
+
+    results = {}
+    original = XPSFIT.multi_peak_model
+    try:
+        for use_jac in (False, True):
+            label = "analytic" if use_jac else "finite_difference"
+            calls, times = [], []
+            for r in range(repeats):
+                x, y, _ = synthetic_region(peak_infos, n_points=n_points, seed=seed + r)
+                counter = _CallCounter(original)
+                XPSFIT.multi_peak_model = counter
+                t0 = time.perf_counter()
+                XPSFIT.perform_fitting(x, y, peak_infos, verbose=False, use_jac=use_jac)
+                times.append(time.perf_counter() - t0)
+                calls.append(counter.calls)
+            results[label] = {
+                "model_evaluations": float(np.mean(calls)),
+                "wall_time_s": float(np.median(times))
+            }
+    finally:
+        XPSFIT.multi_peak_model = original
+
+    fd, an = results["finite_difference"], results["analytic"]
+    print(f"--- Jacobian benchmark: {level} ({len(peak_infos)} peaks, {4 * len(peak_infos)} params, {n_points} points) ---")
+    print(f"{'Method':<18} | {'Model evals':>11} | {'Time (ms)':>9}")
+    for label, res in results.items():
+        print(f"{label:<18} | {res['model_evaluations']:>11.1f} | {res['wall_time_s'] * 1000:>9.2f}")
+    print(f"Speed-up: {fd['wall_time_s'] / an['wall_time_s']:.2f}x, "
+          f"evaluations: {fd['model_evaluations'] / max(an['model_evaluations'], 1):.1f}x fewer")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XPS-analyzer ベンチマーク")
+    parser.add_argument('--points', type=int, default=401, help="合成スペクトルの点数")
+    parser.add_argument('--regions', type=int, default=None, help="領域数 (既定: peakfit.json のlevel数)")
+    parser.add_argument('--repeats', type=int, default=3, help="繰り返し回数")
+    parser.add_argument('--seed', type=int, default=0, help="乱数シード")
+    parser.add_argument('-o', '--output', default=None, help="結果を保存するJSONファイル")
+    parser.add_argument('--compare', default=None, help="比較する過去の結果 (JSON)")
+    parser.add_argument('--jacobian', action='store_true', help="解析的ヤコビアンと差分近似の比較のみ行う")
+    parser.add_argument('--level', default="Cu2p3", help="ヤコビアン比較に使うpeakfit.jsonのlevel")
+    parser.add_argument('--imports', action='store_true',
+                        help="各モジュールの import 時間のみ測る (重いライブラリが読み込まれたら終了コード1)")
+    args = parser.parse_args(argv)
+
+    if args.jacobian:
+        bench_jacobian(level=args.level, n_points=args.points, repeats=args.repeats)
+        return 0
+
+    if args.imports:
+        imports = bench_imports(repeats=args.repeats)
+        print_imports(imports)
+        # XPSPLOTUI も matplotlib を描画時まで読み込まないので、すべてのモジュールで空のはず
+        return 1 if any(r["heavy"] for r in imports.values()) else 0
+
+    results = run_benchmarks(n_points=args.points, n_regions=args.regions,
+                             repeats=args.repeats, seed=args.seed)
+    print_results(results)
+    if args.output:
+        save_results(results, args.output)
+        print(f"保存: {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        regressions = compare_results(base, results)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+#スペクトルのバイナリ保存形式 (.xpsb)
+#
+# ファイル構成:
+#   [8 byte]  マジック b"XPSBIN01"
+#   [8 byte]  ヘッダー長 (little endian uint64)
+#   [可変]    JSONヘッダー (8バイト境界まで空白で埋める)
+#   [可変]    データ部 (float64, little endian)。全領域の x を連結した N 点, 続いて全領域の y を連結した N 点
+#
+# JSONヘッダー:
+#   {"version": 2,
+#    "n_points": 全領域の点数の合計 N,
+#    "regions": [{"tag": "C1s", "offset": x (y) の連結配列の中での開始位置 (点), "length": 点数}, ...],
+#    "metadata": {...},   # binary_scan が集めたヘッダー情報など
+#    "source": {"name": 元ファイル名, "size": バイト数, "mtime_ns": 更新時刻}}
+#
+# 各領域の位置が分かっているので、メモリマップで必要な領域だけを読める
+# x, y がそれぞれ1つの連続したブロックなので、XPSSET.SpectrumSet はメモリマップをコピーせずにそのまま使える
+# (version 1 のファイルは領域ごとに x[n], y[n] を並べた形式で、offset はデータ部先頭からのバイト位置。読むことはできる)
+import os
+import json
+import struct
+import numpy as np
+
+import XPSSET
+
+MAGIC = b"XPSBIN01"
+VERSION = 2
+EXTENSION = ".xpsb"
+_DTYPE = np.dtype('<f8')
+
+
+def binary_path_for(source_path):
+    """元ファイル (CSVなど) の隣に置くバイナリファイルのパス"""
+    return os.path.splitext(source_path)[0] + EXTENSION
+
+
+def _source_info(source_path):
+    st = os.stat(source_path)
+    return {"name": os.path.basename(source_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def save_binary(path, tags, x_list, y_list, metadata=None, source_path=None):
+    """
+    全領域を1つのバイナリファイルに保存する関数
+    source_path: 元ファイル。指定するとその大きさと更新時刻を記録し、古くなったかの判定に使う
+    """
+
+    regions = []
+    offset = 0
+    for tag, x in zip(tags, x_list):
+        n = len(x)
+        regions.append({"tag": tag, "offset": offset, "length": n})
+        offset += n
+
+    header = {
+        "version": VERSION,
+        "n_points": offset,
+        "regions": regions,
+        "metadata": metadata or {},
+        "source": _source_info(source_path) if source_path else None
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    # 並行して読まれても壊れたファイルが見えないよう、一時ファイル経由で置き換える
+    tmp_path = path + f".{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            for x in x_list:
+                f.write(np.ascontiguousarray(x, dtype=_DTYPE).tobytes())
+            for y in y_list:
+                f.write(np.ascontiguousarray(y, dtype=_DTYPE).tobytes())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def read_index(path):
+    """
+    ヘッダー (領域の索引とメタデータ) だけを読む関数
+    戻り値: ヘッダーの辞書 (data_start にデータ部の開始位置を追加)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} は .xpsb 形式ではありません。")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    header["data_start"] = len(MAGIC) + 8 + header_len
+    return header
+
+
+def load_region(path, tag, index=None):
+    """
+    1つの領域だけをメモリマップで読む関数 (他の領域のデータには触れない)
+    戻り値: (x, y) 読み取り専用のビュー。見つからなければ None
+    """
+    if index is None:
+        index = read_index(path)
+    for region in index["regions"]:
+        if region["tag"] == tag:
+            n = region["length"]
+            if n == 0:
+                return np.zeros(0), np.zeros(0)
+            if index.get("version", 1) == 1:
+                data = np.memmap(path, dtype=_DTYPE, mode='r', shape=(2, n),
+                                 offset=index["data_start"] + region["offset"])
+                return np.asarray(data[0]), np.asarray(data[1])
+            x_start = index["data_start"] + region["offset"] * _DTYPE.itemsize
+            y_start = x_start + index["n_points"] * _DTYPE.itemsize
+            x = np.memmap(path, dtype=_DTYPE, mode='r', shape=(n,), offset=x_start)
+            y = np.memmap(path, dtype=_DTYPE, mode='r', shape=(n,), offset=y_start)
+            return np.asarray(x), np.asarray(y)
+    return None
+
+
+def load_binary(path):
+    """
+    全領域を読む関数 (XPSASC.load_allspe と同じ XPSSET.SpectrumSet を返す)
+    データ部全体を1回だけメモリマップする
+    version 2: SpectrumSet の x, y はメモリマップそのもの (コピーしない、読み取り専用)
+               帯電補正 (shift_energy) で書き換えるときに初めて x を1回コピーする
+    version 1: 領域ごとに x, y が交互に並んでいるので、連結配列にするために全体を1回コピーする
+    """
+    index = read_index(path)
+    metadata = index.get("metadata")
+    if index.get("version", 1) >= 2:
+        n = index["n_points"]
+        tags = [r["tag"] for r in index["regions"]]
+        offsets = [r["offset"] for r in index["regions"]]
+        lengths = [r["length"] for r in index["regions"]]
+        if n == 0:
+            return XPSSET.SpectrumSet(tags, np.zeros(0), np.zeros(0), offsets, lengths, metadata=metadata)
+        data = np.asarray(np.memmap(path, dtype=_DTYPE, mode='r', shape=(2, n), offset=index["data_start"]))
+        return XPSSET.SpectrumSet(tags, data[0], data[1], offsets, lengths, metadata=metadata)
+
+    total = sum(2 * r["length"] for r in index["regions"])
+    if total == 0:
+        data = np.zeros(0)
+    else:
+        data = np.asarray(np.memmap(path, dtype=_DTYPE, mode='r', shape=(total,),
+                                    offset=index["data_start"]))
+
+    tags, x_list, y_list = [], [], []
+    for region in index["regions"]:
+        start = region["offset"] // _DTYPE.itemsize
+        n = region["length"]
+        tags.append(region["tag"])
+        x_list.append(data[start : start + n])
+        y_list.append(data[start + n : start + 2 * n])
+    return XPSSET.SpectrumSet.from_lists(tags, x_list, y_list, metadata=metadata)
+
+
+def save_spectra(path, spectra, source_path=None):
+    """XPSSET.SpectrumSet を保存する関数 (metadata も保存する)"""
+    tags, x_list, y_list = spectra
+    return save_binary(path, tags, x_list, y_list, metadata=spectra.metadata, source_path=source_path)
+
+
+def is_fresh(bin_path, source_path):
+    """バイナリファイルが存在し、記録された元ファイルの大きさ・更新時刻が現在と一致するか"""
+    if not os.path.exists(bin_path):
+        return False
+    try:
+        index = read_index(bin_path)
+        return index.get("source") == _source_info(source_path)
+    except (OSError, ValueError):
+        return False
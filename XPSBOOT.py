@@ -0,0 +1,104 @@
+#フィッティング結果の不確かさ (ブートストラップ / モンテカルロ)
+#
+# 収束したフィット結果 (モデル曲線) にノイズを付け直したデータを N 回作り、それぞれを
+# 収束値から開始してフィッティングし直す。各成分の center, fwhm, area, ratio のばらつきから信頼区間を求める
+#   residual: 残差をランダムに並べ替えて (復元抽出して) 足す
+#   poisson : バックグラウンドを含めた強度をポアソン分布で振り直す (計数データ向け)
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import XPSFIT
+
+BOOTSTRAP_METHODS = ["residual", "poisson"]
+# 1回の再フィットの評価回数の上限 (収束値から始めるので少なくてよい)
+BOOT_MAXFEV = 500
+# 1つのワーカーにまとめて渡す再フィットの回数
+CHUNK_SIZE = 25
+
+QUANTITIES = ["center", "fwhm", "area", "ratio"]
+
+
+def _refit_chunk(args):
+    """
+    replicates 回分の再フィットを行う (ProcessPoolExecutor 用にトップレベルに置く)
+    戻り値: shape (回数, 成分数, 4) の配列 (失敗した回は NaN)
+    """
+    x, y_model, residuals, y_bg, peak_infos, popt, method, seeds, maxfev, engine = args
+    out = np.full((len(seeds), len(peak_infos), len(QUANTITIES)), np.nan)
+
+    for k, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        if method == "poisson":
+            y_new = rng.poisson(np.clip(y_model + y_bg, 0, None)).astype(float) - y_bg
+        else:
+            y_new = y_model + rng.choice(residuals, size=len(residuals), replace=True)
+        # 通常の解析と同じく、バックグラウンドより下は0にする
+        y_new[y_new < 0] = 0
+
+        peaks, _, info = XPSFIT.perform_fitting(x, y_new, peak_infos, verbose=False,
+                                                full_output=True, p0=popt, maxfev=maxfev, engine=engine)
+        if info["success"]:
+            out[k] = [[p[q] for q in QUANTITIES] for p in peaks]
+    return out
+
+
+def bootstrap_fit(x, y, peak_infos, fitted_peaks, y_total, y_bg=None, n=200, method="residual",
+                  ci=95.0, workers=None, seed=0, maxfev=BOOT_MAXFEV, engine="curve_fit"):
+    """
+    fitted_peaks の各成分に信頼区間を追加する関数 (fitted_peaks の辞書をそのまま書き換える)
+    x, y: フィッティングに使ったデータ (バックグラウンドを引いた後)
+    y_total: フィッティングの合計波形, y_bg: バックグラウンド (method="poisson" で使う)
+    n: 再フィットの回数, ci: 信頼区間 (%)
+    workers: ワーカープロセス数 (None ならCPU数, 1 なら並列化しない)
+    seed: 乱数シード (同じシードなら並列数によらず同じ結果)
+    engine: 再フィットの方法 (XPSFIT.perform_fitting を参照)
+    追加されるキー: center_ci, fwhm_ci, area_ci, ratio_ci (下限, 上限), center_std など, n_boot (成功した回数)
+    戻り値: fitted_peaks
+    """
+    if method not in BOOTSTRAP_METHODS:
+        raise ValueError(f"未対応の方法です: {method}")
+
+    x = np.asarray(x, dtype=float)
+    y_model = np.asarray(y_total, dtype=float)
+    residuals = np.asarray(y, dtype=float) - y_model
+    y_bg = np.zeros_like(x) if y_bg is None else np.asarray(y_bg, dtype=float)
+    popt = [p[k] for p in fitted_peaks for k in ("amplitude", "center", "fwhm", "mix_ratio")]
+
+    # 再フィットごとのシード (回数の順に固定するので、並列数で結果が変わらない)
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    chunks = [seeds[i : i + CHUNK_SIZE] for i in range(0, n, CHUNK_SIZE)]
+    jobs = [(x, y_model, residuals, y_bg, peak_infos, popt, method, chunk, maxfev, engine) for chunk in chunks]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        results = [_refit_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_refit_chunk, jobs))
+
+    samples = np.concatenate(results, axis=0)
+    ok = np.all(np.isfinite(samples), axis=(1, 2))
+    samples = samples[ok]
+
+    lo_q, hi_q = (100 - ci) / 2, 100 - (100 - ci) / 2
+    for j, p in enumerate(fitted_peaks):
+        p["n_boot"] = int(len(samples))
+        for k, q in enumerate(QUANTITIES):
+            if len(samples) >= 2:
+                values = samples[:, j, k]
+                p[f"{q}_ci"] = (float(np.percentile(values, lo_q)), float(np.percentile(values, hi_q)))
+                p[f"{q}_std"] = float(np.std(values, ddof=1))
+            else:
+                p[f"{q}_ci"] = (np.nan, np.nan)
+                p[f"{q}_std"] = np.nan
+    return fitted_peaks
+
+
+def print_ci_table(fitted_peaks, ci=95.0):
+    print(f"--- {ci:g}% 信頼区間 (n = {fitted_peaks[0].get('n_boot', 0)}) ---")
+    print(f"{'Name':<10} | {'Position (eV)':<17} | {'FWHM':<13} | {'Ratio (%)':<13}")
+    for p in fitted_peaks:
+        c, w, r = p["center_ci"], p["fwhm_ci"], p["ratio_ci"]
+        print(f"{p['name']:<10} | {c[0]:>7.2f} - {c[1]:<7.2f} | {w[0]:>5.2f} - {w[1]:<5.2f} | {r[0]:>5.1f} - {r[1]:<5.1f}")
@@ -0,0 +1,213 @@
+#フィッティング結果のキャッシュ (ディスク保存)
+import os
+import json
+import pickle
+import time
+import hashlib
+import numpy as np
+
+import XPSCAL
+import XPSFIT
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# キャッシュの保存先 (環境変数 XPS_CACHE_DIR で変更可)
+DEFAULT_CACHE_DIR = os.environ.get(
+    "XPS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "xps_analyzer"))
+# キャッシュ全体の上限サイズ (超えたら古いものから削除)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 保存のたびにフォルダ全体を調べないよう、合計サイズは見積もりで追い、
+# 見積もりが上限を超えたとき・この回数の保存ごと (他のプロセスの保存分を反映するため) にだけ調べ直す
+EVICT_CHECK_EVERY = 256
+# 上限を超えたら、この割合まで減らす (上限ぎりぎりで保存のたびに削除・調査が起きないように)
+EVICT_TARGET_RATIO = 0.9
+# これより古い一時ファイル (書き込み中に落ちたプロセスの残り) は掃除の際に削除する (秒)
+STALE_TMP_SECONDS = 3600
+# 環境変数 XPS_NO_CACHE=1 でキャッシュを無効化
+CACHE_DISABLED_BY_ENV = os.environ.get("XPS_NO_CACHE", "") not in ("", "0")
+
+_code_version = None
+
+
+def code_version():
+    """
+    計算に関わるソース (XPSCAL.py, XPSFIT.py, XPSCACHE.py) のハッシュ
+    コードが変われば古いキャッシュは使われなくなる
+    """
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha256()
+        for name in ("XPSCAL.py", "XPSFIT.py", "XPSCACHE.py"):
+            with open(os.path.join(BASE_DIR, name), 'rb') as f:
+                h.update(f.read())
+        _code_version = h.hexdigest()[:16]
+    return _code_version
+
+
+def _json_default(obj):
+    # numpy配列・スカラーは値そのものでハッシュする (str() だと桁が丸められる)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+class FitCache:
+    """
+    計算結果をpickleで保存するディスクキャッシュ
+    キーは入力配列・設定・コードバージョンのハッシュ
+    ファイルの更新時刻を「最終利用時刻」として使い、上限を超えたら古い順に削除する (LRU)
+    合計サイズは最初の保存時に1回調べ、その後は保存したファイルの分を足した見積もりで判断する
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled and not CACHE_DISABLED_BY_ENV
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # 合計サイズの見積もり (None なら未調査)
+        self._puts = 0     # 前回調べてからの保存回数
+
+    def key(self, kind, arrays, config=None):
+        """kind: 計算の種類, arrays: 入力配列のリスト, config: JSON化できる設定"""
+        h = hashlib.sha256()
+        h.update(kind.encode())
+        h.update(code_version().encode())
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr, dtype=float)
+            h.update(str(arr.shape).encode())
+            h.update(arr.tobytes())
+        h.update(json.dumps(config, sort_keys=True, default=_json_default).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        """キャッシュがあれば値を返す (無ければ None)"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # 最終利用時刻を更新 (LRU用)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """値を保存し、上限を超えていれば古いものから削除する"""
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 並列実行時に壊れたファイルを読まないよう、一時ファイル経由で置き換える
+            tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"警告: キャッシュを保存できませんでした: {e}")
+            return
+
+        self._puts += 1
+        if self._size is None or self._puts >= EVICT_CHECK_EVERY:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        フォルダを調べ、合計サイズが max_bytes を超えていれば、その EVICT_TARGET_RATIO 倍以下になるまで
+        最終利用時刻の古い順に削除する
+        古い一時ファイル (*.tmp) も削除する。調べた後の合計サイズを見積もりの起点にする
+        """
+        self._puts = 0
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            self._size = 0
+            return
+        stats = []
+        stale_before = time.time() - STALE_TMP_SECONDS
+        for e in entries:
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            if e.name.endswith(".pkl"):
+                stats.append((st.st_mtime, st.st_size, e.path))
+            elif e.name.endswith(".tmp") and st.st_mtime < stale_before:
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+
+        total = sum(size for _, size, _ in stats)
+        target = self.max_bytes * EVICT_TARGET_RATIO if total > self.max_bytes else self.max_bytes
+        for _, size, path in sorted(stats):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """キャッシュをすべて削除する"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for e in os.scandir(self.cache_dir):
+            if e.name.endswith(".pkl"):
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+
+
+def cached_shirley_baseline(x, y, cache=None, **kwargs):
+    """XPSCAL.shirley_baseline のキャッシュ付き版 (戻り値は同じ)"""
+    return cached_background_baseline(x, y, method="shirley", cache=cache, **kwargs)
+
+
+def cached_background_baseline(x, y, method=XPSCAL.DEFAULT_BACKGROUND, cache=None, **kwargs):
+    """XPSCAL.background_baseline のキャッシュ付き版 (戻り値は同じ)"""
+    if cache is None or not cache.enabled:
+        return XPSCAL.background_baseline(x, y, method=method, **kwargs)
+
+    key = cache.key(f"{method}_baseline", [x, y], kwargs)
+    result = cache.get(key)
+    if result is None:
+        result = XPSCAL.background_baseline(x, y, method=method, **kwargs)
+        cache.put(key, result)
+    return result
+
+
+def cached_perform_fitting(x, y, peak_infos, cache=None, verbose=True, **kwargs):
+    """
+    XPSFIT.perform_fitting のキャッシュ付き版 (戻り値は同じ)
+    キーには x, y とそのlevelのピーク設定を使う。失敗した結果もキャッシュする
+    """
+    if cache is None or not cache.enabled:
+        return XPSFIT.perform_fitting(x, y, peak_infos, verbose=verbose, **kwargs)
+
+    key = cache.key("perform_fitting", [x, y], {"peaks": peak_infos, "options": kwargs})
+    result = cache.get(key)
+    if result is None:
+        result = XPSFIT.perform_fitting(x, y, peak_infos, verbose=verbose, **kwargs)
+        cache.put(key, result)
+    elif verbose:
+        if result[0] is None:
+            print("Fitting failed to converge. (cached)")
+        else:
+            print("(キャッシュから読み込み)")
+            XPSFIT.print_fit_table(result[0])
+    return result
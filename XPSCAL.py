@@ -1,6 +1,8 @@
 #計算用
 import numpy as np
 
+import XPSPROF
+
 def find_stable_min(x, y):
     """
     データ列の中から安定した最小点を探す関数
@@ -39,22 +41,52 @@ def find_stable_min(x, y):
 #帯電補正用
 def shift(tags, x_before, y_before, x_min, x_max, standard=284.4):
     """
-    C1sのピーク位置を特定範囲(x_min ~ x_max)で探し、補正値(shift_value)を返す関数
+    C1sのピーク位置を特定範囲(x_min ~ x_max)で探し、全領域のxを補正して返す関数
+    C1sが見つからない場合は入力をそのまま返す
+    戻り値: 補正後の (x, y) のリスト (XPSSET.SpectrumSet は shift_spectra でその場で補正する)
+    """
+    shift_value = find_shift_value(tags, x_before, y_before, x_min, x_max, standard)
+    if shift_value is None:
+        return x_before, y_before
+    return apply_shift(x_before, y_before, shift_value)
+
+def shift_spectra(spectra, x_min=280, x_max=290, standard=284.4):
+    """
+    XPSSET.SpectrumSet 用の帯電補正 (shift と同じ補正を、コピーせずその場で行う)
+    戻り値: 補正値。C1sが見つからない場合は None (spectra はそのまま)
     """
-    tag_marker = -1
-    shift_value = 0.0
+    shift_value = find_shift_value_spectra(spectra, x_min, x_max, standard)
+    if shift_value is not None:
+        spectra.shift_energy(shift_value)
+    return shift_value
 
+def find_shift_value(tags, x_before, y_before, x_min, x_max, standard=284.4):
+    """
+    C1sのピーク位置を特定範囲(x_min ~ x_max)で探し、補正値(shift_value)を返す関数
+    C1sが見つからない場合は None
+    """
     # 1. C1sタグを探す
     if "C1s" in tags:
         tag_marker = tags.index("C1s") # リストからインデックスを一発で検索
     else:
         print("Error: C1s tag not found.")
-        return 0.0
+        return None
 
     # 対象のデータを取得
     x_c1s = np.array(x_before[tag_marker])
     y_c1s = np.array(y_before[tag_marker])
-    
+    return _c1s_shift_value(x_c1s, y_c1s, x_min, x_max, standard)
+
+def find_shift_value_spectra(spectra, x_min=280, x_max=290, standard=284.4):
+    """XPSSET.SpectrumSet 用の find_shift_value (C1s の領域だけをビューで取り出す)"""
+    if "C1s" not in spectra:
+        print("Error: C1s tag not found.")
+        return None
+    x_c1s, y_c1s = spectra["C1s"]
+    return _c1s_shift_value(x_c1s, y_c1s, x_min, x_max, standard)
+
+def _c1s_shift_value(x_c1s, y_c1s, x_min, x_max, standard):
+    """C1sの領域の (x, y) から補正値を求める (範囲内にデータが無ければ None)"""
     # 2. 指定範囲内のデータだけを抜き出す (Boolean Masking)
     # x_min以上 かつ x_max以下 の場所が True になるマスクを作成
     mask = (x_c1s >= x_min) & (x_c1s <= x_max)
@@ -62,7 +94,7 @@ def shift(tags, x_before, y_before, x_min, x_max, standard=284.4):
     # 範囲内のデータが存在するか確認
     if not np.any(mask):
         print(f"Error: 指定範囲 ({x_min}-{x_max} eV) にデータがありません。")
-        return 0.0
+        return None
 
     # マスクを使って範囲内のデータのみ抽出
     x_focused = x_c1s[mask]
@@ -74,6 +106,10 @@ def shift(tags, x_before, y_before, x_min, x_max, standard=284.4):
     
     # 4. 補正値を計算 (基準値 - 実測値)
     shift_value = standard - peak_position    
+    return float(shift_value)
+
+def apply_shift(x_before, y_before, shift_value):
+    """全領域のxに補正値を足す"""
     x_after = []
     y_after = [] # Yはそのままコピー
 
@@ -124,6 +160,43 @@ def baseline(x, y, x_min=-1, x_max=-1):
     
     return y_base, x_min, x_max
 
+def shirley_auto_range(x, y, search_width_high=10.0, search_width_low=10.0):
+    """
+    Shirley法の積分範囲 (x_min, x_max) をピークトップの両側から自動で決める関数
+    ノイズ対策として、各側の探索範囲内で移動平均が最小となる点を端点とする
+    """
+    # ピークトップを探す
+    idx_peak = np.argmax(y)
+    x_peak = x[idx_peak]
+
+    # --- (A) 高エネルギー側 (Left / High BE) の探索 ---
+    mask_high = (x > x_peak) & (x <= x_peak + search_width_high)
+
+    if np.any(mask_high):
+        # マスク範囲内のデータを抽出
+        y_high_region = y[mask_high]
+        x_high_region = x[mask_high]
+
+        # ★変更: 単純minではなく、移動平均を使った安定探索
+        x_start_cand = find_stable_min(x_high_region, y_high_region)
+    else:
+        x_start_cand = x_peak + 5.0
+
+    # --- (B) 低エネルギー側 (Right / Low BE) の探索 ---
+    mask_low = (x < x_peak) & (x >= x_peak - search_width_low)
+
+    if np.any(mask_low):
+        y_low_region = y[mask_low]
+        x_low_region = x[mask_low]
+
+        # ★変更: 移動平均を使った安定探索
+        x_end_cand = find_stable_min(x_low_region, y_low_region)
+    else:
+        x_end_cand = x_peak - 5.0
+
+    # 求めた候補をmin/maxに割り当て
+    return min(x_start_cand, x_end_cand), max(x_start_cand, x_end_cand)
+
 #x, y：データ、x_min, x_max：領域指定(オプション)既定はピークトップ±5 eV
 
 def shirley_baseline(x, y, x_min=-1, x_max=-1, 
@@ -139,38 +212,7 @@ def shirley_baseline(x, y, x_min=-1, x_max=-1,
 
     # --- 1. 範囲の自動設定ロジック (改良版: ノイズ対策) ---
     if (x_min == -1) and (x_max == -1):
-        # ピークトップを探す
-        idx_peak = np.argmax(y)
-        x_peak = x[idx_peak]
-        
-        # --- (A) 高エネルギー側 (Left / High BE) の探索 ---
-        mask_high = (x > x_peak) & (x <= x_peak + search_width_high)
-        
-        if np.any(mask_high):
-            # マスク範囲内のデータを抽出
-            y_high_region = y[mask_high]
-            x_high_region = x[mask_high]
-            
-            # ★変更: 単純minではなく、移動平均を使った安定探索
-            x_start_cand = find_stable_min(x_high_region, y_high_region)
-        else:
-            x_start_cand = x_peak + 5.0
-
-        # --- (B) 低エネルギー側 (Right / Low BE) の探索 ---
-        mask_low = (x < x_peak) & (x >= x_peak - search_width_low)
-        
-        if np.any(mask_low):
-            y_low_region = y[mask_low]
-            x_low_region = x[mask_low]
-            
-            # ★変更: 移動平均を使った安定探索
-            x_end_cand = find_stable_min(x_low_region, y_low_region)
-        else:
-            x_end_cand = x_peak - 5.0
-
-        # 求めた候補をmin/maxに割り当て
-        x_min = min(x_start_cand, x_end_cand)
-        x_max = max(x_start_cand, x_end_cand)
+        x_min, x_max = shirley_auto_range(x, y, search_width_high, search_width_low)
 
 
     # --- 以下、通常のShirley計算処理 ---
@@ -198,7 +240,10 @@ def shirley_baseline(x, y, x_min=-1, x_max=-1,
         target_low = y_start
         reverse_cumsum = False
 
+    n_iter = 0
+    converged = False
     for _ in range(max_iter):
+        n_iter += 1
         diff = y_roi - bg
         diff[diff < 0] = 0
 
@@ -210,16 +255,20 @@ def shirley_baseline(x, y, x_min=-1, x_max=-1,
         total_sum = cumsum[0] if reverse_cumsum else cumsum[-1]
         
         if total_sum == 0:
+            converged = True
             break
 
         bg_new = target_low + (target_high - target_low) * (cumsum / total_sum)
 
         if np.max(np.abs(bg_new - bg)) < tol:
             bg = bg_new
+            converged = True
             break
             
         bg = bg_new
 
+    XPSPROF.event("shirley", iterations=n_iter, converged=converged, n_points=len(y_roi))
+
     y_base_full = np.zeros_like(y)
     y_base_full[idx_start : idx_end + 1] = bg
     y_base_full[:idx_start] = bg[0]
@@ -227,6 +276,253 @@ def shirley_baseline(x, y, x_min=-1, x_max=-1,
 
     return y_base_full, x_min, x_max
 
+#複数スペクトルの一括Shirley計算 (深さ方向分析など大量のスペクトル向け)
+def shirley_baseline_batch(x, y, x_min=-1, x_max=-1, offsets=None,
+                           search_width_high=10.0, search_width_low=10.0,
+                           max_iter=50, tol=1e-5):
+    """
+    Shirley法バックグラウンドを複数スペクトルまとめて計算する関数 (結果は shirley_baseline と同じ)
+    x, y: 次のいずれか
+        - 2次元配列 (行 = 1スペクトル)。x は全行で共通の1次元配列でも良い
+        - 1次元配列のリスト (長さがバラバラでも可)
+        - offsets を指定した場合は、全スペクトルを連結した1次元配列
+    offsets: 連結配列中の各スペクトルの開始位置 (最後に全長を含めても良い)
+    x_min, x_max: 領域指定。スカラーまたはスペクトルごとの配列 (-1 で自動設定)
+    戻り値: (ベースライン, x_minの配列, x_maxの配列)
+        ベースラインは入力と同じ形 (2次元配列 / リスト / 連結1次元配列) で返す
+    """
+    # --- 1. 入力を「スペクトルごとの1次元配列のリスト」にそろえる ---
+    if offsets is not None:
+        x_flat = np.asarray(x, dtype=float)
+        y_flat = np.asarray(y, dtype=float)
+        bounds = list(offsets)
+        if bounds[-1] != len(y_flat):
+            bounds.append(len(y_flat))
+        x_rows = [x_flat[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1)]
+        y_rows = [y_flat[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1)]
+    elif isinstance(y, np.ndarray) and y.ndim == 2:
+        # 共通の1次元 x も使えるよう、y の形に広げてから行に分ける
+        x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        x_rows = list(x)
+        y_rows = [np.asarray(row, dtype=float) for row in y]
+    else:
+        x_rows = [np.asarray(row, dtype=float) for row in x]
+        y_rows = [np.asarray(row, dtype=float) for row in y]
+
+    n_rows = len(y_rows)
+    x_min_arr = np.broadcast_to(np.asarray(x_min, dtype=float), (n_rows,)).copy()
+    x_max_arr = np.broadcast_to(np.asarray(x_max, dtype=float), (n_rows,)).copy()
+    if n_rows == 0:
+        return [], x_min_arr, x_max_arr
+
+    # 長さをそろえた2次元配列 (足りない部分は x=inf, y=0 で埋める)
+    row_len = np.array([len(row) for row in y_rows])
+    if isinstance(y, np.ndarray) and y.ndim == 2:
+        x_pad = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        y_pad = np.asarray(y, dtype=float)
+    else:
+        x_pad = np.full((n_rows, row_len.max()), np.inf)
+        y_pad = np.zeros((n_rows, row_len.max()))
+        for r in range(n_rows):
+            x_pad[r, :row_len[r]] = x_rows[r]
+            y_pad[r, :row_len[r]] = y_rows[r]
+
+    # --- 2. 行ごとの積分範囲 (ROI) を決める ---
+    # 自動設定はピーク形状に依存するので行ごとに計算する
+    for r in range(n_rows):
+        if (x_min_arr[r] == -1) and (x_max_arr[r] == -1):
+            x_min_arr[r], x_max_arr[r] = shirley_auto_range(
+                x_rows[r], y_rows[r], search_width_high, search_width_low)
+
+    i1 = np.abs(x_pad - x_min_arr[:, None]).argmin(axis=1)
+    i2 = np.abs(x_pad - x_max_arr[:, None]).argmin(axis=1)
+    idx_start = np.minimum(i1, i2)
+    idx_end = np.maximum(i1, i2)
+    roi_len = idx_end - idx_start + 1
+    all_rows = np.arange(n_rows)
+
+    # --- 3. ROIを「低強度側 → 高強度側」の向きにそろえて詰める ---
+    # (元の関数で逆向きcumsumを使う行は、ここで反転しておけば全行を前向きcumsumで扱える)
+    width = roi_len.max()
+    col = np.arange(width)
+    valid = col[None, :] < roi_len[:, None]
+    last = roi_len - 1
+
+    reverse = y_pad[all_rows, idx_start] > y_pad[all_rows, idx_end]
+    offset_in_roi = np.where(reverse[:, None], last[:, None] - col[None, :], col[None, :])
+    gather = np.clip(idx_start[:, None] + offset_in_roi, 0, y_pad.shape[1] - 1)
+    roi = np.where(valid, np.take_along_axis(y_pad, gather, axis=1), 0.0)
+
+    target_low = roi[:, 0].copy()
+    target_high = roi[all_rows, last]
+
+    # 初期値: 両端を結ぶ直線 (np.linspace と同じ計算)
+    step = (target_high - target_low) / np.maximum(last, 1)
+    bg = col[None, :] * step[:, None] + target_low[:, None]
+    bg[all_rows, last] = target_high
+
+    # --- 4. 全行まとめて反復。収束した行は active から外して更新しない ---
+    # ROIが短すぎる行は反復しない (直線のまま)
+    active = all_rows[roi_len >= 3]
+    n_iter = np.zeros(n_rows, dtype=int)
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        n_iter[active] += 1
+
+        diff = roi[active] - bg[active]
+        diff[diff < 0] = 0
+        diff[~valid[active]] = 0
+
+        cumsum = np.cumsum(diff, axis=1)
+        total_sum = cumsum[np.arange(len(active)), last[active]]
+
+        # 合計が0の行はそこで打ち切り (bgは更新しない)
+        nonzero = total_sum != 0
+        active = active[nonzero]
+        cumsum = cumsum[nonzero]
+        total_sum = total_sum[nonzero]
+        if len(active) == 0:
+            break
+
+        low = target_low[active][:, None]
+        high = target_high[active][:, None]
+        bg_new = low + (high - low) * (cumsum / total_sum[:, None])
+
+        change = np.where(valid[active], np.abs(bg_new - bg[active]), 0.0).max(axis=1)
+        bg[active] = bg_new
+        active = active[change >= tol]
+
+    # 最後まで active に残った行は max_iter 回で収束しなかった行
+    if XPSPROF.active():
+        converged = np.ones(n_rows, dtype=bool)
+        converged[active] = False
+        for r in all_rows[roi_len >= 3]:
+            XPSPROF.event("shirley", row=int(r), iterations=int(n_iter[r]),
+                          converged=bool(converged[r]), n_points=int(roi_len[r]))
+
+    # --- 5. 元の向きに戻して全長のベースラインを作る ---
+    # ROIの外側は端の値で埋める
+    pos = np.clip(np.arange(y_pad.shape[1])[None, :] - idx_start[:, None], 0, last[:, None])
+    pos = np.where(reverse[:, None], last[:, None] - pos, pos)
+    full = np.take_along_axis(bg, pos, axis=1)
+
+    # ROIが短すぎる行は全長の直線 (shirley_baseline と同じ扱い)
+    for r in all_rows[roi_len < 3]:
+        full[r, :row_len[r]] = np.linspace(y_pad[r, idx_start[r]], y_pad[r, idx_end[r]], row_len[r])
+
+    baselines = [full[r, :row_len[r]] for r in range(n_rows)]
+
+    # --- 6. 入力と同じ形で返す ---
+    if offsets is not None:
+        baselines = np.concatenate(baselines)
+    elif isinstance(y, np.ndarray) and y.ndim == 2:
+        baselines = full
+
+    return baselines, x_min_arr, x_max_arr
+
+#Tougaard法のバックグラウンド (universal cross-section, FFTによる畳み込み)
+# K(T) = B * T / (C + T^2)^2   T: エネルギー損失 (eV)
+# B は領域の端でデータに合わせて決める (文献の universal 値 2866 eV^2 を使う場合は B=2866.0 を渡す)
+TOUGAARD_C = 1643.0   # eV^2
+
+def tougaard_baseline(x, y, x_min=-1, x_max=-1, B=None, C=TOUGAARD_C,
+                      search_width_high=10.0, search_width_low=10.0):
+    """
+    Tougaard法によるバックグラウンド計算
+    ある結合エネルギーのバックグラウンド = それより低結合エネルギー側の信号 × 損失関数K の積分
+    この積分 (畳み込み) をFFTで計算するので、点数nに対して O(n log n)
+    B: 損失関数の強さ。None なら高結合エネルギー側の端でデータと一致するように決める
+    範囲の自動設定と戻り値は shirley_baseline と同じ (y_base_full, x_min, x_max)
+    ※ エネルギー間隔は一定とみなす (平均の間隔を使う)
+    """
+    x = np.array(x, dtype=float)
+    y = np.array(y, dtype=float)
+
+    # --- 1. 範囲の設定 (shirley_baseline と同じ) ---
+    if (x_min == -1) and (x_max == -1):
+        x_min, x_max = shirley_auto_range(x, y, search_width_high, search_width_low)
+
+    idx_start = np.abs(x - x_min).argmin()
+    idx_end = np.abs(x - x_max).argmin()
+    if idx_start > idx_end:
+        idx_start, idx_end = idx_end, idx_start
+
+    y_roi = y[idx_start : idx_end + 1]
+    if len(y_roi) < 3:
+        return np.linspace(y[idx_start], y[idx_end], len(x)), x_min, x_max
+
+    # --- 2. 結合エネルギーの小さい順に並べる ---
+    ascending = x[idx_end] > x[idx_start]
+    y_asc = y_roi if ascending else y_roi[::-1]
+    n = len(y_asc)
+    step = abs(x[idx_end] - x[idx_start]) / (n - 1)
+
+    # 低結合エネルギー側の端を基準にした信号 (マイナスは0)
+    y_low = y_asc[0]
+    signal = y_asc - y_low
+    signal[signal < 0] = 0
+
+    # --- 3. 畳み込み bg[k] = Σ_{m<k} K((k-m)*step) * signal[m] * step をFFTで計算 ---
+    T = np.arange(n) * step
+    kernel = T / (C + T**2)**2            # K(0) = 0 なので m = k の項は入らない
+    n_fft = 1 << int(2 * n - 1).bit_length()  # 循環畳み込みにならないよう 2n 以上に0埋め
+    conv = np.fft.irfft(np.fft.rfft(signal, n_fft) * np.fft.rfft(kernel, n_fft), n_fft)[:n] * step
+
+    if B is None:
+        # 高結合エネルギー側の端でデータと一致させる
+        B = (y_asc[-1] - y_low) / conv[-1] if conv[-1] > 0 else 0.0
+    bg = y_low + B * conv
+    if not ascending:
+        bg = bg[::-1]
+
+    # --- 4. 全長に戻す (範囲外は端の値) ---
+    y_base_full = np.zeros_like(y)
+    y_base_full[idx_start : idx_end + 1] = bg
+    y_base_full[:idx_start] = bg[0]
+    y_base_full[idx_end+1:] = bg[-1]
+
+    return y_base_full, x_min, x_max
+
+#バックグラウンドの種類 (RSF.json の各level、または peakfit.json の成分に "background": "tougaard" のように書いて選ぶ。既定はshirley)
+BACKGROUND_METHODS = ["shirley", "tougaard"]
+DEFAULT_BACKGROUND = "shirley"
+
+def _checked_background(method, level):
+    if method not in BACKGROUND_METHODS:
+        print(f"警告: {level} のバックグラウンド '{method}' は未対応です。{DEFAULT_BACKGROUND} を使います。")
+        return DEFAULT_BACKGROUND
+    return method
+
+def background_methods(rsf_list, peak_db=None):
+    """
+    RSF.json と peakfit.json の内容から {level: バックグラウンドの種類} を作る
+    peakfit.json の成分に "background" があれば、そのlevelは RSF.json より peakfit.json の指定を優先する
+    (同じlevelの成分で違う種類を書いた場合は、最初の成分の指定を使う)
+    """
+    methods = {}
+    for item in rsf_list or []:
+        methods[item["level"]] = _checked_background(item.get("background", DEFAULT_BACKGROUND), item["level"])
+
+    from_peaks = {}
+    for item in peak_db or []:
+        if "background" not in item:
+            continue
+        level = item["level"]
+        method = _checked_background(item["background"], level)
+        if level not in from_peaks:
+            from_peaks[level] = method
+        elif from_peaks[level] != method:
+            print(f"警告: peakfit.json の {level} でバックグラウンドの指定が異なります。{from_peaks[level]} を使います。")
+    methods.update(from_peaks)
+    return methods
+
+def background_baseline(x, y, method=DEFAULT_BACKGROUND, **kwargs):
+    """method に応じたバックグラウンド計算 (戻り値は shirley_baseline と同じ)"""
+    if method == "tougaard":
+        return tougaard_baseline(x, y, **kwargs)
+    return shirley_baseline(x, y, **kwargs)
+
 #台形積分
 def Aria(x, y, baseline_y, x_min, x_max):
    # 1. 範囲のインデックス取得
@@ -251,29 +547,85 @@ def Aria(x, y, baseline_y, x_min, x_max):
     
     return area
 
+#面積 (Shirleyバックグラウンドより上の部分)
+def region_areas(x_all, y_all, indices, methods=None, baselines=None):
+    """
+    指定した領域の面積を求める関数 (Shirleyの領域はベースラインをまとめて計算する)
+    methods: {領域番号: バックグラウンドの種類} (None ならすべてShirley)
+    baselines: 1回の解析で共有するベースラインの辞書 {(領域番号, 種類): (y_base, x_min, x_max)}
+               すでにある領域はそれを使い、計算した領域は追加する (フィッティング・Excel出力でも同じものを使うため)
+    戻り値: {領域番号: 面積}
+    """
+    indices = list(indices)
+    if methods is None:
+        methods = {}
+    if baselines is None:
+        baselines = {}
+    keys = {i: (i, methods.get(i, DEFAULT_BACKGROUND)) for i in indices}
+
+    # まだ無いベースラインを計算 (Shirleyはまとめて、それ以外は1つずつ)
+    shirley = [i for i in indices if keys[i] not in baselines and keys[i][1] == "shirley"]
+    y_bases, x_mins, x_maxs = shirley_baseline_batch(
+        x=[x_all[i] for i in shirley], y=[y_all[i] for i in shirley])
+    for k, i in enumerate(shirley):
+        baselines[keys[i]] = (y_bases[k], x_mins[k], x_maxs[k])
+    for i in indices:
+        if keys[i] not in baselines:
+            baselines[keys[i]] = background_baseline(x_all[i], y_all[i], method=keys[i][1])
+
+    areas = {}
+    for i in indices:
+        y_base, x_min, x_max = baselines[keys[i]]
+        areas[i] = Aria(x=x_all[i], y=y_all[i], baseline_y=y_base, x_max=x_max, x_min=x_min)
+    return areas
+
 #元素比
-def atomic_percent(x_all, y_all, tags, rsf_list):
+def atomic_percent(x_all, y_all, tags, rsf_list, baselines=None, backgrounds=None):
+    """
+    baselines: 1回の解析で共有するベースラインの辞書 (region_areas を参照)。
+               渡すと計算したベースラインが入るので、フィッティング (XPSBATCH.fit_regions) で再利用できる
+    backgrounds: {level: バックグラウンドの種類} (background_methods。None なら RSF.json の指定だけを使う)
+    XPSSET.SpectrumSet は atomic_percent_spectra で渡す
+    """
 
-    
     # 1. RSFを辞書形式に変換して検索しやすくする
     # 例: {"C1s": 0.314, "O1s": 0.733, ...}
     rsf_dict = {item["level"]: item["rsf"] for item in rsf_list}
 
+    # --- ベースライン計算・面積計算 (対象の全領域をまとめて計算) ---
+    # RSF設定がない、またはRSFが0の場合は計算対象外とする
+    # (これで0番目や最後の不要なデータを自動でスキップできます)
+    target = [i for i in range(len(tags)) if rsf_dict.get(tags[i], 0.0) > 0]
+    if backgrounds is None:
+        backgrounds = background_methods(rsf_list)
+    raw_areas = region_areas(x_all, y_all, target,
+                             methods={i: backgrounds.get(tags[i], DEFAULT_BACKGROUND) for i in target},
+                             baselines=baselines)
+
+    return atomic_percent_from_areas(tags, raw_areas, rsf_list)
+
+def atomic_percent_spectra(spectra, rsf_list, baselines=None, backgrounds=None):
+    """XPSSET.SpectrumSet 用の atomic_percent (各領域はビューのまま渡すのでコピーしない)"""
+    tags, x_all, y_all = spectra
+    return atomic_percent(x_all, y_all, tags, rsf_list, baselines=baselines, backgrounds=backgrounds)
+
+def atomic_percent_from_areas(tags, raw_areas, rsf_list):
+    """
+    領域ごとの面積 ({領域番号: 面積}) から原子組成比を求める関数
+    RSFが0または未設定の領域は 0 %
+    """
+    rsf_dict = {item["level"]: item["rsf"] for item in rsf_list}
+
     corrected_areas = []  # RSFで割った後の面積
     calc_flags = []       # 計算対象かどうかのフラグ
 
-    # --- 面積計算とRSF補正 ---
+    # --- RSF補正 ---
     for i in range(len(tags)):
         tag = tags[i]
-        
-        # RSF設定がない、またはRSFが0の場合は計算対象外とする
-        # (これで0番目や最後の不要なデータを自動でスキップできます)
         rsf = rsf_dict.get(tag, 0.0)
-        
+
         if rsf > 0:
-            # ベースラインと面積計算 
-            y_base, x_min, x_max = shirley_baseline(x=x_all[i], y=y_all[i])
-            raw_area = Aria(x=x_all[i], y=y_all[i], baseline_y=y_base, x_max=x_max, x_min=x_min)
+            raw_area = raw_areas[i]
             
             # 【重要】RSFで割って補正面積を出す
             norm_area = raw_area / rsf
@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.optimize import curve_fit
+
+import XPSPROF
 
 # --- 1. フィッティング用関数定義 (Pseudo-Voigt) ---
 def pseudo_voigt(x, amp, center, fwhm, mix_ratio):
@@ -20,6 +21,31 @@ def pseudo_voigt(x, amp, center, fwhm, mix_ratio):
     # 混合
     return amp * ((1 - mix_ratio) * g + mix_ratio * l)
 
+# --- 1b. Pseudo-Voigt関数の偏微分 (解析的ヤコビアン) ---
+def pseudo_voigt_jacobian(x, amp, center, fwhm, mix_ratio):
+    """
+    pseudo_voigt の (amp, center, fwhm, mix_ratio) についての偏微分
+    戻り値: shape (len(x), 4) の配列
+    """
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    gamma = fwhm / 2.0
+
+    d = x - center
+    g = np.exp(-(d**2) / (2 * sigma**2))
+    u = d / gamma
+    l = 1 / (1 + u**2)
+
+    jac = np.empty((len(x), 4))
+    # d/d amp
+    jac[:, 0] = (1 - mix_ratio) * g + mix_ratio * l
+    # d/d center
+    jac[:, 1] = amp * ((1 - mix_ratio) * g * d / sigma**2 + mix_ratio * 2 * u * l**2 / gamma)
+    # d/d fwhm (sigma, gamma はどちらも fwhm に比例)
+    jac[:, 2] = amp * ((1 - mix_ratio) * g * d**2 / (sigma**2 * fwhm) + mix_ratio * 2 * u**2 * l**2 / fwhm)
+    # d/d mix_ratio
+    jac[:, 3] = amp * (l - g)
+    return jac
+
 # --- 2. 複数のピークを足し合わせるモデル関数 ---
 def multi_peak_model(x, *params):
     """
@@ -37,17 +63,127 @@ def multi_peak_model(x, *params):
         
     return y_sum
 
-# --- 3. メインのフィッティング実行関数 ---
-def perform_fitting(x, y, peak_infos, verbose=True):
+def multi_peak_jacobian(x, *params):
     """
-    x: エネルギー軸 (eV)
-    y: バックグラウンドを引いた後の強度データ
-    peak_infos: jsonから読み込んだピーク情報のリスト
-    verbose: Trueなら結果をコンソールに表示する
+    multi_peak_model のヤコビアン (curve_fit の jac に渡す)
+    戻り値: shape (len(x), len(params)) の配列
     """
-    x = np.array(x)
-    y = np.array(y)
-    
+    x = np.asarray(x, dtype=float)
+    num_peaks = len(params) // 4
+    jac = np.empty((len(x), num_peaks * 4))
+
+    for i in range(num_peaks):
+        jac[:, i*4 : (i+1)*4] = pseudo_voigt_jacobian(x, *params[i*4 : (i+1)*4])
+
+    return jac
+
+# --- 結果の表をコンソールに表示 ---
+def print_fit_table(fitted_peaks):
+    print("-" * 65)
+    print(f"{'Name':<10} | {'Position':<10} | {'FWHM':<6} | {'Area':<10} | {'Ratio (%)':<10}")
+    print("-" * 65)
+    for p in fitted_peaks:
+        print(f"{p['name']:<10} | {p['center']:<7.2f} eV | {p['fwhm']:<6.2f} | {p['area']:<10.1f} | {p['ratio']:>6.1f} %")
+    print("-" * 65)
+
+# --- パラメータの連動 (スピン軌道分裂のダブレット、FWHMの共有など) ---
+# peakfit.json の成分に次のキーを書くと、その成分のパラメータを同じlevelの別の成分 (ref) から決める
+#   "ref": "Cu 2p3/2"        基準にする成分の name
+#   "center_offset": 19.8    center = 基準の center + 19.8 (分裂幅を固定)
+#   "fwhm_ratio": 1.0        fwhm = 基準の fwhm × 1.0 (1.0 で共有)
+#   "share_mix": true        mix_ratio = 基準の mix_ratio
+#   "amplitude_ratio": 0.5   amplitude = 基準の amplitude × 0.5
+#   "area_ratio": 0.5        面積 = 基準の面積 × 0.5 (fwhm_ratio と share_mix が必要)
+# 連動したパラメータは curve_fit の変数から外れる (書かなかったパラメータは今まで通り独立)
+# 連動した成分の center, FWHM, *_error は省略可 (基準の値から決める)
+LINK_KEYS = ["center_offset", "fwhm_ratio", "share_mix", "amplitude_ratio", "area_ratio"]
+
+def _linked_infos(peak_infos):
+    """連動した成分の省略された center, FWHM, *_error を基準の成分から補ったコピー"""
+    infos = [dict(p) for p in peak_infos]
+    by_name = {p["name"]: p for p in infos}
+    # 基準がさらに連動している場合に備えて、埋まるまで繰り返す
+    for _ in range(len(infos)):
+        for p in infos:
+            if "ref" not in p:
+                continue
+            if p["ref"] not in by_name:
+                raise ValueError(f"{p['name']} の ref '{p['ref']}' が同じlevelにありません。")
+            ref = by_name[p["ref"]]
+            if "center" not in p and "center" in ref:
+                p["center"] = ref["center"] + p.get("center_offset", 0.0)
+            if "FWHM" not in p and "FWHM" in ref:
+                p["FWHM"] = ref["FWHM"] * p.get("fwhm_ratio", 1.0)
+            for key in ("center_error", "FWHM_error"):
+                if key not in p and key in ref:
+                    p[key] = ref[key]
+    return infos
+
+def parameter_links(peak_infos):
+    """
+    連動の設定から、全パラメータ (各ピーク4個: amp, center, fwhm, mix) と
+    curve_fit の変数 (独立なパラメータ) の関係 full = M @ free + c を作る関数
+    戻り値: (M, c, free_index)  free_index は独立なパラメータの全パラメータ中の位置
+            連動が1つも無ければ None
+    """
+    if not any("ref" in p for p in peak_infos):
+        return None
+
+    names = [p["name"] for p in peak_infos]
+    n = len(peak_infos) * 4
+    # 各パラメータ → (基準のパラメータ番号, 係数, 定数)  独立なものは None
+    ties = [None] * n
+    for i, p in enumerate(peak_infos):
+        if "ref" not in p:
+            continue
+        if p["ref"] not in names or p["ref"] == p["name"]:
+            raise ValueError(f"{p['name']} の ref '{p['ref']}' が同じlevelにありません。")
+        r = names.index(p["ref"])
+        if "area_ratio" in p:
+            # 面積 ∝ amp × fwhm × (mixで決まる定数) なので、fwhm と mix が連動していれば amp の比で書ける
+            if "fwhm_ratio" not in p or not p.get("share_mix", False):
+                raise ValueError(f"{p['name']}: area_ratio には fwhm_ratio と share_mix の指定が必要です。")
+            ties[i*4] = (r*4, p["area_ratio"] / p["fwhm_ratio"], 0.0)
+        elif "amplitude_ratio" in p:
+            ties[i*4] = (r*4, p["amplitude_ratio"], 0.0)
+        if "center_offset" in p:
+            ties[i*4+1] = (r*4+1, 1.0, p["center_offset"])
+        if "fwhm_ratio" in p:
+            ties[i*4+2] = (r*4+2, p["fwhm_ratio"], 0.0)
+        if p.get("share_mix", False):
+            ties[i*4+3] = (r*4+3, 1.0, 0.0)
+
+    free_index = [j for j in range(n) if ties[j] is None]
+    M = np.zeros((n, len(free_index)))
+    c = np.zeros(n)
+
+    # 基準をたどって独立なパラメータの一次式にする (循環していたらエラー)
+    def resolve(j, depth=0):
+        if depth > n:
+            raise ValueError(f"{names[j // 4]} の連動が循環しています。")
+        if ties[j] is None:
+            row = np.zeros(len(free_index))
+            row[free_index.index(j)] = 1.0
+            return row, 0.0
+        ref_j, a, b = ties[j]
+        row, const = resolve(ref_j, depth + 1)
+        return a * row, a * const + b
+
+    for j in range(n):
+        M[j], c[j] = resolve(j)
+    return M, c, free_index
+
+# --- 初期値と制約条件 ---
+def initial_params(x, y, peak_infos):
+    """
+    JSONのピーク情報から curve_fit 用の初期値と上下限を作る関数
+    戻り値: (initial_guesses, bounds_min, bounds_max) 各ピーク4個ずつ (amp, center, fwhm, mix)
+    連動した成分の省略された値は基準の成分から補う (parameter_links を参照)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    peak_infos = _linked_infos(peak_infos)
+
     initial_guesses = []
     bounds_min = []
     bounds_max = []
@@ -77,21 +213,176 @@ def perform_fitting(x, y, peak_infos, verbose=True):
         bounds_min.append(0.0)
         bounds_max.append(1.0)
 
-    # curve_fit 実行
+    return initial_guesses, bounds_min, bounds_max
+
+# --- 2b. 振幅を線形に解くフィッティング (variable projection) ---
+# 振幅はモデルに線形に入るので、center, fwhm, mix を決めれば非負最小二乗 (NNLS) で一度に求まる
+# 非線形の最適化は center, fwhm, mix だけで行い、各ステップで振幅を NNLS で解き直す
+FIT_ENGINES = ["curve_fit", "varpro"]
+
+def _curve_fit(x, y, initial_guesses, bounds_min, bounds_max, links, use_jac, maxfev):
+    """
+    curve_fit で全パラメータを非線形最適化する関数 (perform_fitting の engine="curve_fit")
+    戻り値: (popt, pcov, nfev, chi2)  popt, pcov は全パラメータの並び
+    """
+    # 連動がある場合は独立なパラメータだけを curve_fit に渡す
+    model, jacobian = multi_peak_model, multi_peak_jacobian
+    if links is not None:
+        M, c, free_index = links
+        initial_guesses = [initial_guesses[j] for j in free_index]
+        bounds_min = [bounds_min[j] for j in free_index]
+        bounds_max = [bounds_max[j] for j in free_index]
+
+        def model(x, *free):
+            return multi_peak_model(x, *(M @ np.asarray(free) + c))
+
+        def jacobian(x, *free):
+            return multi_peak_jacobian(x, *(M @ np.asarray(free) + c)) @ M
+
+    # scipy.optimize は読み込みが重いので、フィッティングするときだけ読み込む
+    from scipy.optimize import curve_fit
+    popt, pcov, infodict, _, _ = curve_fit(
+        model, 
+        x, 
+        y, 
+        p0=initial_guesses, 
+        bounds=(bounds_min, bounds_max),
+        jac=jacobian if use_jac else None,
+        maxfev=maxfev,
+        full_output=True
+    )
+
+    if links is not None:
+        # 全パラメータの並びに戻す (共分散も M で変換)
+        popt = M @ popt + c
+        pcov = M @ pcov @ M.T
+    return popt, pcov, infodict.get("nfev", 0), float(np.sum(infodict["fvec"]**2))
+
+def _varpro_fit(x, y, num_peaks, initial_guesses, bounds_min, bounds_max, links, use_jac, maxfev):
+    """
+    variable projection でフィッティングする関数 (perform_fitting の engine="varpro")
+    initial_guesses, bounds_min, bounds_max は全パラメータの並び (振幅の値は使わない)
+    戻り値: (popt, pcov, nfev, chi2)  popt, pcov は全パラメータの並び
+    収束しなければ RuntimeError (curve_fit と同じ)
+    """
+    from scipy.optimize import least_squares, nnls
+
+    n = num_peaks * 4
+    if links is None:
+        M, c, free_index = np.eye(n), np.zeros(n), list(range(n))
+    else:
+        M, c, free_index = links
+    free_index = np.asarray(free_index)
+    is_amp = free_index % 4 == 0
+    amp_rows = np.arange(0, n, 4)
+    nl_rows = np.setdiff1d(np.arange(n), amp_rows)
+    # 連動は同じ種類のパラメータどうしなので、振幅とそれ以外に分けられる
+    M_amp = M[np.ix_(amp_rows, is_amp)]
+    M_nl = M[np.ix_(nl_rows, ~is_amp)]
+    c_nl = c[nl_rows]
+
+    nl_free = free_index[~is_amp]
+    theta0 = np.asarray(initial_guesses, dtype=float)[nl_free]
+    lo = np.asarray(bounds_min, dtype=float)[nl_free]
+    hi = np.asarray(bounds_max, dtype=float)[nl_free]
+
+    last = {}
+    def solve(theta):
+        """theta (center, fwhm, mix の独立な値) に対する基底、振幅、全パラメータ"""
+        key = theta.tobytes()
+        if last.get("key") != key:
+            full = np.empty(n)
+            full[nl_rows] = M_nl @ theta + c_nl
+            shapes = np.column_stack([pseudo_voigt(x, 1.0, *full[i*4+1 : (i+1)*4]) for i in range(num_peaks)])
+            basis = shapes @ M_amp
+            a, _ = nnls(basis, y)
+            full[amp_rows] = M_amp @ a
+            last.update(key=key, basis=basis, a=a, full=full)
+        return last["basis"], last["a"], last["full"]
+
+    def residual(theta):
+        basis, a, _ = solve(theta)
+        return basis @ a - y
+
+    def jacobian(theta):
+        # Kaufman の近似: 振幅を固定した微分を、使っている基底の直交補空間に射影する
+        basis, a, full = solve(theta)
+        J = multi_peak_jacobian(x, *full)[:, nl_rows] @ M_nl
+        active = a > 0
+        if np.any(active):
+            Q, _ = np.linalg.qr(basis[:, active])
+            J -= Q @ (Q.T @ J)
+        return J
+
+    res = least_squares(residual, theta0, jac=jacobian if use_jac else "2-point",
+                        bounds=(lo, hi), method="trf", max_nfev=maxfev)
+    if not res.success:
+        raise RuntimeError("Optimal parameters not found: " + res.message)
+
+    _, _, popt = solve(res.x)
+    popt = popt.copy()
+    chi2 = float(np.sum(res.fun**2))
+    # 共分散は振幅も含めた独立なパラメータ全体で求める (curve_fit と同じ規格化)
+    J = multi_peak_jacobian(x, *popt) @ M
+    dof = len(x) - J.shape[1]
+    pcov_free = np.linalg.pinv(J.T @ J) * (chi2 / dof if dof > 0 else np.inf)
+    pcov = M @ pcov_free @ M.T
+    return popt, pcov, res.nfev, chi2
+
+# --- 3. メインのフィッティング実行関数 ---
+def perform_fitting(x, y, peak_infos, verbose=True, use_jac=True, full_output=False, p0=None,
+                    maxfev=10000, engine="curve_fit"):
+    """
+    x: エネルギー軸 (eV)
+    y: バックグラウンドを引いた後の強度データ
+    peak_infos: jsonから読み込んだピーク情報のリスト
+    verbose: Trueなら結果をコンソールに表示する
+    use_jac: Trueなら解析的ヤコビアンを使う (Falseなら差分近似)
+    full_output: Trueなら3番目の戻り値として情報辞書 (popt, pcov, nfev, chi2, success) を返す
+    p0: 初期値 (amp, center, fwhm, mix をピーク順に並べたもの)。None ならJSONから作る
+    maxfev: モデル関数の評価回数の上限 (超えたら失敗扱い)
+    連動の設定 (parameter_links) がある場合、curve_fit は独立なパラメータだけを動かす
+    p0 と info の popt, pcov はいずれも全パラメータ (各ピーク4個) の並び
+    engine: "curve_fit" (全パラメータを非線形最適化) / "varpro" (振幅は NNLS で解き、
+            center, fwhm, mix だけを非線形最適化。振幅の初期値は使わない)
+    """
+    if engine not in FIT_ENGINES:
+        raise ValueError(f"未対応のフィッティング方法です: {engine}")
+    x = np.array(x)
+    y = np.array(y)
+    
+    initial_guesses, bounds_min, bounds_max = initial_params(x, y, peak_infos)
+    links = parameter_links(peak_infos)
+
+    # 前回の結果などで初期値を指定する場合 (範囲内に収める)
+    # 境界ちょうどから始めると収束が遅くなるので、範囲の0.1%だけ内側に入れる
+    if p0 is not None:
+        lo = np.asarray(bounds_min, dtype=float)
+        hi = np.asarray(bounds_max, dtype=float)
+        margin = np.where(np.isfinite(hi - lo), (hi - lo) * 1e-3, 0.0)
+        initial_guesses = list(np.clip(np.asarray(p0, dtype=float), lo + margin, hi - margin))
+
+    info = {"popt": None, "pcov": None, "nfev": 0, "chi2": np.inf, "success": False}
     try:
-        popt, pcov = curve_fit(
-            multi_peak_model, 
-            x, 
-            y, 
-            p0=initial_guesses, 
-            bounds=(bounds_min, bounds_max),
-            maxfev=10000
-        )
+        if engine == "varpro":
+            popt, pcov, nfev, chi2 = _varpro_fit(x, y, len(peak_infos), initial_guesses, bounds_min,
+                                                 bounds_max, links, use_jac, maxfev)
+        else:
+            popt, pcov, nfev, chi2 = _curve_fit(x, y, initial_guesses, bounds_min, bounds_max,
+                                                links, use_jac, maxfev)
     except RuntimeError:
+        XPSPROF.event("curve_fit", n_points=len(x), n_peaks=len(peak_infos),
+                      nfev=maxfev, success=False, chi2=None)
         if verbose:
             print("Fitting failed to converge.")
+        if full_output:
+            return None, None, info
         return None, None
 
+    info.update(popt=popt, pcov=pcov, nfev=nfev, chi2=chi2, success=True)
+    XPSPROF.event("curve_fit", n_points=len(x), n_peaks=len(peak_infos),
+                  nfev=int(info["nfev"]), success=True, chi2=info["chi2"])
+
     # 結果整理
     fitted_peaks = []
     num_peaks = len(peak_infos)
@@ -122,11 +413,6 @@ def perform_fitting(x, y, peak_infos, verbose=True):
         })
 
     # 面積比を計算して格納
-    if verbose:
-        print("-" * 65)
-        print(f"{'Name':<10} | {'Position':<10} | {'FWHM':<6} | {'Area':<10} | {'Ratio (%)':<10}")
-        print("-" * 65)
-
     for p in temp_peaks:
         if total_area > 0:
             ratio = (p['area'] / total_area) * 100
@@ -136,13 +422,12 @@ def perform_fitting(x, y, peak_infos, verbose=True):
         p['ratio'] = ratio # 辞書に追加
         fitted_peaks.append(p)
         
-        if verbose:
-            print(f"{p['name']:<10} | {p['center']:<7.2f} eV | {p['fwhm']:<6.2f} | {p['area']:<10.1f} | {ratio:>6.1f} %")
-    
     if verbose:
-        print("-" * 65)
+        print_fit_table(fitted_peaks)
 
     # 合計波形
     y_fit_total = multi_peak_model(x, *popt)
-    
+
+    if full_output:
+        return fitted_peaks, y_fit_total, info
     return fitted_peaks, y_fit_total
\ No newline at end of file
@@ -0,0 +1,130 @@
+#差分再解析用 (前回の結果を保存しておき、入力が変わった領域だけ計算し直す)
+#
+# 領域ごとに次の依存関係を記録する:
+#   data  : 生データ (帯電補正前の x, y) のハッシュ
+#   shift : 帯電補正の補正値
+#   rsf   : RSF.json のそのlevelの値
+#   background : RSF.json のそのlevelのバックグラウンドの種類 (shirley / tougaard)
+#   peaks : peakfit.json のそのlevelの成分のリスト
+#   fit_options : フィッティングの追加設定 (ブートストラップの回数など)
+# 面積 (バックグラウンド + 積分) は data, shift, background が同じなら再利用し、RSFでの割り算と規格化は毎回行う
+# フィッティング結果 (バックグラウンド含む) は data, shift, background, peaks, fit_options が同じなら再利用する
+import os
+import pickle
+import hashlib
+import numpy as np
+
+import XPSCAL
+import XPSCACHE
+
+STATE_VERSION = 1
+STATE_SUFFIX = "_state.pkl"
+
+
+def state_path_for(path, out_dir=None):
+    """解析対象ファイルの状態ファイルのパス (out_dir/<ファイル名>_state.pkl)"""
+    if out_dir is None:
+        out_dir = os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, stem + STATE_SUFFIX)
+
+
+def data_hash(x, y):
+    h = hashlib.sha256()
+    for arr in (x, y):
+        arr = np.ascontiguousarray(arr, dtype=float)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def region_deps(tags, x_raw, y_raw, shift_value, rsf_list, peak_db, fit_options=None):
+    """
+    領域ごとの依存関係の辞書のリスト
+    x_raw, y_raw: 帯電補正前のデータ
+    """
+    rsf_dict = {item["level"]: item["rsf"] for item in rsf_list}
+    backgrounds = XPSCAL.background_methods(rsf_list, peak_db)
+    deps = []
+    for i, tag in enumerate(tags):
+        deps.append({
+            "tag": tag,
+            "data": data_hash(x_raw[i], y_raw[i]),
+            "shift": shift_value,
+            "rsf": rsf_dict.get(tag),
+            "background": backgrounds.get(tag, XPSCAL.DEFAULT_BACKGROUND),
+            "peaks": [p for p in peak_db if p["level"] == tag],
+            # 並列数は結果に影響しないので含めない
+            "fit_options": {k: v for k, v in (fit_options or {}).items() if not k.endswith("_workers")}
+        })
+    return deps
+
+
+def load_state(path):
+    """
+    前回の状態を読み込む関数
+    無い・壊れている・形式やコードのバージョンが違う場合は None
+    """
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if (not isinstance(state, dict) or state.get("version") != STATE_VERSION
+            or state.get("code") != XPSCACHE.code_version()):
+        return None
+    return state
+
+
+def save_state(path, deps, areas, fits):
+    """
+    今回の状態を保存する関数
+    areas: {領域番号: 面積}, fits: {領域番号: フィッティング結果 (失敗なら None)}
+    """
+    regions = []
+    for i, d in enumerate(deps):
+        region = {"deps": d}
+        if i in areas:
+            region["area"] = areas[i]
+        if i in fits:
+            region["fit"] = fits[i]
+        regions.append(region)
+    state = {"version": STATE_VERSION, "code": XPSCACHE.code_version(), "regions": regions}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + f".{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _previous(state, i, dep):
+    """前回の同じ番号の領域 (タグ・生データ・補正値・バックグラウンドの種類が同じ場合のみ)"""
+    if state is None or i >= len(state["regions"]):
+        return None
+    prev = state["regions"][i]
+    if any(prev["deps"].get(k) != dep[k] for k in ("tag", "data", "shift", "background")):
+        return None
+    return prev
+
+
+def reusable_areas(state, deps):
+    """前回の面積をそのまま使える領域 ({領域番号: 面積})"""
+    areas = {}
+    for i, dep in enumerate(deps):
+        prev = _previous(state, i, dep)
+        if prev is not None and "area" in prev:
+            areas[i] = prev["area"]
+    return areas
+
+
+def reusable_fits(state, deps):
+    """前回のフィッティング結果をそのまま使える領域 ({領域番号: 結果})"""
+    fits = {}
+    for i, dep in enumerate(deps):
+        prev = _previous(state, i, dep)
+        if (prev is not None and "fit" in prev and prev["deps"]["peaks"] == dep["peaks"]
+                and prev["deps"].get("fit_options", {}) == dep["fit_options"]):
+            fits[i] = prev["fit"]
+    return fits
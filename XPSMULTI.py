@@ -0,0 +1,187 @@
+#マルチスタート・フィッティング (初期値を変えて何度もフィットし、最もカイ二乗の小さい結果を採用)
+#
+# 近接した成分 (Cu2O 932.6 eV と Cu 932.7 eV など) は初期値によって別の局所解に落ちるので、
+# peakfit.json の上下限の中からラテン超方格法で K 個の初期値を選び、プロセスプールで並列にフィットする
+# 1個目の初期値は常に通常と同じ (JSONの値) なので、通常のフィットより悪くなることはない
+import os
+import time
+import queue
+import multiprocessing
+import numpy as np
+
+import XPSFIT
+
+# 最良のカイ二乗からこの相対差以内なら「最良値に到達した」とみなす
+REACH_RTOL = 1e-6
+# 1つの初期値あたりの評価回数の上限 (収束しない初期値に時間を取られないよう、通常のフィットより小さくする)
+MULTISTART_MAXFEV = 2000
+
+
+def latin_hypercube(n, bounds_min, bounds_max, rng):
+    """
+    上下限の中から n 個の点をラテン超方格法で選ぶ (各次元を n 等分し、各区間から1点ずつ)
+    戻り値: shape (n, 次元数) の配列
+    """
+    lo = np.asarray(bounds_min, dtype=float)
+    hi = np.asarray(bounds_max, dtype=float)
+    dim = len(lo)
+    # 区間の番号を次元ごとにばらばらに並べ替え、区間内の位置は一様乱数
+    strata = np.argsort(rng.random((n, dim)), axis=0)
+    u = (strata + rng.random((n, dim))) / n
+    return lo + u * (hi - lo)
+
+
+def start_points(x, y, peak_infos, n_starts, seed=0):
+    """
+    マルチスタートの初期値 (1個目はJSONの初期値、残りはラテン超方格法)
+    振幅の上限は無限大なので、データの最大値の 1.2 倍までの範囲から選ぶ
+    """
+    initial_guesses, bounds_min, bounds_max = XPSFIT.initial_params(x, y, peak_infos)
+    hi = np.asarray(bounds_max, dtype=float)
+    hi = np.where(np.isfinite(hi), hi, max(np.max(y), 1.0) * 1.2)
+
+    rng = np.random.default_rng(seed)
+    points = [np.asarray(initial_guesses, dtype=float)]
+    if n_starts > 1:
+        points.extend(latin_hypercube(n_starts - 1, bounds_min, hi, rng))
+    return points
+
+
+def _fit_start(args):
+    """1つの初期値からのフィット (プロセスプール用にトップレベルに置く)"""
+    x, y, peak_infos, p0, maxfev, engine = args
+    return XPSFIT.perform_fitting(x, y, peak_infos, verbose=False, full_output=True, p0=p0, maxfev=maxfev,
+                                  engine=engine)
+
+
+class StartPool:
+    """
+    マルチスタート用のプロセスプール (fit_regions 1回分の全領域で使い回す)
+    プロセスは最初に get() したときに作り、時間切れのときは terminate() で実行中の初期値ごと止める
+    (次の get() で新しいプールを作る)
+    実行中の仕事を止められるよう、ProcessPoolExecutor ではなく multiprocessing.Pool を使う
+    使い方:
+        with StartPool(workers) as pool:
+            multistart_fit(..., pool=pool)
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self._pool = None
+
+    def get(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers)
+        return self._pool
+
+    def terminate(self):
+        """実行中の初期値も止めてプールを捨てる (打ち切った計算が次の領域とCPUを取り合わないように)"""
+        if self._pool is None:
+            return
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def multistart_fit(x, y, peak_infos, n_starts=16, seed=0, time_budget=None, workers=None,
+                   maxfev=MULTISTART_MAXFEV, verbose=True, engine="curve_fit", pool=None):
+    """
+    マルチスタートでフィッティングする関数
+    n_starts: 初期値の数 K (1個目はJSONの初期値)
+    seed: 初期値を選ぶ乱数シード (同じシードなら同じ初期値)
+    time_budget: 秒。これを過ぎたら、まだ始まっていない初期値は打ち切り、実行中の初期値も止めて
+                 それまでの最良の結果を使う
+                 ただし制限時間の確認は最初の結果が出てから行う (1つも結果がないうちは時間切れでも待つ)
+                 workers=1 では初期値と初期値の間でだけ確認する (実行中のフィットは止めない)
+    workers: ワーカープロセス数 (None ならCPU数, 1 なら並列化しない)
+    pool: StartPool (複数の領域で同じプールを使い回す場合。None ならこの呼び出しの中で作って閉じる)
+    engine: フィッティングの方法 (XPSFIT.perform_fitting を参照。varpro では振幅の初期値は使われない)
+    戻り値: (fitted_peaks, y_total, info) perform_fitting(full_output=True) と同じ形
+        info には次も入る: n_starts (実際にフィットした数), n_best (最良値に到達した数),
+                           best_start (最良の初期値の番号), timed_out (時間切れで打ち切ったか)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    points = start_points(x, y, peak_infos, n_starts, seed)
+    jobs = [(x, y, peak_infos, list(p0), maxfev, engine) for p0 in points]
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+    results = {}
+    timed_out = False
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        for k, job in enumerate(jobs):
+            if deadline is not None and time.perf_counter() > deadline and results:
+                timed_out = True
+                break
+            results[k] = _fit_start(job)
+    else:
+        own_pool = pool is None
+        if own_pool:
+            pool = StartPool(min(workers, len(jobs)))
+        # 終わった順に (番号, 結果, 例外) をキューで受け取る
+        finished = queue.Queue()
+        for k, job in enumerate(jobs):
+            pool.get().apply_async(_fit_start, (job,),
+                                   callback=lambda r, k=k: finished.put((k, r, None)),
+                                   error_callback=lambda e, k=k: finished.put((k, None, e)))
+        pending = len(jobs)
+        while pending:
+            # 1つも終わっていなければ、時間切れでも最初の1つは待つ
+            timeout = None
+            if deadline is not None and results:
+                timeout = max(deadline - time.perf_counter(), 0)
+            try:
+                k, result, error = finished.get(timeout=timeout)
+            except queue.Empty:
+                timed_out = True
+                break
+            pending -= 1
+            if error is not None:
+                pool.terminate()
+                raise error
+            results[k] = result
+            if pending and deadline is not None and time.perf_counter() > deadline:
+                timed_out = True
+                break
+        # 時間切れなら、まだ始まっていない初期値は取り消し、実行中のものはプロセスごと止める
+        if timed_out:
+            pool.terminate()
+        elif own_pool:
+            pool.close()
+
+    # 最良 (カイ二乗最小。同じなら番号の小さい方) を選ぶ
+    chi2 = {k: r[2]["chi2"] for k, r in results.items() if r[2]["success"]}
+    if not chi2:
+        if verbose:
+            print("Fitting failed to converge.")
+        info = dict(results[min(results)][2]) if results else {"success": False}
+        info.update(n_starts=len(results), n_best=0, best_start=None, timed_out=timed_out)
+        return None, None, info
+
+    best = min(chi2, key=lambda k: (chi2[k], k))
+    best_chi2 = chi2[best]
+    n_best = sum(1 for c in chi2.values() if c <= best_chi2 * (1 + REACH_RTOL) + 1e-12)
+
+    fitted_peaks, y_total, info = results[best]
+    info = dict(info, n_starts=len(results), n_best=n_best, best_start=best, timed_out=timed_out,
+                nfev=int(sum(r[2]["nfev"] for r in results.values())))
+    if verbose:
+        XPSFIT.print_fit_table(fitted_peaks)
+        print(f"multi-start: {n_best}/{len(results)} starts reached the best chi2 = {best_chi2:.6g}"
+              + (" (time budget reached)" if timed_out else ""))
+    return fitted_peaks, y_total, info
@@ -1,95 +1,267 @@
-import pandas as pd
+import numpy as np
 import os
 
+# pandas / openpyxl は読み込みが重いので、出力する関数の中で読み込む
+
+SUMMARY_SHEET_NAME = "Summary_Result"
+
+def region_columns(i, x_list, y_list, fit_results_list):
+    """
+    i番目の領域の列データ (列名 → 配列) を作る関数
+    Binding Energy, Raw Intensity と、フィッティング結果があれば Background, Total Fit, 各成分
+    """
+    # 1. 基本データ (BE, Raw Intensity)
+    data = {
+        'Binding Energy (eV)': x_list[i],
+        'Raw Intensity': y_list[i]
+    }
+
+    # 2. フィッティング結果がある場合、列を追加 (リストが短い・空の場合は結果なしとみなす)
+    res = fit_results_list[i] if i < len(fit_results_list) else None
+    if res is not None:
+
+        # バックグラウンド
+        data['Background'] = res['y_bg']
+
+        # 全体のフィッティングカーブ (Envelope)
+        data['Total Fit'] = res['y_total']+res['y_bg']
+
+        # 各成分 (Component)
+        for peak in res['peaks']:
+            col_name = f"Comp: {peak['name']}"
+            data[col_name] = peak['y_data']+res['y_bg']
+
+    return data
+
+def summary_tables(tags, fit_results_list, atomic_percent):
+    """
+    Summary_Result シートの内容 (原子組成比の表, フィッティング詳細の表) を行の辞書のリストで返す関数
+    """
+    # (A) 原子組成比 (Atomic %)
+    atomic_data = []
+    for i in range(len(tags)):
+        atomic_data.append({
+            'Element': tags[i],
+            'Atomic %': atomic_percent[i] if i < len(atomic_percent) else None
+        })
+
+    # (B) ピークフィッティング詳細 (Ratioなど)
+    fit_summary_data = []
+    for i, tag in enumerate(tags):
+        res = fit_results_list[i] if i < len(fit_results_list) else None
+        if res is not None:
+            # そのスペクトルに含まれるピーク情報をすべて抽出
+            for peak in res['peaks']:
+                row = {
+                    'Spectrum': tag,
+                    'Component Name': peak['name'],
+                    'Area Ratio (%)': peak['ratio'],
+                    'Position (eV)': peak['center'],
+                    'FWHM (eV)': peak['fwhm'],
+                    'Area': peak['area']
+                }
+                # ブートストラップの信頼区間 (XPSBOOT) があれば列を追加
+                if 'ratio_ci' in peak:
+                    row.update(ci_columns(peak))
+                # マルチスタート (XPSMULTI) の情報があれば列を追加
+                if 'multistart' in res:
+                    row.update(multistart_columns(res['multistart']))
+                fit_summary_data.append(row)
+
+    return atomic_data, fit_summary_data
+
+# 信頼区間の列名 (fitted_peaks のキー → 列名の先頭)
+CI_COLUMNS = [('ratio', 'Area Ratio'), ('center', 'Position'), ('fwhm', 'FWHM'), ('area', 'Area')]
+
+def ci_columns(peak):
+    """成分の信頼区間 (XPSBOOT.bootstrap_fit が追加したもの) を列名 → 値 の辞書にする"""
+    units = {'ratio': ' (%)', 'center': ' (eV)', 'fwhm': ' (eV)', 'area': ''}
+    row = {}
+    for key, label in CI_COLUMNS:
+        low, high = peak[f'{key}_ci']
+        row[f'{label} CI Low{units[key]}'] = low
+        row[f'{label} CI High{units[key]}'] = high
+    row['Bootstrap N'] = peak.get('n_boot', 0)
+    return row
+
+def multistart_columns(info):
+    """マルチスタートの結果 (最良のカイ二乗と、そこに到達した初期値の数) を列名 → 値 の辞書にする"""
+    return {
+        'Chi2': float(info['chi2']),
+        'Starts Reaching Best': int(info['n_best']),
+        'Starts Run': int(info['n_starts'])
+    }
+
 def export_to_excel(save_path, tags, x_list, y_list, fit_results_list, atomic_percent):
     """
     全データをExcelファイルに出力する関数
     save_path: 保存先のファイルパス (.xlsx)
-    tags: タグのリスト
+    tags: タグのリスト (XPSSET.SpectrumSet は tags, x_list, y_list = spectra と分けて渡す)
     x_list, y_list: 全データのx, yリスト
     fit_results_list: フィッティング結果の辞書リスト
+    fit_results_list, atomic_percent は空のリストでもよい (フィッティング結果・原子組成比なしで出力する)
+    戻り値: 保存できたら True, エラーになったら False (エラーは表示する)
     """
-    
+    import pandas as pd
+
     # ExcelWriterを使ってファイルを作成
     try:
         with pd.ExcelWriter(save_path, engine='openpyxl') as writer:
             print(f"\nExcel保存中: {os.path.basename(save_path)} ...")
-            
+
             for i, tag in enumerate(tags):
-                # 1. 基本データ (BE, Raw Intensity)
-                data = {
-                    'Binding Energy (eV)': x_list[i],
-                    'Raw Intensity': y_list[i]
-                }
-                
-                # 2. フィッティング結果がある場合、列を追加
-                if fit_results_list[i] is not None:
-                    res = fit_results_list[i]
-                    
-                    # バックグラウンド
-                    data['Background'] = res['y_bg']
-                    
-                    # 全体のフィッティングカーブ (Envelope)
-                    data['Total Fit'] = res['y_total']+res['y_bg']
-                    
-                    # 各成分 (Component)
-                    for peak in res['peaks']:
-                        col_name = f"Comp: {peak['name']}"
-                        data[col_name] = peak['y_data']+res['y_bg']
+                # 1, 2. 列データ (基本データ + フィッティング結果)
+                data = region_columns(i, x_list, y_list, fit_results_list)
 
                 # 3. DataFrame作成
                 df = pd.DataFrame(data)
-                
+
                 # 4. シート名はタグ名にする (Excelの制限で31文字以内)
-                sheet_name = tag[:31] 
-                
+                sheet_name = tag[:31]
+
                 # 5. 書き込み
                 df.to_excel(writer, sheet_name=sheet_name, index=False)
                 print(f"  -> Sheet '{sheet_name}' output done.")
         # --- 2. 解析結果のまとめシート (Summary) 作成 ---
             # ここからインデントを1つ戻す (forループの外へ)
-            
-            # (A) 原子組成比 (Atomic %)
-            atomic_data = []
-            for i in range(len(tags)):
-                atomic_data.append({
-                    'Element': tags[i],
-                    'Atomic %': atomic_percent[i]
-                })
+            atomic_data, fit_summary_data = summary_tables(tags, fit_results_list, atomic_percent)
             df_atomic = pd.DataFrame(atomic_data)
-            
-            # (B) ピークフィッティング詳細 (Ratioなど)
-            fit_summary_data = []
-            for i, tag in enumerate(tags):
-                res = fit_results_list[i]
-                if res is not None:
-                    # そのスペクトルに含まれるピーク情報をすべて抽出
-                    for peak in res['peaks']:
-                        fit_summary_data.append({
-                            'Spectrum': tag,
-                            'Component Name': peak['name'],
-                            'Area Ratio (%)': peak['ratio'],
-                            'Position (eV)': peak['center'],
-                            'FWHM (eV)': peak['fwhm'],
-                            'Area': peak['area']
-                        })
-            
             df_fit_summary = pd.DataFrame(fit_summary_data)
 
             # --- Summaryシートへの書き込み ---
-            summary_sheet_name = "Summary_Result"
-            
+            summary_sheet_name = SUMMARY_SHEET_NAME
+
             # Atomic % を書き込み (開始位置: 行0, 列0)
             df_atomic.to_excel(writer, sheet_name=summary_sheet_name, startrow=0, startcol=0, index=False)
-            
+
             # タイトル等のために少しスペースを空けて Fitting Result を書き込み
             start_row_fit = len(df_atomic) + 4
-            
+
             df_fit_summary.to_excel(writer, sheet_name=summary_sheet_name, startrow=start_row_fit, startcol=0, index=False)
 
         print("Excel出力が完了しました。")
-        
+        return True
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Excel保存中にエラーが発生しました: {e}")
+        return False
+
+def _append_table(ws, rows):
+    """行の辞書のリストを、見出し行つきでシートに追記する"""
+    if not rows:
+        return 0
+    # 列は pandas.DataFrame と同じく、全行のキーを登場順に並べる (無い値は空欄)
+    columns = []
+    for row in rows:
+        columns += [c for c in row if c not in columns]
+    ws.append(columns)
+    for row in rows:
+        ws.append([_to_cell(row.get(c)) for c in columns])
+    return len(rows) + 1
+
+def _to_cell(value):
+    # openpyxlはnumpyのスカラーをそのまま書けないのでPythonの型に直す
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def export_to_excel_streaming(save_path, tags, x_list, y_list, fit_results_list, atomic_percent):
+    """
+    export_to_excel と同じ内容を、openpyxlの書き込み専用モード (write_only) で出力する関数
+    行をシートごとに順に書き出すため、ブック全体をメモリに保持しない (大量の領域・成分向け)
+    戻り値: 保存できたら True, エラーになったら False (エラーは表示する)
+    """
+    from openpyxl import Workbook
+
+    try:
+        print(f"\nExcel保存中 (ストリーミング): {os.path.basename(save_path)} ...")
+        wb = Workbook(write_only=True)
+
+        for i, tag in enumerate(tags):
+            data = region_columns(i, x_list, y_list, fit_results_list)
+
+            # シート名はタグ名にする (Excelの制限で31文字以内)
+            sheet_name = tag[:31]
+            ws = wb.create_sheet(title=sheet_name)
+            ws.append(list(data.keys()))
+
+            # 列をまとめて2次元配列にしてから1行ずつ追記 (このシートの分だけメモリを使う)
+            table = np.column_stack([np.asarray(col, dtype=float) for col in data.values()])
+            for row in table.tolist():
+                ws.append(row)
+            print(f"  -> Sheet '{sheet_name}' output done.")
+
+        # --- 解析結果のまとめシート (Summary) ---
+        atomic_data, fit_summary_data = summary_tables(tags, fit_results_list, atomic_percent)
+        ws = wb.create_sheet(title=SUMMARY_SHEET_NAME)
+        n_written = _append_table(ws, atomic_data)
+
+        # export_to_excel と同じ位置 (Atomic % の表の4行下) から Fitting Result を書き込み
+        if fit_summary_data:
+            for _ in range(len(atomic_data) + 4 - n_written):
+                ws.append([])
+            _append_table(ws, fit_summary_data)
+
+        wb.save(save_path)
+        print("Excel出力が完了しました。")
+        return True
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Excel保存中にエラーが発生しました: {e}")
+        return False
+
+def export_to_folder(save_dir, tags, x_list, y_list, fit_results_list, atomic_percent, fmt="csv"):
+    """
+    Excelの代わりに、領域ごとのファイルをフォルダに出力する関数 (後段のプログラムで読む用)
+    fmt: "csv" または "parquet" (parquet には pyarrow などが必要)
+    出力:
+        <番号>_<タグ>.<fmt>       : 各シートと同じ列 (Background, Total Fit, Comp: ...)
+        Summary_Atomic.<fmt>      : Summary_Result の原子組成比の表
+        Summary_Fitting.<fmt>     : Summary_Result のフィッティング詳細の表
+    戻り値: 保存できたら True, エラーになったら False (エラーは表示する)
+    """
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"未対応の形式です: {fmt}")
+
+    import pandas as pd
+
+    def write(df, name):
+        path = os.path.join(save_dir, f"{name}.{fmt}")
+        if fmt == "csv":
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+        return path
+
+    try:
+        os.makedirs(save_dir, exist_ok=True)
+        print(f"\n{fmt.upper()}保存中: {save_dir} ...")
+
+        for i, tag in enumerate(tags):
+            data = region_columns(i, x_list, y_list, fit_results_list)
+            # ファイル名に使えない文字は置き換える
+            safe_tag = "".join(c if c.isalnum() or c in "-_." else "_" for c in tag)
+            path = write(pd.DataFrame(data), f"{i:02d}_{safe_tag}")
+            print(f"  -> {os.path.basename(path)} output done.")
+
+        atomic_data, fit_summary_data = summary_tables(tags, fit_results_list, atomic_percent)
+        write(pd.DataFrame(atomic_data, columns=['Element', 'Atomic %']), "Summary_Atomic")
+        fit_columns = ['Spectrum', 'Component Name', 'Area Ratio (%)', 'Position (eV)', 'FWHM (eV)', 'Area']
+        for row in fit_summary_data:
+            fit_columns += [c for c in row if c not in fit_columns]
+        write(pd.DataFrame(fit_summary_data, columns=fit_columns), "Summary_Fitting")
+
+        print(f"{fmt.upper()}出力が完了しました。")
+        return True
+
+    except ImportError as e:
+        print(f"エラー: {fmt} 出力に必要なライブラリがありません ({str(e).splitlines()[0]})。pip install pyarrow を実行してください。")
     except Exception as e:
         import traceback
         traceback.print_exc()
-        print(f"Excel保存中にエラーが発生しました: {e}")
\ No newline at end of file
+        print(f"{fmt.upper()}保存中にエラーが発生しました: {e}")
+    return False
@@ -1,10 +1,17 @@
-import matplotlib.pyplot as plt
+import os
 import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import XPSCAL
 
 def plot_spectra(tags, x_list, y_list):
     """
     データを受け取り、個数に合わせて自動的にレイアウトを調整して描画する関数
     """
+    # matplotlib は読み込みに時間がかかるので、描画するときだけ読み込む
+    import matplotlib.pyplot as plt
+
     n = len(tags)
     if n == 0:
         print("プロットするデータがありません。")
@@ -37,4 +44,125 @@ def plot_spectra(tags, x_list, y_list):
         ax.invert_xaxis() # X軸反転
 
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+# ==========================================
+# 画像ファイルへの一括描画 (画面なし / Aggバックエンド)
+# ==========================================
+# 領域ごとに 生データ, バックグラウンド, 合計フィット, 各成分 を重ねた PNG / SVG を保存する
+# pyplot は使わず Figure と Agg を直接使うので、表示サーバーのない環境やワーカープロセスでも動く
+PLOT_FORMATS = ["png", "svg"]
+# 1つの曲線あたりの最大点数 (これより長いスペクトルは間引く)
+PLOT_MAX_POINTS = 2000
+# 各成分の色 (生データの黒, バックグラウンドの灰色, 合計フィットの赤とは別の色)
+COMPONENT_COLORS = ["C0", "C1", "C2", "C4", "C5", "C6", "C8", "C9"]
+
+
+def envelope_indices(y, max_points=PLOT_MAX_POINTS):
+    """
+    長いスペクトルを間引くときに残す点の番号 (昇順)
+    max_points // 2 個の区間に分け、各区間の最小値と最大値の点を残す (ピークやノイズの幅が消えない)
+    最初と最後の点は必ず残す
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    n_bins = max(max_points // 2, 1)
+    size = -(-n // n_bins)  # 切り上げ
+    # 最後の区間の足りない部分は最後の値で埋める (その点の番号は範囲外になるので後で切る)
+    padded = np.concatenate((y, np.full(n_bins * size - n, y[-1])))
+    blocks = padded.reshape(n_bins, size)
+    start = np.arange(n_bins) * size
+    lo = start + np.argmin(blocks, axis=1)
+    hi = start + np.argmax(blocks, axis=1)
+    idx = np.unique(np.concatenate(([0, n - 1], lo, hi)))
+    return idx[idx < n]
+
+
+def _render_region(args):
+    """
+    1領域を1ファイルに描画する (ProcessPoolExecutor 用にトップレベルに置く)
+    curves: [(ラベル, y, 書式の辞書)] (x と同じ点で間引き済み)
+    """
+    path, title, x, y, curves, size, dpi = args
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.plot(x, y, color="black", linewidth=0.8, label="Raw")
+    for label, y_curve, style in curves:
+        ax.plot(x, y_curve, label=label, **style)
+    ax.set_title(title)
+    ax.set_xlabel('Binding Energy (eV)')
+    ax.set_ylabel('Intensity (counts)')
+    ax.invert_xaxis() # X軸反転
+    if curves:
+        ax.legend(fontsize="x-small", frameon=False)
+    # 余白はインチで固定する (tight_layout は図ごとに2回描画するので、大量に描くと倍近く遅い)
+    w, h = size
+    fig.subplots_adjust(left=0.8 / w, right=1 - 0.15 / w, bottom=0.55 / h, top=1 - 0.35 / h)
+    fig.savefig(path)
+    return path
+
+
+def render_spectra(out_dir, tags, x_list, y_list, fit_results_list=None, fmt="png",
+                   workers=None, background=True, backgrounds=None, baselines=None,
+                   max_points=PLOT_MAX_POINTS, size=(4, 3), dpi=100):
+    """
+    領域ごとの図を画像ファイルに保存する関数 (画面には表示しない)
+    fit_results_list: XPSBATCH.fit_regions の結果。ある領域はバックグラウンド, 合計フィット, 各成分も描く
+    background: True ならフィット結果のない領域にもバックグラウンドを計算して描く
+    backgrounds: {level: バックグラウンドの種類} (無いlevelはShirley)
+    baselines: 1回の解析で共有するベースラインの辞書 (XPSCAL.region_areas を参照)。ある領域は計算し直さない
+    fmt: "png" / "svg", workers: ワーカープロセス数 (None ならCPU数, 1 なら並列化しない)
+    max_points: これより長いスペクトルは最小・最大の包絡線を残して間引く (envelope_indices)
+    出力: out_dir/<番号>_<タグ>.<fmt>
+    戻り値: 保存したファイルのパスのリスト
+    """
+    if fmt not in PLOT_FORMATS:
+        raise ValueError(f"未対応の形式です: {fmt}")
+    if fit_results_list is None:
+        fit_results_list = [None] * len(tags)
+    if backgrounds is None:
+        backgrounds = {}
+    if baselines is None:
+        baselines = {}
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 間引きと曲線の準備は親プロセスで行い、ワーカーには間引いた配列だけを渡す
+    jobs = []
+    for i, tag in enumerate(tags):
+        x = np.asarray(x_list[i], dtype=float)
+        y = np.asarray(y_list[i], dtype=float)
+        res = fit_results_list[i]
+        curves = []
+        if res is not None:
+            y_bg = np.asarray(res['y_bg'])
+            curves.append(("Background", y_bg, {"color": "gray", "linestyle": "--", "linewidth": 0.8}))
+            curves.append(("Total Fit", res['y_total'] + y_bg, {"color": "red", "linewidth": 1.0}))
+            for k, peak in enumerate(res['peaks']):
+                color = COMPONENT_COLORS[k % len(COMPONENT_COLORS)]
+                curves.append((peak['name'], peak['y_data'] + y_bg, {"color": color, "linewidth": 0.8}))
+        elif background and len(x) > 1:
+            method = backgrounds.get(tag, XPSCAL.DEFAULT_BACKGROUND)
+            if (i, method) not in baselines:
+                baselines[(i, method)] = XPSCAL.background_baseline(x, y, method=method)
+            y_bg = baselines[(i, method)][0]
+            curves.append(("Background", y_bg, {"color": "gray", "linestyle": "--", "linewidth": 0.8}))
+
+        idx = envelope_indices(y, max_points)
+        curves = [(label, np.asarray(c)[idx], style) for label, c, style in curves]
+        safe_tag = "".join(c if c.isalnum() or c in "-_." else "_" for c in tag)
+        path = os.path.join(out_dir, f"{i:02d}_{safe_tag}.{fmt}")
+        jobs.append((path, tag, x[idx], y[idx], curves, size, dpi))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        return [_render_region(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(_render_region, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
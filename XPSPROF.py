@@ -0,0 +1,188 @@
+#処理時間・回数の計測 (プロファイル)
+#
+# 使い方:
+#   prof = XPSPROF.RunProfile("sample.csv")
+#   with prof:                                  # この間に呼ばれた計測点が prof に記録される
+#       with XPSPROF.stage("load"):
+#           ...
+#   prof.print_summary()
+#   prof.save("profile.json")
+#
+# 計測中でないとき (有効な RunProfile が無いとき) は stage / count / event は何もしない
+import time
+import json
+import cProfile
+import contextlib
+
+_active = None
+
+
+class RunProfile:
+    """
+    1回の解析 (1ファイル分など) の計測結果
+    stages  : 工程名 → 呼び出し回数・合計時間
+    counters: カウンタ名 → 値
+    events  : 領域ごとの記録 (Shirleyの反復回数・収束、curve_fitのnfev・成否、各領域の処理時間など)
+    cprofile_path: 指定すると計測中は cProfile も動かし、終了時にこのパスへ統計を保存する
+    """
+
+    def __init__(self, name="run", cprofile_path=None):
+        self.name = name
+        self.cprofile_path = cprofile_path
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self.wall_s = 0.0
+        self._labels = {}
+        self._t0 = None
+        self._previous = None
+        self._cprofile = None
+
+    def start(self):
+        global _active
+        self._previous = _active
+        _active = self
+        self._t0 = time.perf_counter()
+        if self.cprofile_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self
+
+    def stop(self):
+        global _active
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        if self._t0 is not None:
+            self.wall_s += time.perf_counter() - self._t0
+            self._t0 = None
+        _active = self._previous
+        self._previous = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        """
+        工程の時間を計る
+        labels (region など) を付けた場合は、その工程の時間を events にも残し、
+        内側で記録される event にも同じ labels を付ける
+        """
+        previous = self._labels
+        self._labels = dict(previous, **labels)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._labels = previous
+            entry = self.stages.setdefault(name, {"calls": 0, "total_s": 0.0})
+            entry["calls"] += 1
+            entry["total_s"] += elapsed
+            if labels:
+                self.events.append(dict(previous, kind="stage", stage=name, elapsed_s=elapsed, **labels))
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def event(self, kind, **fields):
+        self.events.append(dict(self._labels, kind=kind, **fields))
+
+    def report(self):
+        """JSONに保存できる辞書"""
+        return {
+            "name": self.name,
+            "wall_s": self.wall_s,
+            "stages": self.stages,
+            "counters": self.counters,
+            "events": self.events,
+            "cprofile": self.cprofile_path
+        }
+
+    def print_summary(self):
+        print_summary([self.report()])
+
+    def save(self, path):
+        save_report([self.report()], path)
+
+
+def stage(name, **labels):
+    """有効な RunProfile があれば工程の時間を計る (無ければ何もしない)"""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name, **labels)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def event(kind, **fields):
+    if _active is not None:
+        _active.event(kind, **fields)
+
+
+def active():
+    """計測中なら True"""
+    return _active is not None
+
+
+def merge_reports(reports):
+    """複数の report() を工程・カウンタごとに合計する"""
+    stages, counters = {}, {}
+    for rep in reports:
+        for name, s in rep["stages"].items():
+            entry = stages.setdefault(name, {"calls": 0, "total_s": 0.0})
+            entry["calls"] += s["calls"]
+            entry["total_s"] += s["total_s"]
+        for name, n in rep["counters"].items():
+            counters[name] = counters.get(name, 0) + n
+    return {"stages": stages, "counters": counters,
+            "wall_s": sum(rep["wall_s"] for rep in reports)}
+
+
+def save_report(reports, path):
+    """report() のリストを合計と一緒にJSONで保存する"""
+    data = {"total": merge_reports(reports), "runs": reports}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=float)
+    return path
+
+
+def print_summary(reports, top=10):
+    """工程ごとの合計時間、Shirley・curve_fit の集計、時間のかかった領域を表示する"""
+    total = merge_reports(reports)
+    print(f"\n--- Profile ({len(reports)} run(s), wall {total['wall_s']:.3f} s) ---")
+    print(f"{'Stage':<16} | {'calls':>6} | {'total (s)':>10} | {'mean (ms)':>10}")
+    for name, s in sorted(total["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"{name:<16} | {s['calls']:>6} | {s['total_s']:>10.3f} | {s['total_s'] / s['calls'] * 1000:>10.2f}")
+
+    events = [dict(e, run=rep["name"]) for rep in reports for e in rep["events"]]
+
+    shirley = [e for e in events if e["kind"] == "shirley"]
+    if shirley:
+        not_converged = sum(1 for e in shirley if not e["converged"])
+        print(f"shirley   : {len(shirley)} calls, {sum(e['iterations'] for e in shirley)} iterations, "
+              f"max {max(e['iterations'] for e in shirley)}, not converged {not_converged}")
+
+    fits = [e for e in events if e["kind"] == "curve_fit"]
+    if fits:
+        failed = sum(1 for e in fits if not e["success"])
+        print(f"curve_fit : {len(fits)} fits, nfev {sum(e['nfev'] for e in fits)}, failed {failed}")
+
+    for name, n in sorted(total["counters"].items()):
+        print(f"{name:<10}: {n}")
+
+    regions = sorted((e for e in events if e["kind"] == "stage" and "region" in e),
+                     key=lambda e: -e["elapsed_s"])[:top]
+    if regions:
+        print("slowest regions:")
+        for e in regions:
+            print(f"  {e['elapsed_s'] * 1000:>9.1f} ms  {e['stage']:<8} {e['region']:<10} {e['run']}")
@@ -0,0 +1,167 @@
+#深さ方向分析 (スパッタ) など、連続したスペクトルのフィッティング用
+import os
+import json
+import argparse
+import numpy as np
+
+import XPSASC
+import XPSCAL
+import XPSFIT
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PEAKFIT_PATH = os.path.join(BASE_DIR, 'peakfit.json')
+
+# 前サイクルよりカイ二乗がこの倍率を超えて悪化したら「発散」とみなしてJSONの初期値でやり直す
+DIVERGENCE_RATIO = 10.0
+# 前サイクルから始めたフィットの評価回数の上限 (超えたらJSONの初期値でやり直す)
+WARM_MAXFEV = 200
+
+
+def fit_series(x_list, y_list, peak_infos, warm_start=True, subtract_background=True,
+               divergence_ratio=DIVERGENCE_RATIO, warm_maxfev=WARM_MAXFEV, verbose=False,
+               background=XPSCAL.DEFAULT_BACKGROUND, engine="curve_fit"):
+    """
+    同じlevelのスペクトル列を順にフィッティングする関数
+    warm_start: True なら前のサイクルの収束結果 (popt) を次の初期値にする
+    background: バックグラウンドの種類 ("shirley" / "tougaard")
+    engine: フィッティングの方法 ("curve_fit" / "varpro"、XPSFIT.perform_fitting を参照)
+    発散した場合 (失敗 / warm_maxfev 回で収束しない / 非有限 / カイ二乗が divergence_ratio 倍以上に悪化) は
+    JSONの初期値でやり直す
+    戻り値: DataFrame (1行 = 1サイクル × 1成分)
+        cycle, component, amplitude, center, fwhm, mix_ratio, area, ratio,
+        chi2, nfev, warm_started (採用した結果が前サイクルからの開始か), success
+    """
+    import pandas as pd
+
+    rows = []
+    prev_popt = None
+    prev_chi2 = None
+
+    for cycle, (x, y) in enumerate(zip(x_list, y_list)):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        # バックグラウンド除去 (Shirley法 / Tougaard法)
+        if subtract_background:
+            y_bg, _, _ = XPSCAL.background_baseline(x, y, method=background)
+            y_fit = y - y_bg
+            y_fit[y_fit < 0] = 0
+        else:
+            y_fit = y
+
+        # --- 1. 前サイクルの結果から開始 ---
+        result = None
+        warm_started = False
+        nfev_total = 0
+        if warm_start and prev_popt is not None:
+            peaks, _, info = XPSFIT.perform_fitting(x, y_fit, peak_infos, verbose=False,
+                                                    full_output=True, p0=prev_popt, maxfev=warm_maxfev,
+                                                    engine=engine)
+            nfev_total += info["nfev"] if info["success"] else warm_maxfev
+            diverged = (not info["success"]
+                        or not np.all(np.isfinite(info["popt"]))
+                        or (prev_chi2 is not None and prev_chi2 > 0
+                            and info["chi2"] > divergence_ratio * prev_chi2))
+            if not diverged:
+                result = (peaks, info)
+                warm_started = True
+            elif verbose:
+                print(f"  cycle {cycle}: warm start diverged -> JSONの初期値でやり直します")
+
+        # --- 2. JSONの初期値から開始 (初回 / 発散時) ---
+        if result is None:
+            peaks, _, info = XPSFIT.perform_fitting(x, y_fit, peak_infos, verbose=False, full_output=True,
+                                                    engine=engine)
+            nfev_total += info["nfev"]
+            result = (peaks, info)
+
+        peaks, info = result
+        if info["success"]:
+            prev_popt = info["popt"]
+            prev_chi2 = info["chi2"]
+            for p in peaks:
+                rows.append({
+                    "cycle": cycle,
+                    "component": p["name"],
+                    "amplitude": p["amplitude"],
+                    "center": p["center"],
+                    "fwhm": p["fwhm"],
+                    "mix_ratio": p["mix_ratio"],
+                    "area": p["area"],
+                    "ratio": p["ratio"],
+                    "chi2": info["chi2"],
+                    "nfev": nfev_total,
+                    "warm_started": warm_started,
+                    "success": True
+                })
+        else:
+            # 失敗したサイクルは NaN の行を残し、次はJSONの初期値から始める
+            prev_popt = None
+            prev_chi2 = None
+            for p in peak_infos:
+                rows.append({
+                    "cycle": cycle, "component": p["name"],
+                    "amplitude": np.nan, "center": np.nan, "fwhm": np.nan, "mix_ratio": np.nan,
+                    "area": np.nan, "ratio": np.nan, "chi2": np.nan,
+                    "nfev": nfev_total, "warm_started": False, "success": False
+                })
+
+        if verbose:
+            print(f"  cycle {cycle}: nfev={nfev_total} warm={warm_started} success={info['success']}")
+
+    return pd.DataFrame(rows)
+
+
+def series_from_files(paths, level):
+    """
+    ファイルのリストから、指定したlevelの領域を順に取り出す関数
+    1ファイルに同じタグが複数ある場合 (深さ方向分析のエクスポートなど) は、そのすべてを順に使う
+    戻り値: (x_list, y_list, sources) sources は (ファイル名, ファイル内の番号) のリスト
+    """
+    x_list, y_list, sources = [], [], []
+    for path in paths:
+        spectra = XPSASC.load_allspe(path)
+        for k, i in enumerate(spectra.indices(level)):
+            x, y = spectra.region(i)
+            x_list.append(x)
+            y_list.append(y)
+            sources.append((os.path.basename(path), k))
+    return x_list, y_list, sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="連続スペクトル (深さ方向分析) のフィッティング")
+    parser.add_argument('files', nargs='+', help="CSVファイル (指定順 = サイクル順)")
+    parser.add_argument('--level', required=True, help="フィッティングするlevel (例: Cu2p3)")
+    parser.add_argument('-o', '--output', default='series_result.csv', help="結果の出力先 (CSV)")
+    parser.add_argument('--peakfit', default=DEFAULT_PEAKFIT_PATH, help="peakfit.json のパス")
+    parser.add_argument('--no-warm-start', action='store_true', help="毎回JSONの初期値から始める")
+    parser.add_argument('--background', default=XPSCAL.DEFAULT_BACKGROUND, choices=XPSCAL.BACKGROUND_METHODS,
+                        help="バックグラウンドの種類")
+    parser.add_argument('--engine', default='curve_fit', choices=XPSFIT.FIT_ENGINES,
+                        help="フィッティングの方法 (varpro: 振幅を線形に解く)")
+    args = parser.parse_args(argv)
+
+    with open(args.peakfit, 'r') as f:
+        peak_db = json.load(f)
+    peak_infos = [p for p in peak_db if p["level"] == args.level]
+    if not peak_infos:
+        print(f"エラー: peakfit.json に {args.level} の設定がありません。")
+        return 1
+
+    x_list, y_list, sources = series_from_files(args.files, args.level)
+    print(f"{args.level}: {len(x_list)} スペクトル")
+    if not x_list:
+        print(f"エラー: 指定したファイルに {args.level} の領域がありません。")
+        return 1
+
+    table = fit_series(x_list, y_list, peak_infos, warm_start=not args.no_warm_start, verbose=True,
+                       background=args.background, engine=args.engine)
+    table.insert(1, "file", [sources[c][0] for c in table["cycle"]])
+    table.to_csv(args.output, index=False)
+    print(f"保存: {args.output} (合計 nfev = {table.groupby('cycle')['nfev'].first().sum()})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,514 @@
+#常駐解析サービス (asyncio の HTTP / Unixソケット API)
+#
+# XPS_analyzer.py を毎回起動すると、Python の起動・scipy などの読み込み・RSF.json / peakfit.json の読み込みが毎回かかる
+# このサービスは1回だけ起動しておき、設定とワーカープロセスを温めたまま解析の依頼を受け付ける
+#   POST /analyze : 原子組成比とフィット結果を JSON で返す
+#                   本文は スペクトルCSV (XPSASC.load_allspe と同じ形式) または JSON
+#   GET  /health  : 状態 (ワーカー数, 処理中の件数, 設定ファイル)
+# JSON の形式:
+#   {"path": "D:/data/sample.csv"}                                      サービスと同じマシンにあるファイル
+#                                                                        (--data-root で許可したフォルダの中だけ。無ければ 403)
+#   {"spectra": {"tags": [...], "x": [[...], ...], "y": [[...], ...]}}  領域ごとの配列
+#   {"spectra": {"tags": [...], "x": [...], "y": [...], "offsets": [...], "lengths": [...]}}
+#                                                                        XPSSET.SpectrumSet と同じ連結形式
+#   オプション: "x_min", "x_max", "standard" (帯電補正), "engine" (XPSFIT.FIT_ENGINES)
+#   (CSVを送る場合は /analyze?engine=varpro のようにURLで指定する)
+# 処理中と待ちの件数の合計が max_pending に達していると、待たせずに 503 (Retry-After) を返す (バックプレッシャー)
+import os
+import json
+import math
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import http.client
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import XPSASC
+import XPSFIT
+import XPSSET
+import XPSBATCH
+import XPSCACHE
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 本文の上限 (これより大きい依頼は 413 で断る)
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# 本文で受け付けるオプション (値は float。engine だけは文字列)
+FLOAT_OPTIONS = ["x_min", "x_max", "standard"]
+
+
+# ==========================================
+# ワーカー側 (ProcessPoolExecutor の各プロセス、または workers=1 のときはサービスのプロセス)
+# ==========================================
+# ワーカーごとに読み込んだ設定 {config_key: (rsf_list, peak_db)} とフィットキャッシュ
+_CONFIGS = {}
+_CACHE = {}
+
+
+def config_key(rsf_path, peakfit_path):
+    """
+    設定ファイルの ((パス, 更新時刻), (パス, 更新時刻))
+    依頼ごとにサービス側で作ってワーカーに渡し、変わっていればワーカーが読み直す (再起動は不要)
+    """
+    key = []
+    for path in (rsf_path, peakfit_path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        key.append((path, mtime))
+    return tuple(key)
+
+
+def _configs(key):
+    if key not in _CONFIGS:
+        _CONFIGS.clear()
+        _CONFIGS[key] = XPSBATCH.load_config(key[0][0], key[1][0])
+    return _CONFIGS[key]
+
+
+def warm_worker(key, use_cache=True):
+    """
+    ワーカーの準備 (設定の読み込み・scipy の読み込み・フィットキャッシュの作成)
+    プールの initializer として、作り直したプロセスも含めて全ワーカーで必ず1回実行される
+    設定が壊れていてもここでは失敗させない (依頼ごとに読み直し、エラーはその応答で返す)
+    """
+    import scipy.optimize  # noqa: F401  (最初のフィットで読み込むと、その依頼だけ遅くなる)
+    _CACHE["cache"] = XPSCACHE.FitCache(enabled=use_cache)
+    try:
+        _configs(key)
+    except (OSError, ValueError):
+        pass
+
+
+def _worker_pid():
+    """ワーカーを起動させるための空の仕事 (initializer が走った後に実行される)"""
+    return os.getpid()
+
+
+def allowed_path(path, data_roots):
+    """
+    path (シンボリックリンクをたどった実体) が data_roots のどれかのフォルダの中にあるか
+    data_roots: os.path.realpath 済みのフォルダのリスト (空なら常に False)
+    """
+    real = os.path.realpath(path)
+    for root in data_roots:
+        try:
+            if os.path.commonpath([real, root]) == root:
+                return True
+        except ValueError:
+            pass  # Windows で別ドライブ
+    return False
+
+
+def parse_request(body, content_type="", query=None, data_roots=()):
+    """
+    依頼の本文を (SpectrumSet, オプションの辞書) にする関数
+    data_roots: {"path": ...} で読んでよいフォルダ (realpath 済み)。この外のファイルは PermissionError
+    解釈できない場合は ValueError
+    """
+    options = {}
+    if content_type.startswith("application/json") or body.lstrip()[:1] == b"{":
+        payload = json.loads(body.decode("utf-8"))
+        if not isinstance(payload, dict):
+            raise ValueError("JSON はオブジェクトで送ってください。")
+        if "path" in payload:
+            path = payload["path"]
+            # サービスの利用者が読めるファイルを何でも開けないよう、許可したフォルダの中だけにする
+            if not isinstance(path, str) or not allowed_path(path, data_roots):
+                raise PermissionError(f"許可されていない場所のファイルです: {path}")
+            if not os.path.isfile(path):
+                raise ValueError(f"ファイルが見つかりません: {path}")
+            spectra = XPSASC.load_allspe(path, binary_cache=False)
+        elif "spectra" in payload:
+            data = payload["spectra"]
+            if "offsets" in data:
+                spectra = XPSSET.SpectrumSet(data["tags"], data["x"], data["y"], data["offsets"], data["lengths"])
+            else:
+                spectra = XPSSET.SpectrumSet.from_lists(data["tags"], data["x"], data["y"])
+        else:
+            raise ValueError('"path" または "spectra" が必要です。')
+        options.update({k: payload[k] for k in FLOAT_OPTIONS + ["engine"] if k in payload})
+    else:
+        spectra = XPSASC.parse_allspe_bytes(body)
+        if spectra is None:
+            raise ValueError("CSVを解釈できません。")
+
+    # URL のオプション (CSVを送る場合)
+    for k, values in (query or {}).items():
+        if k in FLOAT_OPTIONS or k == "engine":
+            options[k] = values[-1]
+
+    for k in FLOAT_OPTIONS:
+        if k in options:
+            options[k] = float(options[k])
+    if options.get("engine", "curve_fit") not in XPSFIT.FIT_ENGINES:
+        raise ValueError(f"未対応のフィッティング方法です: {options['engine']}")
+    if spectra.n_regions == 0:
+        raise ValueError("データがありません。")
+    return spectra, options
+
+
+def run_job(body, content_type, query, key, data_roots=()):
+    """
+    1件の解析 (ワーカーで実行する)
+    data_roots: parse_request を参照
+    戻り値: (HTTPステータス, 結果の辞書)
+    """
+    t0 = time.perf_counter()
+    try:
+        rsf_list, peak_db = _configs(key)
+    except (OSError, ValueError) as e:
+        # 設定ファイルを編集中 (JSONが壊れている) など。直れば次の依頼で読み直す
+        return 500, {"status": "error", "error": f"設定ファイルを読み込めません: {type(e).__name__}: {e}"}
+    cache = _CACHE["cache"]
+    try:
+        spectra, options = parse_request(body, content_type, query, data_roots)
+    except PermissionError as e:
+        return 403, {"status": "error", "error": str(e)}
+    except (ValueError, KeyError, TypeError) as e:
+        return 400, {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    engine = options.pop("engine", "curve_fit")
+    fit_options = {"engine": engine} if engine != "curve_fit" else {}
+    try:
+        pp, fit_results_list = XPSBATCH.analyze_spectra(spectra, rsf_list, peak_db, cache=cache,
+                                                        fit_options=fit_options, **options)
+        atomic, fits = XPSBATCH.summarize_results(spectra.tags, pp, fit_results_list)
+    except Exception as e:
+        return 500, {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    return 200, {
+        "status": "ok",
+        "regions": spectra.n_regions,
+        "tags": spectra.tags,
+        "energy_shift": float(spectra.energy_shift),
+        "atomic_percent": atomic,
+        "fits": fits,
+        "seconds": time.perf_counter() - t0
+    }
+
+
+def _finite(value):
+    """JSON にできない NaN / Inf を None にする"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+
+# ==========================================
+# サービス側 (asyncio)
+# ==========================================
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+                504: "Gateway Timeout"}
+
+
+class AnalysisService:
+    """
+    解析の依頼を受け付け、温めたワーカープールで実行するサービス
+    workers: ワーカープロセス数 (None ならCPU数, 1 ならサービスのプロセス内のスレッドで順に実行する)
+    max_pending: 処理中と待ちの合計の上限 (None なら workers の2倍)。超えた依頼には 503 を返す
+    timeout: 1件の制限時間 (秒)。超えたら 504 を返す (ワーカーの計算はそのまま最後まで行われる)
+    data_roots: {"path": ...} の依頼で読んでよいフォルダのリスト (None なら path の依頼は受け付けない)
+    """
+
+    def __init__(self, rsf_path=XPSBATCH.DEFAULT_RSF_PATH, peakfit_path=XPSBATCH.DEFAULT_PEAKFIT_PATH,
+                 workers=None, max_pending=None, timeout=None, use_cache=True, max_body=MAX_BODY_BYTES,
+                 data_roots=None):
+        self.rsf_path = rsf_path
+        self.peakfit_path = peakfit_path
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_pending = max_pending if max_pending is not None else 2 * self.workers
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.max_body = max_body
+        self.data_roots = tuple(os.path.realpath(root) for root in data_roots or [])
+        self.pending = 0
+        self.stats = {"ok": 0, "error": 0, "rejected": 0, "timeout": 0}
+        self.started = time.time()
+        self._pool = None
+        self._servers = []
+
+    def _new_pool(self):
+        # 各ワーカーは initializer (warm_worker) で準備してから仕事を受け取る
+        initargs = (config_key(self.rsf_path, self.peakfit_path), self.use_cache)
+        if self.workers == 1:
+            return ThreadPoolExecutor(max_workers=1, initializer=warm_worker, initargs=initargs)
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker, initargs=initargs)
+
+    async def warm_up(self):
+        """プールを作り、空の仕事を送ってワーカーを起動しておく (最初の依頼で起動を待たないように)"""
+        loop = asyncio.get_running_loop()
+        self._pool = self._new_pool()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _worker_pid) for _ in range(self.workers)])
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        """ワーカーを準備してから待ち受けを始める (socket_path を指定すると Unixソケットで待ち受ける)"""
+        await self.warm_up()
+        if socket_path:
+            server = await asyncio.start_unix_server(self._handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        self._servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def analyze(self, body, content_type="", query=None):
+        """
+        1件の解析 (HTTP を通さずに呼ぶこともできる)
+        戻り値: (HTTPステータス, 結果の辞書)
+        """
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return 503, {"status": "busy", "error": f"{self.pending} 件処理中です。しばらくしてから送り直してください。"}
+
+        loop = asyncio.get_running_loop()
+        key = config_key(self.rsf_path, self.peakfit_path)
+        pool = self._pool
+        future = loop.run_in_executor(pool, run_job, body, content_type, query, key, self.data_roots)
+        # 件数はワーカーの計算が本当に終わった時に減らす (時間切れで応答した後も計算中は数える)
+        self.pending += 1
+        future.add_done_callback(self._release)
+        try:
+            status, result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeout"] += 1
+            return 504, {"status": "error", "error": f"{self.timeout:g} 秒以内に終わりませんでした。"}
+        except BrokenProcessPool:
+            # ワーカーが落ちた場合はプールを作り直す (この依頼はエラーで返す)
+            # 同時に失敗した他の依頼が作り直した後なら、もう一度は作らない
+            if pool is self._pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                await self.warm_up()
+            self.stats["error"] += 1
+            return 500, {"status": "error", "error": "ワーカープロセスが異常終了しました。"}
+        except Exception as e:
+            self.stats["error"] += 1
+            return 500, {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        self.stats["ok" if status == 200 else "error"] += 1
+        return status, result
+
+    def health(self):
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "requests": dict(self.stats),
+            "uptime": time.time() - self.started,
+            "config": {"rsf": self.rsf_path, "peakfit": self.peakfit_path},
+            "data_roots": list(self.data_roots)
+        }
+
+    async def _route(self, method, path, query, headers, body):
+        if path == "/health":
+            if method != "GET":
+                return 405, {"status": "error", "error": "GET を使ってください。"}
+            return 200, self.health()
+        if path == "/analyze":
+            if method != "POST":
+                return 405, {"status": "error", "error": "POST を使ってください。"}
+            return await self.analyze(body, headers.get("content-type", ""), query)
+        return 404, {"status": "error", "error": f"不明なパスです: {path}"}
+
+    async def _read_head(self, reader):
+        """
+        リクエスト行とヘッダーを読む
+        戻り値: (method, target, version, headers, 本文のバイト数)。接続が閉じられたら None
+        不正な形式は ValueError (呼び出し側で 400 を返す)
+        """
+        request_line = await reader.readline()  # 長すぎる行も ValueError (LimitOverrunError)
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("不正なリクエスト行です。")
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = headers.get("content-length", "0").strip() or "0"
+        if not length.isdigit():
+            raise ValueError(f"Content-Length が不正です: {length}")
+        return method, target, version, headers, int(length)
+
+    async def _handle(self, reader, writer):
+        """1つの接続 (HTTP/1.1 の keep-alive なら同じ接続で続けて依頼を受ける)"""
+        try:
+            while True:
+                try:
+                    head = await self._read_head(reader)
+                except ValueError as e:
+                    await self._respond(writer, 400, {"status": "error", "error": str(e)}, False)
+                    break
+                if head is None:
+                    break
+                method, target, version, headers, length = head
+
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"status": "error",
+                                                      "error": f"本文が大きすぎます ({length} バイト)。"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                url = urllib.parse.urlsplit(target)
+                query = urllib.parse.parse_qs(url.query)
+                try:
+                    status, result = await self._route(method.upper(), url.path, query, headers, body)
+                except Exception as e:
+                    # 想定外のエラーも応答を返してから接続を閉じる (黙って切断しない)
+                    print(f"エラー: {method} {target}: {type(e).__name__}: {e}")
+                    await self._respond(writer, 500, {"status": "error", "error": f"{type(e).__name__}: {e}"}, False)
+                    break
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # クライアントが途中で切断した (応答を返す相手がいない)
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, result, keep_alive):
+        data = json.dumps(_finite(result), ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, **kwargs):
+    """サービスを起動して終了まで待つ関数 (kwargs は AnalysisService にそのまま渡す)"""
+    service = AnalysisService(**kwargs)
+    t0 = time.perf_counter()
+    server = await service.start(host, port, socket_path=socket_path)
+    where = socket_path if socket_path else f"http://{host}:{port}"
+    print(f"準備完了 ({time.perf_counter() - t0:.1f} 秒, ワーカー {service.workers}): {where}")
+
+    # SIGTERM / SIGINT で後片付け (プールの停止・ソケットファイルの削除) をしてから終わる
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows では Ctrl+C (KeyboardInterrupt) で止める
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        await service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# ==========================================
+# クライアント (LIMS 連携やスクリプトから使う同期版)
+# ==========================================
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def submit(source, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=60, **options):
+    """
+    サービスに1件送り、(HTTPステータス, 結果の辞書) を返す関数
+    source: スペクトルCSVのパス (本文として送る) / XPSSET.SpectrumSet / JSON にする辞書
+    options: x_min, x_max, standard, engine
+    """
+    if isinstance(source, XPSSET.SpectrumSet):
+        source = {"spectra": {"tags": source.tags, "x": source.x.tolist(), "y": source.y.tolist(),
+                              "offsets": source.offsets.tolist(), "lengths": source.lengths.tolist()}}
+    if isinstance(source, dict):
+        body = json.dumps(dict(source, **options)).encode("utf-8")
+        content_type = "application/json"
+        target = "/analyze"
+    else:
+        with open(source, "rb") as f:
+            body = f.read()
+        content_type = "text/csv"
+        target = "/analyze" + ("?" + urllib.parse.urlencode(options) if options else "")
+
+    if socket_path:
+        conn = _UnixHTTPConnection(socket_path, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("POST", target, body=body, headers={"Content-Type": content_type})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XPS解析の常駐サービス (設定とワーカーを温めたまま依頼を受け付ける)")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="待ち受けるアドレス (既定: このマシンのみ)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    parser.add_argument('--socket', default=None, metavar='PATH', help="TCPの代わりに Unixソケットで待ち受ける")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="ワーカープロセス数 (既定: CPU数, 1 ならサービスのプロセス内で実行)")
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="処理中と待ちの合計の上限。超えた依頼には 503 を返す (既定: ワーカー数の2倍)")
+    parser.add_argument('--timeout', type=float, default=None, metavar='SEC', help="1件の制限時間 (秒)")
+    parser.add_argument('--rsf', default=XPSBATCH.DEFAULT_RSF_PATH, help="RSF.json のパス")
+    parser.add_argument('--peakfit', default=XPSBATCH.DEFAULT_PEAKFIT_PATH, help="peakfit.json のパス")
+    parser.add_argument('--no-cache', action='store_true', help="フィッティング結果のキャッシュを使わない")
+    parser.add_argument('--data-root', action='append', default=None, metavar='DIR',
+                        help='{"path": ...} の依頼で読んでよいフォルダ (複数指定可。指定しなければ path の依頼は断る)')
+    parser.add_argument('--submit', default=None, metavar='CSV',
+                        help="サービスを起動せず、起動中のサービスにこのファイルを送って結果を表示する")
+    args = parser.parse_args(argv)
+
+    if args.submit:
+        status, result = submit(args.submit, host=args.host, port=args.port, socket_path=args.socket)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0 if status == 200 else 1
+
+    try:
+        asyncio.run(serve(args.host, args.port, socket_path=args.socket, rsf_path=args.rsf,
+                          peakfit_path=args.peakfit, workers=args.workers, max_pending=args.max_pending,
+                          timeout=args.timeout, use_cache=not args.no_cache, data_roots=args.data_root))
+    except KeyboardInterrupt:
+        print("終了します。")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
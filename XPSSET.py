@@ -0,0 +1,107 @@
+#スペクトルの入れ物 (全領域の x, y をそれぞれ1本の連続した配列にまとめて持つ)
+#
+# 領域ごとに別々の配列をリストで持つと、スペクトルが数千あるバッチでは配列オブジェクトの分だけ
+# メモリと時間がかかり、帯電補正でも全領域をコピーしていた
+# SpectrumSet は x, y を1本ずつの配列に連結し、各領域を開始位置 (offsets) と点数 (lengths) で区切る
+#   spectra.region(i) / spectra["C1s"] : 領域の (x, y) (コピーしないビュー)
+#   spectra.shift_energy(dE)           : 全領域の x をその場でずらす (コピーしない)
+#   tags, x_list, y_list = spectra     : 従来の (タグ, x のリスト, y のリスト) に分けられる (各要素はビュー)
+# (tags, x_list, y_list) を受け取る関数 (XPSCAL, XPSBATCH, XPSOUTPUTXL など) には、こう分けてから渡す
+# (その場で補正する帯電補正などは XPSCAL.shift_spectra / atomic_percent_spectra を使う)
+import numpy as np
+
+
+class SpectrumSet:
+    __slots__ = ("tags", "x", "y", "offsets", "lengths", "tag_index", "energy_shift", "metadata")
+
+    def __init__(self, tags, x, y, offsets, lengths, metadata=None):
+        """
+        tags: 領域ごとのタグ, x, y: 全領域を連結した1次元配列
+        offsets, lengths: 各領域の x, y 中の開始位置と点数
+        """
+        self.tags = list(tags)
+        self.x = np.ascontiguousarray(x, dtype=float)
+        self.y = np.ascontiguousarray(y, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64).reshape(-1)
+        self.lengths = np.asarray(lengths, dtype=np.int64).reshape(-1)
+        if not (len(self.tags) == len(self.offsets) == len(self.lengths)) or len(self.x) != len(self.y):
+            raise ValueError("SpectrumSet: タグ・開始位置・点数の数、または x と y の長さが一致しません。")
+        if len(self.tags) and np.any(self.offsets + self.lengths > len(self.x)):
+            raise ValueError("SpectrumSet: 領域が配列の範囲外です。")
+        # タグ → 領域番号 (同じタグが複数ある場合は最初のもの。すべては indices(tag) で)
+        self.tag_index = {}
+        for i, tag in enumerate(self.tags):
+            self.tag_index.setdefault(tag, i)
+        self.energy_shift = 0.0  # shift_energy でずらした合計 (eV)
+        self.metadata = metadata if metadata is not None else {}
+
+    @classmethod
+    def from_lists(cls, tags, x_list, y_list, metadata=None):
+        """(タグ, x のリスト, y のリスト) から作る (連結のため1回だけコピーする)"""
+        lengths = np.array([len(x) for x in x_list], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+        x = np.concatenate([np.asarray(x, dtype=float) for x in x_list]) if len(lengths) else np.zeros(0)
+        y = np.concatenate([np.asarray(y, dtype=float) for y in y_list]) if len(lengths) else np.zeros(0)
+        return cls(tags, x, y, offsets, lengths, metadata=metadata)
+
+    @property
+    def n_regions(self):
+        return len(self.tags)
+
+    def region(self, i):
+        """i番目の領域の (x, y) ビュー"""
+        start = self.offsets[i]
+        stop = start + self.lengths[i]
+        return self.x[start:stop], self.y[start:stop]
+
+    def indices(self, tag):
+        """タグが tag の領域番号のリスト"""
+        return [i for i, t in enumerate(self.tags) if t == tag]
+
+    def __getitem__(self, key):
+        """spectra[i] / spectra["C1s"] で領域の (x, y) ビュー"""
+        if isinstance(key, str):
+            if key not in self.tag_index:
+                raise KeyError(key)
+            key = self.tag_index[key]
+        return self.region(key)
+
+    def __contains__(self, tag):
+        return tag in self.tag_index
+
+    @property
+    def x_list(self):
+        return [self.x[s : s + n] for s, n in zip(self.offsets, self.lengths)]
+
+    @property
+    def y_list(self):
+        return [self.y[s : s + n] for s, n in zip(self.offsets, self.lengths)]
+
+    def __iter__(self):
+        """tags, x_list, y_list = spectra と分けられるようにする"""
+        return iter((self.tags, self.x_list, self.y_list))
+
+    def shift_energy(self, value):
+        """
+        全領域の x に value を足す (その場で書き換える)
+        読み取り専用 (メモリマップなど) の場合だけ、連結配列を1回コピーしてから書き換える
+        戻り値: self
+        """
+        if not self.x.flags.writeable:
+            self.x = self.x.copy()
+        self.x += value
+        self.energy_shift += value
+        return self
+
+    def copy(self):
+        new = SpectrumSet(self.tags, self.x.copy(), self.y.copy(), self.offsets, self.lengths,
+                          metadata=dict(self.metadata))
+        new.energy_shift = self.energy_shift
+        return new
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.offsets.nbytes + self.lengths.nbytes
+
+    def __repr__(self):
+        return f"SpectrumSet({self.n_regions} regions, {len(self.x)} points, shift={self.energy_shift:+.3f} eV)"
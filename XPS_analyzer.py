@@ -15,8 +15,14 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
 import XPSASC
 import XPSCAL
 import XPSPLOTUI
-import XPSFIT
 import XPSOUTPUTXL
+import XPSBATCH
+import XPSPROF
+
+# 環境変数 XPS_PROFILE=<JSONのパス> で工程ごとの時間・回数を計測 (XPS_CPROFILE=<.profのパス> で cProfile も)
+prof = None
+if os.environ.get("XPS_PROFILE") or os.environ.get("XPS_CPROFILE"):
+    prof = XPSPROF.RunProfile(name="XPS_analyzer", cprofile_path=os.environ.get("XPS_CPROFILE")).start()
 
 # ==========================================
 # 1. データファイルの選択と読み込み
@@ -30,28 +36,46 @@ if not data_path:
     print("ファイルが選択されませんでした。プログラムを終了します。")
     sys.exit()
 
-# ASCⅡデータの取り込み
-tag, x, y = XPSASC.load_allspe(path=data_path)
+# ASCⅡデータの取り込み (全領域を1つの XPSSET.SpectrumSet にまとめて持つ)
+with XPSPROF.stage("load"):
+    spectra = XPSASC.load_allspe(path=data_path)
+tag = spectra.tags
 print(f"読み込み完了: {os.path.basename(data_path)}")
 
 # ==========================================
 # 2. 帯電補正 (Charge Correction)
 # ==========================================
-# C1sのピーク位置を基準(standard)に合わせて全体をシフト
+# C1sのピーク位置を基準(standard)に合わせて全体をシフト (spectra の x をその場で補正)
 print("\n--- 帯電補正を実行中 (C1s基準) ---")
-x, y = XPSCAL.shift(tags=tag, x_before=x, y_before=y, x_min=280, x_max=290, standard=284.4)
+with XPSPROF.stage("shift"):
+    XPSCAL.shift_spectra(spectra, x_min=280, x_max=290, standard=284.4)
+# 補正後の各領域 (ビュー)
+_, x_list, y_list = spectra
 
 
 # ==========================================
 # 3. 原子組成比の計算 (Atomic %)
 # ==========================================
 print("\n--- 原子組成比 (Atomic %) ---")
+RSF = []
+pp = []  # 原子組成比 (RSF.json が無ければ空のまま出力する)
+# peakfit.json (フィッティングの設定。成分の "background" は原子組成比のバックグラウンドにも使う)
+peak_db = None
+try:
+    with open('peakfit.json', 'r') as f:
+        peak_db = json.load(f)
+except FileNotFoundError:
+    pass
+# 各領域のバックグラウンド (原子組成比で計算したものをフィッティング・Excel出力でも使う)
+baselines = {}
 try:
     with open('RSF.json', 'r') as f:
         RSF = json.load(f)
     
     # ここでXPSCAL内のatomic_percentが呼ばれます
-    pp = XPSCAL.atomic_percent(x_all=x, y_all=y, tags=tag, rsf_list=RSF)
+    with XPSPROF.stage("atomic_percent"):
+        pp = XPSCAL.atomic_percent_spectra(spectra, RSF, baselines=baselines,
+                                           backgrounds=XPSCAL.background_methods(RSF, peak_db))
     
     for i in range(len(tag)):
         print(f"{tag[i]:<10} : {pp[i]:.2f} %")
@@ -67,51 +91,17 @@ print("\n========================================")
 print("       Peak Fitting & Area Ratios       ")
 print("========================================")
 
-try:
-    with open('peakfit.json', 'r') as f:
-        peak_db = json.load(f)
-
+fit_results_list = []  # peakfit.json が無ければ空のまま出力する
+if peak_db is not None:
     # 結果保存用（後でグラフ描画などを拡張する場合に使用）
-    fit_results_list = [None] * len(tag)
-
-    for i in range(len(tag)):
-        # --- スキップ条件 ---
-        # 0番目 (Survey/Su1s) と 最後 (CuLMM) はフィッティングしない
-        if i == 0:
-            continue
-        if tag[i]=="CuLMM":
-            continue
-
-        current_tag = tag[i]
-        
-        # JSONから設定を探す
-        target_peaks_config = [p for p in peak_db if p["level"] == current_tag]
-
-        if not target_peaks_config:
-            # 設定がなければスキップ（サイレント）
-            continue
-
-        # --- バックグラウンド処理 (Shirley法) ---
-        # フィッティング精度向上のため、バックグラウンドを引いたデータを使用する
-        y_bg, _, _ = XPSCAL.shirley_baseline(x[i], y[i])
-        y_pure = y[i] - y_bg
-        
-        # マイナス値は0にクリップ（計算エラー防止）
-        y_pure[y_pure < 0] = 0
-
-        # --- フィッティング実行 ---
-        # XPSFIT側で計算結果の表(print)を出力してくれる
-        print(f"\n【 {current_tag} Fitting Results 】")
-        fitted_peaks, y_total_fit = XPSFIT.perform_fitting(x[i], y_pure, target_peaks_config, verbose=True)
-
-        if fitted_peaks:
-            fit_results_list[i] = {
-                "peaks": fitted_peaks,
-                "y_total": y_total_fit,
-                "y_bg": y_bg
-            }
-
-except FileNotFoundError:
+    # 0番目 (Survey/Su1s) と CuLMM はXPSBATCH側でスキップされる
+    # XPSFIT側で計算結果の表(print)を出力してくれる
+    # バックグラウンドの種類は RSF.json / peakfit.json の各levelの "background" で選ぶ (既定: shirley)
+    fit_results_list = XPSBATCH.fit_regions(tag, x_list, y_list, peak_db, verbose=True,
+                                            backgrounds=XPSCAL.background_methods(RSF, peak_db),
+                                            baselines=baselines)
+
+else:
     print("エラー: 'peakfit.json' が見つかりません。フィッティングをスキップします。")
 
 # ==========================================
@@ -119,6 +109,7 @@ except FileNotFoundError:
 # ==========================================
 print("\n--- Excel出力 ---")
 save = input("データをExcelに保存しますか？ (y/n): ")
+save_path = None
 
 if save.lower() == 'y':
     root = tkinter.Tk()
@@ -131,17 +122,24 @@ if save.lower() == 'y':
     )
 
 if save_path:
+    with XPSPROF.stage("export"):
         XPSOUTPUTXL.export_to_excel(
             save_path=save_path,
             tags=tag,
-            x_list=x,
-            y_list=y,
+            x_list=x_list,
+            y_list=y_list,
             fit_results_list=fit_results_list,
             atomic_percent=pp
         )
 
+if prof is not None:
+    prof.stop()
+    prof.print_summary()
+    if os.environ.get("XPS_PROFILE"):
+        prof.save(os.environ["XPS_PROFILE"])
+
 # ==========================================
 # 6. グラフ描画
 # ==========================================
 print("\nグラフを描画します...")
-XPSPLOTUI.plot_spectra(tags=tag, x_list=x, y_list=y)
\ No newline at end of file
+XPSPLOTUI.plot_spectra(tag, x_list, y_list)
\ No newline at end of file
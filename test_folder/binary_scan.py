@@ -1,144 +1,480 @@
 import struct
 import numpy as np
-import pandas as pd
 import json
 import csv
-import tkinter.filedialog as tkfl
 import os
-import re
+import io
+import sys
+import mmap
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def read_phi_spectrum_final_v6(file_path):
+# 上のフォルダにある XPSBIN (バイナリ保存形式) を使う
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import XPSBIN
+
+def parse_phi_header(mm):
     """
-    PHI XPSファイル解析 V6 (エッジ検出・完全版)
-    パディング(0)とデータ(高強度)の境界線(エッジ)を検出し、
-    正確な開始位置からデータを切り出す。
+    テキストヘッダー部分 (EOFH まで) を解析する関数
+    mm: ファイル先頭から読めるオブジェクト (mmap など readline が使えるもの)
+    戻り値: (regions_info, header_metadata, binary_start_offset)
     """
-    regions_info = [] 
-    header_metadata = {} 
+    regions_info = []
+    header_metadata = {}
     binary_start_offset = 0
-    
-    print(f"解析開始: {os.path.basename(file_path)}")
-    
-    # --- 1. テキストヘッダー解析 ---
-    with open(file_path, 'rb') as f:
-        while True:
-            try:
-                line_bytes = f.readline()
-                line = line_bytes.decode('utf-8', errors='ignore').strip()
-            except:
-                break
-
-            if ":" in line and not line.startswith("SpectralReg"):
-                parts = line.split(":", 1)
-                if len(parts) == 2:
-                    header_metadata[parts[0].strip()] = parts[1].strip()
-
-            if line.startswith('SpectralRegDef:'):
-                parts = line.split()
-                if len(parts) > 8:
-                    try:
-                        name = parts[3]
-                        points = int(parts[5])
-                        start_ev = float(parts[7])
-                        end_ev = float(parts[8])
-                        regions_info.append({
-                            'name': name,
-                            'points': points,
-                            'start_ev': start_ev,
-                            'end_ev': end_ev
-                        })
-                    except:
-                        pass
-            
-            if line == 'EOFH':
-                binary_start_offset = f.tell()
-                break
-    
-    # --- 2. バイナリデータ解析 (エッジ検出) ---
-    parsed_data = {} 
-    
-    with open(file_path, 'rb') as f:
-        content = f.read()
-    
-    # pnt マーカーを全検索
-    header_marker = b'pnt'
-    all_markers = [m.start() for m in re.finditer(header_marker, content)]
-    valid_markers = [pos for pos in all_markers if pos >= binary_start_offset]
-    
-    print(f"検出ブロック数: {len(valid_markers)} / 定義領域数: {len(regions_info)}")
-    
-    for i, info in enumerate(regions_info):
-        if i >= len(valid_markers):
-            print(f"Error: {info['name']} のデータブロックが見つかりません。")
+
+    while True:
+        line_bytes = mm.readline()
+        if not line_bytes:
+            break
+        line = line_bytes.decode('utf-8', errors='ignore').strip()
+
+        if ":" in line and not line.startswith("SpectralReg"):
+            parts = line.split(":", 1)
+            if len(parts) == 2:
+                header_metadata[parts[0].strip()] = parts[1].strip()
+
+        if line.startswith('SpectralRegDef:'):
+            parts = line.split()
+            if len(parts) > 8:
+                try:
+                    name = parts[3]
+                    points = int(parts[5])
+                    start_ev = float(parts[7])
+                    end_ev = float(parts[8])
+                    regions_info.append({
+                        'name': name,
+                        'points': points,
+                        'start_ev': start_ev,
+                        'end_ev': end_ev
+                    })
+                except ValueError:
+                    pass
+
+        if line == 'EOFH':
+            binary_start_offset = mm.tell()
             break
-            
-        marker_pos = valid_markers[i]
-        
+
+    return regions_info, header_metadata, binary_start_offset
+
+
+# ==========================================
+# バイナリ部の目次 (EOFH の直後)
+# ==========================================
+# 先頭 16 バイト: グループ番号, スペクトル数, 目次1件のバイト数, 予備 (いずれも uint32, リトルエンディアン)
+PHI_DIRECTORY_DTYPE = np.dtype([
+    ('group', '<u4'), ('num_spectra', '<u4'), ('entry_size', '<u4'), ('reserved', '<u4')
+])
+# 続いてスペクトルごとに entry_size バイトの目次が並ぶ (先頭の以下の部分だけを使う)
+# 文字列は 'c/s' (単位), 'pnt' (点数), 'f4' / 'f8' (データ型) など
+# data_offset はバイナリ部の先頭からのバイト位置, data_length はデータのバイト数
+PHI_ENTRY_DTYPE = np.dtype([
+    ('spectrum_number', '<u4'), ('flag1', '<u4'), ('flag2', '<u4'), ('spectrum_number2', '<u4'),
+    ('flag3', '<u4'), ('num_points', '<u4'), ('flag4', '<u4'), ('flag5', '<u4'),
+    ('unit', 'S4'), ('axis', 'S4'), ('count_label', 'S4'), ('data_type', 'S4'),
+    ('data_offset', '<u4'), ('data_length', '<u4')
+])
+PHI_DATA_TYPES = {b'f4': '<f4', b'f8': '<f8'}
+
+
+def parse_phi_directory(mm, binary_start_offset):
+    """
+    バイナリ部の先頭にある目次を読む関数
+    戻り値: (entries, data_start, error)
+        entries: PHI_ENTRY_DTYPE の配列 (コピー), data_start: 目次の終わり (データはこれより後ろにある)
+        目次として解釈できなければ entries は None で、error に理由が入る
+    """
+    size = len(mm) - binary_start_offset
+    if size < PHI_DIRECTORY_DTYPE.itemsize:
+        return None, binary_start_offset, "no directory"
+    head = np.frombuffer(mm, dtype=PHI_DIRECTORY_DTYPE, count=1, offset=binary_start_offset)
+    n = int(head['num_spectra'][0])
+    entry_size = int(head['entry_size'][0])
+    del head
+    if n == 0 or entry_size < PHI_ENTRY_DTYPE.itemsize:
+        return None, binary_start_offset, "no directory"
+    table_size = n * entry_size
+    if PHI_DIRECTORY_DTYPE.itemsize + table_size > size:
+        return None, binary_start_offset, f"directory of {n} entries exceeds file"
+
+    # 目次1件のバイト数は版によって違うので、先頭の PHI_ENTRY_DTYPE の部分だけを切り出す
+    table = np.frombuffer(mm, dtype=np.uint8, count=table_size,
+                          offset=binary_start_offset + PHI_DIRECTORY_DTYPE.itemsize)
+    entries = table.reshape(n, entry_size)[:, :PHI_ENTRY_DTYPE.itemsize].copy().view(PHI_ENTRY_DTYPE).reshape(n)
+    del table
+    return entries, binary_start_offset + PHI_DIRECTORY_DTYPE.itemsize + table_size, None
+
+
+# 領域データの取り出し方法 (auto: 目次から読み、読めない領域だけ推定 / header: 目次のみ / heuristic: 推定のみ)
+SPE_DECODERS = ["auto", "header", "heuristic"]
+
+
+class PhiSpeFile:
+    """
+    PHI XPSファイル (.spe) をメモリマップで開き、領域データを必要になった時に取り出すクラス
+    - ヘッダーとバイナリ部の目次は開いた時に1回だけ解析する
+    - 目次があれば、各領域の位置と点数をそこから計算して points 個だけ読む (探索しない)
+    - 目次が無い・ヘッダーと食い違う領域だけ、pnt マーカーからの推定 (エッジ検出) で取り出す
+      (目次がある場合、マーカーはその領域の目次の中から探し、データは目次より後ろ・他の領域と重ならない位置に限る)
+    - 強度データはマップしたバッファのビュー (コピーなし) として返す
+    - decode_paths: 取り出せた領域の取り出し方法 ("header" / "heuristic")
+      fallbacks: 目次から読めなかった領域とその理由
+    使い方:
+        with PhiSpeFile(path) as spe:
+            x, y = spe.region("C1s")
+    """
+
+    HEADER_MARKER = b'pnt'
+    F4_MARKER = b'f4'
+    THRESHOLD = 50.0
+
+    def __init__(self, file_path, decoder="auto"):
+        if decoder not in SPE_DECODERS:
+            raise ValueError(f"未対応の取り出し方法です: {decoder}")
+        self.file_path = file_path
+        self.decoder = decoder
+        self.errors = []
+        self.decode_paths = {}
+        self.fallbacks = {}
+        self._markers = []
+        self._decoded = {}
+
+        with open(file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.regions_info, self.header_metadata, self.binary_start_offset = parse_phi_header(self._mm)
+        self.directory, self._data_start, self.directory_error = parse_phi_directory(
+            self._mm, self.binary_start_offset)
+        # pnt マーカーをファイル先頭から順に探す位置 (目次が無い / decoder="heuristic" のとき)
+        self._search_pos = self.binary_start_offset
+        self._claimed = None
+        self._ranges = {}  # 取り出した領域のバイト範囲 {領域番号: (開始, 終了)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.regions_info)
+
+    def close(self):
+        """マップを閉じる (取り出したビューが残っている場合は、それが消えた時点で解放される)"""
+        if self._mm is None:
+            return
+        self._decoded.clear()
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+        self._mm = None
+
+    def names(self):
+        return [info['name'] for info in self.regions_info]
+
+    def _marker(self, i):
+        """i番目の pnt マーカー位置を返す (まだ探していなければ、そこまで順に探す)"""
+        while len(self._markers) <= i:
+            pos = self._mm.find(self.HEADER_MARKER, self._search_pos)
+            if pos == -1:
+                return None
+            self._markers.append(pos)
+            self._search_pos = pos + 1
+        return self._markers[i]
+
+    def _entry_marker(self, i):
+        """目次の i番目の項目の中にある pnt マーカーの位置 (無ければ None)"""
+        if i >= len(self.directory):
+            return None
+        entry_size = (self._data_start - self.binary_start_offset - PHI_DIRECTORY_DTYPE.itemsize) // len(self.directory)
+        entry_pos = self.binary_start_offset + PHI_DIRECTORY_DTYPE.itemsize + i * entry_size
+        pos = self._mm.find(self.HEADER_MARKER, entry_pos, entry_pos + entry_size)
+        return pos if pos != -1 else None
+
+    def count_markers(self):
+        """バイナリ部分にある pnt マーカーの総数 (全体を順に探す)"""
+        while self._marker(len(self._markers)) is not None:
+            pass
+        return len(self._markers)
+
+    def _decode(self, i):
+        """
+        i番目の領域の強度データを取り出す (decoder に従って目次 → 推定の順に試す)
+        取り出し方法は decode_paths に、目次から読めなかった理由は fallbacks に記録する
+        """
+        name = self.regions_info[i]['name']
+        if self.decoder != "heuristic":
+            y, reason = self._decode_header(i)
+            if y is not None:
+                self.decode_paths[name] = "header"
+                return y
+            self.fallbacks[name] = reason
+            if self.decoder == "header":
+                self.errors.append(f"{name}: {reason}")
+                print(f"Error: {name} を目次から読めません ({reason})。")
+                return None
+
+        y = self._decode_heuristic(i)
+        if y is not None:
+            self.decode_paths[name] = "heuristic"
+        return y
+
+    def _use_directory(self):
+        return self.directory is not None and self.decoder != "heuristic"
+
+    def _header_block(self, i):
+        """
+        目次から i番目の領域のデータ位置を計算する
+        目次の点数・データ型・バイト数がヘッダーと合わない、またはファイルの外を指す場合は使わない
+        戻り値: ((開始位置, dtype), None) / (None, 理由)
+        """
+        info = self.regions_info[i]
+        if self.directory is None:
+            return None, self.directory_error
+        if i >= len(self.directory):
+            return None, f"not in directory ({len(self.directory)} entries)"
+
+        entry = self.directory[i]
+        data_type = bytes(entry['data_type']).rstrip(b'\0 ')
+        if data_type not in PHI_DATA_TYPES:
+            return None, f"unknown data type {data_type!r}"
+        dtype = np.dtype(PHI_DATA_TYPES[data_type])
+        points = int(entry['num_points'])
+        if points != info['points']:
+            return None, f"directory has {points} points, header {info['points']}"
+        n_bytes = points * dtype.itemsize
+        if int(entry['data_length']) != n_bytes:
+            return None, f"data length {int(entry['data_length'])} != {points} x {dtype.itemsize}"
+        start = self.binary_start_offset + int(entry['data_offset'])
+        if start < self._data_start or start + n_bytes > len(self._mm):
+            return None, "data offset outside file"
+        return (start, dtype), None
+
+    def _decode_header(self, i):
+        """
+        目次から計算した位置から、ちょうど points 個を読む (探索しない)
+        有限でない値がある場合は使わない
+        戻り値: (y, None) / (None, 理由)
+        """
+        block, reason = self._header_block(i)
+        if block is None:
+            return None, reason
+        start, dtype = block
+        y = np.frombuffer(self._mm, dtype=dtype, count=self.regions_info[i]['points'], offset=start)
+        if not np.all(np.isfinite(y)):
+            return None, "non-finite values"
+        self._ranges[i] = (start, start + y.nbytes)
+        return y, None
+
+    def _claimed_ranges(self):
+        """目次から位置が分かる領域のバイト範囲 [(領域番号, 開始, 終了)] (推定の結果の確認に使う)"""
+        if self._claimed is None:
+            self._claimed = []
+            if self.directory is not None:
+                for j, info in enumerate(self.regions_info):
+                    block, _ = self._header_block(j)
+                    if block is not None:
+                        start, dtype = block
+                        self._claimed.append((j, start, start + info['points'] * dtype.itemsize))
+        return self._claimed
+
+    def _decode_heuristic(self, i):
+        """
+        i番目の領域の強度データを探す (エッジ検出)
+        パディング(0)とデータ(高強度)の境界線(エッジ)を検出し、正確な開始位置からデータを切り出す
+        目次がある場合: マーカーはその領域の目次の項目から探し、目次の終わりより前のデータは使わない
+        目次が無い / decoder="heuristic": ファイル先頭から i番目の pnt マーカーを使う
+        どちらの場合も、他の領域 (目次から位置が分かる領域・取り出し済みの領域) のデータは飛ばして先を探す
+        """
+        info = self.regions_info[i]
+        if self._use_directory():
+            marker_pos = self._entry_marker(i)
+            lower = self._data_start
+            excluded = [(start, stop) for j, start, stop in self._claimed_ranges() if j != i]
+        else:
+            # 前の領域から順に取り出し、そのデータを飛ばせるようにする
+            for j in range(i):
+                self.region(j)
+            marker_pos = self._marker(i)
+            lower = self.binary_start_offset
+            excluded = []
+        excluded += [r for j, r in self._ranges.items() if j != i]
+        if marker_pos is None:
+            self.errors.append(f"{info['name']}: data block not found")
+            print(f"Error: {info['name']} のデータブロックが見つかりません。")
+            return None
+
         # pntマーカーの後ろにある 'f4' を探す
-        f4_marker = b'f4'
-        f4_pos = content.find(f4_marker, marker_pos, marker_pos + 500)
-        
-        found_y = None
-        
+        f4_pos = self._mm.find(self.F4_MARKER, marker_pos, marker_pos + 500)
+
         # 探索開始位置 (f4が見つからなければpntから固定オフセット)
         search_start_base = f4_pos if f4_pos != -1 else (marker_pos + 40)
-        
+
         # 4パターンのバイトズレを試行
-        best_data = None
-        
         for align_offset in range(4):
-            # 余裕を持って広めに読む (点数 + 1000点分)
-            read_start = search_start_base + 2 + align_offset
-            read_count = info['points'] + 1000 
-            
-            read_end = read_start + (read_count * 4)
-            if read_end > len(content):
-                read_end = len(content)
-            
-            chunk = content[read_start:read_end]
-            
-            try:
-                floats = np.frombuffer(chunk, dtype=np.float32)
-            except ValueError:
-                continue 
-            
-            # --- エッジ検出ロジック ---
-            # 1. NaN/Inf チェック
-            if np.any(np.isnan(floats)) or np.any(np.isinf(floats)):
+            found = self._scan_block(search_start_base + 2 + align_offset, info['points'], lower, excluded)
+            if found is not None:
+                begin, candidate = found
+                self._ranges[i] = (begin, begin + candidate.nbytes)
+                return candidate # 有効なデータが見つかったらこのオフセットで確定
+
+        self.errors.append(f"{info['name']}: no data above threshold {self.THRESHOLD:g}")
+        print(f"Error: {info['name']} のデータ抽出に失敗しました。閾値(50)を超えるデータが見つかりません。")
+        return None
+
+    def _scan_block(self, pos, points, lower, excluded):
+        """
+        pos からバイトのズレを保ったまま、points 個の float32 データの開始位置を探す
+        lower より前、または excluded の範囲と重なる候補は飛ばして先を探す
+        戻り値: (開始位置, データのビュー) / None
+        """
+        size = len(self._mm)
+        while pos + 4 * points <= size:
+            if pos < lower:
+                pos += -(-(lower - pos) // 4) * 4
                 continue
+            # 余裕を持って広めに読む (点数 + 1000点分)
+            read_count = min(points + 1000, (size - pos) // 4)
+            floats = np.frombuffer(self._mm, dtype=np.float32, count=read_count, offset=pos)
 
-            # 2. 閾値判定 (Thresholding)
+            # 閾値判定 (Thresholding)
             # パディングは通常 0 または 1e-40以下の極小値。データは通常 > 100。
             # 「値が 50 を超えた最初の場所」を探す
-            threshold = 50.0 
-            valid_indices = np.where(np.abs(floats) > threshold)[0]
-            
-            if len(valid_indices) > 0:
-                start_index = valid_indices[0] # ここがデータの本当の開始点
-                
-                # データ長が足りているか確認
-                if start_index + info['points'] <= len(floats):
-                    candidate = floats[start_index : start_index + info['points']]
-                    
-                    # データの平均値が妥当か再確認
-                    avg = np.mean(np.abs(candidate))
-                    if 100 < avg < 1e11:
-                        best_data = candidate
-                        # print(f"  -> {info['name']}: Offset {start_index} points (Mean: {avg:.0f})")
-                        break # 有効なデータが見つかったらこのオフセットで確定
-        
-        if best_data is not None:
-            # X軸作成 (高エネルギー -> 低エネルギー)
-            x_axis = np.linspace(info['start_ev'], info['end_ev'], info['points'])
-            df = pd.DataFrame({'x': x_axis, 'y': best_data})
-            parsed_data[info['name']] = df
+            valid_indices = np.flatnonzero(np.abs(floats) > self.THRESHOLD)
+            if len(valid_indices) == 0:
+                pos += 4 * read_count
+                continue
+            begin = pos + 4 * int(valid_indices[0])  # ここがデータの本当の開始点
+            end = begin + 4 * points
+            # 他の領域のデータと重なる場合は、その終わりから探し直す
+            hit = next((stop for start, stop in excluded if begin < stop and start < end), None)
+            if hit is not None:
+                pos = hit + (pos - hit) % 4
+                continue
+            # データ長が足りているか確認
+            if end > size:
+                return None
+
+            # NaN/Inf チェック (読み始めから候補の終わりまで。ズレた読み方はここで弾かれやすい)
+            window = np.frombuffer(self._mm, dtype=np.float32, count=(end - pos) // 4, offset=pos)
+            if not np.all(np.isfinite(window)):
+                return None
+            candidate = window[(begin - pos) // 4:]
+            # データの平均値が妥当か再確認
+            avg = np.mean(np.abs(candidate))
+            if 100 < avg < 1e11:
+                return begin, candidate
+            return None
+        return None
+
+    def region(self, key):
+        """
+        領域のデータを返す (名前または番号で指定)
+        戻り値: (x, y) x は高エネルギー → 低エネルギー, y はマップしたバッファのビュー
+                 見つからない場合は None
+        """
+        i = self.names().index(key) if isinstance(key, str) else key
+        if i not in self._decoded:
+            self._decoded[i] = self._decode(i)
+        y = self._decoded[i]
+        if y is None:
+            return None
+
+        info = self.regions_info[i]
+        x = np.linspace(info['start_ev'], info['end_ev'], info['points'])
+        return x, y
+
+    def __iter__(self):
+        """(name, x, y) を順に返す (取り出せなかった領域は飛ばす)"""
+        for i, info in enumerate(self.regions_info):
+            data = self.region(i)
+            if data is not None:
+                yield info['name'], data[0], data[1]
+
+
+def read_phi_spectrum_final_v6(file_path, errors=None, decode_paths=None, fallbacks=None, decoder="auto"):
+    """
+    PHI XPSファイル解析 V6
+    バイナリ部の目次から各領域の開始位置を計算して切り出す。
+    目次から読めない領域は、パディング(0)とデータ(高強度)の境界線(エッジ)を検出して切り出す。
+    (読み込み自体は PhiSpeFile でメモリマップ経由で行う)
+    戻り値: ({領域名: (x, y)}, regions_info, header_metadata)
+        y はマップしたバッファの読み取り専用ビュー (コピーなし)。マップは y がすべて消えた時点で解放される
+    errors: リストを渡すと、取り出せなかった領域のエラーを追加する
+    decode_paths: 辞書を渡すと、{領域名: "header" / "heuristic"} を追加する
+    fallbacks: 辞書を渡すと、目次から読めなかった領域の {領域名: 理由} を追加する
+    decoder: "auto" / "header" / "heuristic" (SPE_DECODERS)
+    """
+    print(f"解析開始: {os.path.basename(file_path)}")
+
+    parsed_data = {}
+    with PhiSpeFile(file_path, decoder=decoder) as spe:
+        if spe.directory is not None and decoder != "heuristic":
+            print(f"目次のスペクトル数: {len(spe.directory)} / 定義領域数: {len(spe)}")
         else:
-            print(f"Error: {info['name']} のデータ抽出に失敗しました。閾値(50)を超えるデータが見つかりません。")
+            print(f"検出ブロック数: {spe.count_markers()} / 定義領域数: {len(spe)}")
+
+        for i, info in enumerate(spe.regions_info):
+            data = spe.region(i)
+            if data is None:
+                continue
+            parsed_data[info['name']] = data
+
+        if spe.directory is None and decoder == "auto":
+            print(f"目次を読めないため、全領域を推定で取り出しました ({spe.directory_error})")
+        elif spe.directory is not None:
+            for name, reason in spe.fallbacks.items():
+                if spe.decode_paths.get(name) == "heuristic":
+                    print(f"{name}: 目次から読めないため推定で取り出しました ({reason})")
+        n_header = sum(1 for path in spe.decode_paths.values() if path == "header")
+        print(f"取り出し方法: 目次 {n_header} / 推定 {len(spe.decode_paths) - n_header}")
+
+        regions_info = spe.regions_info
+        header_metadata = spe.header_metadata
+        if errors is not None:
+            errors.extend(spe.errors)
+        if decode_paths is not None:
+            decode_paths.update(spe.decode_paths)
+        if fallbacks is not None:
+            fallbacks.update(spe.fallbacks)
 
     return parsed_data, regions_info, header_metadata
 
-def save_files(parsed_data, regions_info, metadata, original_path):
-    base_name = os.path.splitext(original_path)[0]
+def format_xy_rows(x, y):
+    """
+    1領域の x, y を "x,y" + CRLF の行に一括で変換した文字列を返す
+    値は float の repr (読み戻すと元の値に戻る最短の表記) で、以前の iterrows + csv.writer と同じ出力になる
+    (float32 の y も float64 に直してから書くので、iterrows のときと同じ桁になる)
+    map("%r,%r\r\n".__mod__, ...) でも1点ずつの文字列化は Python で行うので、点数に比例して時間がかかる
+    大きな変換の結果を読むときは CSV ではなく .xpsb (save_files が隣に書く) を使う
+    """
+    x = np.asarray(x, dtype=float).tolist()
+    y = np.asarray(y, dtype=float).tolist()
+    return "".join(map("%r,%r\r\n".__mod__, zip(x, y)))
+
+
+def write_spectrum_csv(csv_path, names, x_list, y_list):
+    """
+    スペクトルCSV (<タグ行> の後に x,y の行が続く形式, XPSASC.load_allspe で読める) を書く関数
+    1点ごとに DataFrame の行や csv.writer を通さず、領域ごとに format_xy_rows でまとめて書く
+    """
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)  # タグ行のクォートは以前と同じく csv.writer に任せる
+        for name, x, y in zip(names, x_list, y_list):
+            writer.writerow([name])
+            f.write(format_xy_rows(x, y))
+
+
+def save_files(parsed_data, regions_info, metadata, original_path, out_dir=None):
+    """
+    設定JSON (<名前>_settings.json), スペクトルCSV (<名前>_spectrum.csv), バイナリ (.xpsb) を保存する関数
+    parsed_data: {領域名: (x, y)} (read_phi_spectrum_final_v6 の戻り値。配列はそのまま書き出す)
+    out_dir: 出力先フォルダ (None なら元ファイルと同じ場所)
+    """
+    base_name = output_base(original_path, out_dir)
     
     # JSON出力
     json_path = base_name + "_settings.json"
@@ -149,19 +485,238 @@ def save_files(parsed_data, regions_info, metadata, original_path):
 
     # CSV出力
     csv_path = base_name + "_spectrum.csv"
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        for info in regions_info:
-            name = info['name']
-            if name in parsed_data:
-                writer.writerow([name])
-                df = parsed_data[name]
-                for _, row in df.iterrows():
-                    writer.writerow([row['x'], row['y']])
+    names = [info['name'] for info in regions_info if info['name'] in parsed_data]
+    x_list = [parsed_data[name][0] for name in names]
+    y_list = [parsed_data[name][1] for name in names]
+    write_spectrum_csv(csv_path, names, x_list, y_list)
     print(f"スペクトル保存: {os.path.basename(csv_path)}")
 
+    # バイナリ出力 (CSVの隣に置くと XPSASC.load_allspe がこちらを読む)
+    bin_path = XPSBIN.save_binary(
+        XPSBIN.binary_path_for(csv_path),
+        names,
+        x_list,
+        y_list,
+        metadata=output_json,
+        source_path=csv_path
+    )
+    print(f"バイナリ保存: {os.path.basename(bin_path)}")
+
+# ==========================================
+# フォルダ一括変換
+# ==========================================
+SPE_EXTENSION = ".spe"
+MANIFEST_NAME = "spe_manifest.json"
+
+
+def output_base(spe_path, out_dir=None):
+    """出力ファイル名の共通部分 (out_dir/<元ファイル名> または 元ファイルの拡張子なし)"""
+    if out_dir is None:
+        return os.path.splitext(spe_path)[0]
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(spe_path))[0])
+
+
+def output_paths(spe_path, out_dir=None):
+    """save_files が作るファイルのパス"""
+    base = output_base(spe_path, out_dir)
+    csv_path = base + "_spectrum.csv"
+    return {"settings": base + "_settings.json", "spectrum": csv_path,
+            "binary": XPSBIN.binary_path_for(csv_path)}
+
+
+def is_up_to_date(spe_path, outputs):
+    """出力がすべてあり、どれも元ファイルより新しいか"""
+    src_mtime = os.path.getmtime(spe_path)
+    return all(os.path.exists(p) and os.path.getmtime(p) >= src_mtime for p in outputs.values())
+
+
+def find_spe_files(root):
+    """フォルダ以下 (サブフォルダを含む) の .spe ファイルを名前順に返す"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() == SPE_EXTENSION:
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def convert_file(spe_path, out_dir=None, force=False, decoder="auto"):
+    """
+    1ファイルを変換する関数 (ProcessPoolExecutor 用にトップレベルに置く)
+    出力が元ファイルより新しければ変換しない (force=True なら必ず変換する)
+    戻り値: マニフェストの1件分の辞書
+        status: ok (全領域を取り出せた) / partial (一部の領域が失敗) / failed (1つも取り出せない)
+                / error (読み込み中の例外) / skipped (出力が最新)
+        regions: ヘッダーの領域数, names, points: 領域ごとの名前と点数
+        decoded: 取り出せた領域の名前, errors: 失敗した領域のエラー (閾値エラーなど)
+        decode_paths: 取り出せた領域ごとの取り出し方法 ("header" = 目次, "heuristic" = 推定)
+        fallbacks: 目次から読めなかった領域とその理由
+    decoder: "auto" / "header" / "heuristic" (SPE_DECODERS)
+    """
+    outputs = output_paths(spe_path, out_dir)
+    entry = {"source": spe_path, "status": None, "regions": 0, "names": [], "points": [],
+             "decoded": [], "decode_paths": {}, "fallbacks": {}, "errors": [],
+             "outputs": outputs, "seconds": 0.0}
+
+    if not force and is_up_to_date(spe_path, outputs):
+        entry["status"] = "skipped"
+        try:
+            with open(outputs["settings"], 'r', encoding='utf-8') as f:
+                regions_info = json.load(f).get("regions", [])
+            entry.update(regions=len(regions_info), names=[r['name'] for r in regions_info],
+                         points=[r['points'] for r in regions_info])
+        except (OSError, ValueError):
+            pass
+        return entry
+
+    t0 = time.perf_counter()
+    errors = []
+    try:
+        # 並列に動かすので、1ファイルごとの表示は出さない (失敗はマニフェストに記録する)
+        # 候補位置の平均を float32 で取るときのオーバーフロー警告も出さない (その候補は捨てられる)
+        with contextlib.redirect_stdout(io.StringIO()), np.errstate(over='ignore', invalid='ignore'):
+            data, regions_info, metadata = read_phi_spectrum_final_v6(
+                spe_path, errors=errors, decode_paths=entry["decode_paths"], fallbacks=entry["fallbacks"],
+                decoder=decoder)
+            if data:
+                if out_dir is not None:
+                    os.makedirs(out_dir, exist_ok=True)
+                save_files(data, regions_info, metadata, spe_path, out_dir=out_dir)
+        entry.update(regions=len(regions_info), names=[r['name'] for r in regions_info],
+                     points=[r['points'] for r in regions_info], decoded=list(data))
+        if not regions_info:
+            errors.append("no SpectralRegDef in header")
+        if not data:
+            entry["status"] = "failed"
+        elif errors or len(data) < len(regions_info):
+            entry["status"] = "partial"
+        else:
+            entry["status"] = "ok"
+    except Exception as e:
+        entry["status"] = "error"
+        errors.append(f"{type(e).__name__}: {e}")
+    entry["errors"] = errors
+    entry["seconds"] = time.perf_counter() - t0
+    return entry
+
+
+def _convert_worker(args):
+    return convert_file(*args)
+
+
+def convert_directory(root, out_dir=None, workers=None, force=False, manifest_path=None, verbose=True,
+                      decoder="auto"):
+    """
+    フォルダ以下の .spe ファイルをプロセスプールで並列に変換し、マニフェスト (JSON) を書く関数
+    out_dir: 出力先 (フォルダ構成は root と同じにする)。None なら各 .spe の隣に出力する
+    workers: ワーカープロセス数 (None ならCPU数, 1 なら並列化しない)
+    manifest_path: None なら <out_dir または root>/spe_manifest.json
+    変換しなかったファイル (skipped) は、前回のマニフェストの記録 (取り出せた領域・取り出し方法・エラー) を引き継ぐ
+    decoder: "auto" / "header" / "heuristic" (SPE_DECODERS)
+    戻り値: マニフェストの辞書
+    """
+    files = find_spe_files(root)
+    if manifest_path is None:
+        manifest_path = os.path.join(out_dir if out_dir is not None else root, MANIFEST_NAME)
+
+    previous = {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = {e["source"]: e for e in json.load(f).get("files", [])}
+    except (OSError, ValueError):
+        pass
+
+    jobs = []
+    for path in files:
+        target = None
+        if out_dir is not None:
+            target = os.path.normpath(os.path.join(out_dir, os.path.relpath(os.path.dirname(path), root)))
+        jobs.append((path, target, force, decoder))
+
+    if verbose:
+        print(f"対象ファイル数: {len(files)}")
+    entries = []
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        results = map(_convert_worker, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        results = (f.result() for f in as_completed([pool.submit(_convert_worker, job) for job in jobs]))
+    try:
+        for entry in results:
+            entry["source"] = os.path.relpath(entry["source"], root)
+            prev = previous.get(entry["source"])
+            if entry["status"] == "skipped" and prev is not None:
+                entry.update(decoded=prev.get("decoded", []), decode_paths=prev.get("decode_paths", {}),
+                             fallbacks=prev.get("fallbacks", {}), errors=prev.get("errors", []),
+                             last_status=prev.get("last_status", prev.get("status")))
+            entries.append(entry)
+            if verbose:
+                note = f" ({'; '.join(entry['errors'])})" if entry["errors"] and entry["status"] != "skipped" else ""
+                if entry["status"] != "skipped" and "heuristic" in entry["decode_paths"].values():
+                    n_heuristic = sum(1 for p in entry["decode_paths"].values() if p == "heuristic")
+                    note += f" [推定 {n_heuristic}/{len(entry['decode_paths'])}]"
+                print(f"  [{len(entries)}/{len(jobs)}] {entry['source']} : {entry['status']}{note}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    entries.sort(key=lambda e: e["source"])
+    counts = {}
+    for e in entries:
+        counts[e["status"]] = counts.get(e["status"], 0) + 1
+    decode_counts = {}
+    for e in entries:
+        for path in e.get("decode_paths", {}).values():
+            decode_counts[path] = decode_counts.get(path, 0) + 1
+    manifest = {
+        "root": os.path.abspath(root),
+        "out_dir": os.path.abspath(out_dir) if out_dir is not None else None,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "counts": counts,
+        "decode_counts": decode_counts,
+        "files": entries
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    tmp_path = manifest_path + f".{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    if verbose:
+        print("完了: " + ", ".join(f"{k} {v} 件" for k, v in sorted(counts.items())))
+        print(f"マニフェスト: {manifest_path}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PHI XPSファイル (.spe) をCSV・設定JSON・.xpsb に変換する")
+    parser.add_argument('root', help=".spe ファイルのあるフォルダ (サブフォルダも探す)")
+    parser.add_argument('-o', '--out-dir', default=None, help="出力先 (既定: 各 .spe の隣)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="ワーカープロセス数 (既定: CPU数)")
+    parser.add_argument('--force', action='store_true', help="出力が最新でも変換し直す")
+    parser.add_argument('--manifest', default=None, help=f"マニフェストのパス (既定: 出力先/{MANIFEST_NAME})")
+    parser.add_argument('--decoder', choices=SPE_DECODERS, default="auto",
+                        help="領域データの取り出し方法 (auto: 目次 → 推定, header: 目次のみ, heuristic: 推定のみ)")
+    args = parser.parse_args(argv)
+
+    manifest = convert_directory(args.root, out_dir=args.out_dir, workers=args.workers, force=args.force,
+                                 manifest_path=args.manifest, decoder=args.decoder)
+    failed = sum(n for status, n in manifest["counts"].items() if status in ("failed", "error"))
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
+    # フォルダ一括変換: python binary_scan.py <フォルダ> [-o 出力先] [-j 並列数]
+    # 引数がなければ、ダイアログで選んだ1ファイルを変換する
+    if len(sys.argv) > 1:
+        raise SystemExit(main())
+
     import tkinter as tk
+    import tkinter.filedialog as tkfl
     root = tk.Tk()
     root.withdraw()
 
@@ -172,7 +727,7 @@ if __name__ == "__main__":
             data, regs, meta = read_phi_spectrum_final_v6(path_d)
             if data:
                 save_files(data, regs, meta, path_d)
-                print("\n=== 修正完了: エッジ検出処理を実行しました ===")
+                print("\n=== 変換完了 ===")
             else:
                 print("有効なデータが見つかりませんでした。")
         except Exception as e:
@@ -0,0 +1,5 @@
+#テスト用の設定 (XPS*.py はリポジトリ直下に置いてあるので、そこを import できるようにする)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,106 @@
+#バックグラウンド: Shirley のまとめての計算, Tougaard のFFT畳み込み, 種類の指定
+import numpy as np
+import pytest
+
+import XPSCAL
+
+
+def _region(center, n=300, step=0.05, seed=0):
+    """段差のある1本のピーク (高結合エネルギー側のバックグラウンドが高い)"""
+    rng = np.random.default_rng(seed)
+    x = center - 7.5 + np.arange(n) * step
+    y = 100 * np.exp(-(x - center)**2 / 1.5) + 20 + 10 * (x > center) + rng.normal(0, 1, n)
+    return x, y
+
+
+def test_batch_matches_scalar_for_lists():
+    # 長さの違う領域をリストで渡す
+    regions = [_region(285.0 + k, n=250 + 20 * k, seed=k) for k in range(4)]
+    x_list = [x for x, _ in regions]
+    y_list = [y for _, y in regions]
+
+    bases, x_mins, x_maxs = XPSCAL.shirley_baseline_batch(x_list, y_list)
+    for k, (x, y) in enumerate(regions):
+        base, x_min, x_max = XPSCAL.shirley_baseline(x, y)
+        np.testing.assert_allclose(bases[k], base, rtol=1e-9, atol=1e-9)
+        assert x_mins[k] == x_min and x_maxs[k] == x_max
+
+
+def test_batch_matches_scalar_for_concatenated():
+    regions = [_region(530.0 + k, n=200 + 30 * k, seed=k) for k in range(3)]
+    lengths = [len(x) for x, _ in regions]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    x_flat = np.concatenate([x for x, _ in regions])
+    y_flat = np.concatenate([y for _, y in regions])
+
+    bases, _, _ = XPSCAL.shirley_baseline_batch(x_flat, y_flat, offsets=offsets)
+    assert bases.shape == x_flat.shape
+    for k, (x, y) in enumerate(regions):
+        base, _, _ = XPSCAL.shirley_baseline(x, y)
+        np.testing.assert_allclose(bases[offsets[k] : offsets[k] + lengths[k]], base, rtol=1e-9, atol=1e-9)
+
+
+def test_batch_2d_with_shared_x():
+    # 2次元の y と全行共通の1次元 x
+    x, _ = _region(285.0)
+    y = np.stack([_region(285.0, seed=k)[1] for k in range(4)])
+
+    bases, _, _ = XPSCAL.shirley_baseline_batch(x, y)
+    assert bases.shape == y.shape
+    for k in range(len(y)):
+        base, _, _ = XPSCAL.shirley_baseline(x, y[k])
+        np.testing.assert_allclose(bases[k], base, rtol=1e-9, atol=1e-9)
+
+
+def _tougaard_direct(x, y, x_min, x_max, B=None, C=XPSCAL.TOUGAARD_C):
+    """Tougaard バックグラウンドを O(n^2) の和で直接計算する (FFT版の確認用)"""
+    i0, i1 = sorted((np.abs(x - x_min).argmin(), np.abs(x - x_max).argmin()))
+    ascending = x[i1] > x[i0]
+    y_asc = y[i0 : i1 + 1] if ascending else y[i0 : i1 + 1][::-1]
+    n = len(y_asc)
+    step = abs(x[i1] - x[i0]) / (n - 1)
+    signal = np.maximum(y_asc - y_asc[0], 0)
+    conv = np.zeros(n)
+    for k in range(n):
+        for m in range(k):
+            T = (k - m) * step
+            conv[k] += T / (C + T**2)**2 * signal[m] * step
+    if B is None:
+        B = (y_asc[-1] - y_asc[0]) / conv[-1]
+    bg = y_asc[0] + B * conv
+    if not ascending:
+        bg = bg[::-1]
+    full = np.empty_like(y)
+    full[i0 : i1 + 1] = bg
+    full[:i0] = bg[0]
+    full[i1 + 1:] = bg[-1]
+    return full
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("B", [None, 2866.0])
+def test_tougaard_fft_matches_direct_sum(descending, B):
+    x, y = _region(285.0, n=240)
+    if descending:
+        x, y = x[::-1].copy(), y[::-1].copy()
+    base, x_min, x_max = XPSCAL.tougaard_baseline(x, y, B=B)
+    expected = _tougaard_direct(x, y, x_min, x_max, B=B)
+    np.testing.assert_allclose(base, expected, rtol=1e-13, atol=1e-13 * np.abs(expected).max())
+
+
+def test_background_methods_peakfit_overrides_rsf(capsys):
+    rsf = [{"level": "C1s", "background": "shirley"}, {"level": "Cu2p3", "background": "tougaard"},
+           {"level": "O1s"}]
+    peaks = [
+        {"level": "C1s", "name": "C-C", "background": "tougaard"},
+        {"level": "C1s", "name": "C-O", "background": "shirley"},  # 最初の成分の指定を使う
+        {"level": "Cu2p3", "name": "main"},  # 指定が無ければ RSF.json のまま
+        {"level": "N1s", "name": "N", "background": "tougaard"},
+    ]
+    assert XPSCAL.background_methods(rsf) == {"C1s": "shirley", "Cu2p3": "tougaard", "O1s": "shirley"}
+    assert XPSCAL.background_methods(rsf, peaks) == {
+        "C1s": "tougaard", "Cu2p3": "tougaard", "O1s": "shirley", "N1s": "tougaard"}
+    assert "C1s" in capsys.readouterr().out
+
+    # 未対応の種類は既定 (shirley) にする
+    assert XPSCAL.background_methods([{"level": "C1s", "background": "linear"}]) == {"C1s": "shirley"}
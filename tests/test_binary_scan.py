@@ -0,0 +1,221 @@
+#PHI .spe の読み込み (test_folder/binary_scan.py): 目次からの取り出しと推定への切り替え
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_folder"))
+import binary_scan
+
+ENTRY_SIZE = 64  # PHI_ENTRY_DTYPE (56 バイト) + 予備
+
+
+def _regions(seed=0):
+    """合成スペクトル: (名前, 開始eV, 終了eV, y float32)  O1s は全点が閾値 50 未満"""
+    rng = np.random.default_rng(seed)
+    c1s = (1000 + 800 * np.exp(-np.linspace(-3, 3, 121)**2) + rng.normal(0, 5, 121)).astype(np.float32)
+    cu2p = (3000 + 500 * np.exp(-np.linspace(-4, 2, 201)**2) + rng.normal(0, 5, 201)).astype(np.float32)
+    o1s = (20 + 10 * np.exp(-np.linspace(-2, 2, 81)**2)).astype(np.float32)
+    return [("C1s", 295.0, 280.0, c1s), ("Cu2p3", 945.0, 925.0, cu2p), ("O1s", 540.0, 525.0, o1s)]
+
+
+def write_spe(path, regions, directory=True, corrupt=None):
+    """
+    合成 .spe を書く (テキストヘッダー, EOFH, 目次, f4 のデータブロック)
+    directory=False: 目次の代わりに各データブロックの前に 'pnt' / 'f4' の印を置く (古い形式)
+    corrupt: 目次の点数を壊す領域番号
+    """
+    header = ["SOFH", "FileDesc: synthetic", "NoSpectralReg: %d" % len(regions)]
+    for k, (name, start, end, y) in enumerate(regions, 1):
+        header.append(f"SpectralRegDef: {k} {k} {name} 6 {len(y)} -0.1 {start} {end} 1 0")
+    header.append("EOFH")
+    text = ("\r\n".join(header) + "\r\n").encode()
+
+    blocks = []
+    if directory:
+        data_pos = 16 + ENTRY_SIZE * len(regions)
+        table = np.zeros(len(regions), dtype=binary_scan.PHI_ENTRY_DTYPE)
+        for k, (_, _, _, y) in enumerate(regions):
+            data_pos += 32  # データの前のパディング
+            table[k] = (k + 1, 0, 0, k + 1, 0, len(y), 0, 0, b"c/s", b"eV", b"pnt", b"f4", data_pos, y.nbytes)
+            data_pos += y.nbytes
+        if corrupt is not None:
+            table[corrupt]['num_points'] += 7
+        head = np.array([(1, len(regions), ENTRY_SIZE, 0)], dtype=binary_scan.PHI_DIRECTORY_DTYPE)
+        blocks.append(head.tobytes())
+        for entry in table:
+            blocks.append(entry.tobytes() + b"\0" * (ENTRY_SIZE - table.itemsize))
+        for _, _, _, y in regions:
+            blocks.append(b"\0" * 32 + y.astype("<f4").tobytes())
+    else:
+        for _, _, _, y in regions:
+            blocks.append(b"pnt\0f4\0\0" + b"\0" * 24 + y.astype("<f4").tobytes())
+
+    with open(path, "wb") as f:
+        f.write(text + b"".join(blocks))
+    return path
+
+
+def _check(spe, regions, names):
+    for name, start, end, y in regions:
+        if name not in names:
+            continue
+        x_read, y_read = spe.region(name)
+        np.testing.assert_array_equal(y_read, y)
+        np.testing.assert_allclose(x_read, np.linspace(start, end, len(y)))
+
+
+def test_header_decode(tmp_path):
+    regions = _regions()
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions)) as spe:
+        assert len(spe.directory) == 3
+        _check(spe, regions, ["C1s", "Cu2p3", "O1s"])
+        assert spe.decode_paths == {"C1s": "header", "Cu2p3": "header", "O1s": "header"}
+        assert spe.fallbacks == {} and spe.errors == []
+
+
+def test_corrupted_entry_falls_back_to_heuristic(tmp_path):
+    regions = _regions()
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions, corrupt=1)) as spe:
+        _check(spe, regions, ["C1s", "Cu2p3", "O1s"])
+        assert spe.decode_paths == {"C1s": "header", "Cu2p3": "heuristic", "O1s": "header"}
+        assert "Cu2p3" in spe.fallbacks and spe.errors == []
+
+
+def test_fallback_skips_other_regions(tmp_path):
+    # 推定は目次の後ろから探すが、目次から位置が分かる他の領域のデータは使わない
+    regions = _regions()
+    regions = [regions[2], regions[0], regions[1]]
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions, corrupt=2)) as spe:
+        _check(spe, regions, ["O1s", "C1s", "Cu2p3"])
+        assert spe.decode_paths["Cu2p3"] == "heuristic"
+
+
+def test_fallback_below_threshold_fails(tmp_path):
+    # 全点が閾値 50 未満の領域は目次からしか読めない
+    regions = _regions()
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions, corrupt=2)) as spe:
+        assert spe.region("O1s") is None
+        _check(spe, regions, ["C1s", "Cu2p3"])
+        assert len(spe.errors) == 1 and spe.errors[0].startswith("O1s:")
+
+
+def test_header_decoder_fails_cleanly(tmp_path):
+    regions = _regions()
+    path = write_spe(tmp_path / "a.spe", regions, corrupt=1)
+    with binary_scan.PhiSpeFile(path, decoder="header") as spe:
+        assert spe.region("Cu2p3") is None
+        _check(spe, regions, ["C1s", "O1s"])
+        assert "Cu2p3" not in spe.decode_paths
+        assert "Cu2p3" in spe.fallbacks
+        assert len(spe.errors) == 1 and spe.errors[0].startswith("Cu2p3:")
+
+
+def test_heuristic_decoder_walks_markers(tmp_path):
+    # decoder="heuristic" はファイル全体から pnt マーカーを順に探す (目次の中の印も使う)
+    regions = _regions()
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions), decoder="heuristic") as spe:
+        _check(spe, regions, ["C1s", "Cu2p3"])
+        assert spe.decode_paths == {"C1s": "heuristic", "Cu2p3": "heuristic"}
+
+
+def test_file_without_directory(tmp_path):
+    regions = _regions()[:2]
+    with binary_scan.PhiSpeFile(write_spe(tmp_path / "a.spe", regions, directory=False)) as spe:
+        assert spe.directory is None
+        assert spe.count_markers() == 2
+        _check(spe, regions, ["C1s", "Cu2p3"])
+        assert spe.decode_paths == {"C1s": "heuristic", "Cu2p3": "heuristic"}
+        assert set(spe.fallbacks) == {"C1s", "Cu2p3"}
+
+
+@pytest.mark.parametrize("decoder", binary_scan.SPE_DECODERS)
+def test_unknown_regions_do_not_raise(tmp_path, decoder):
+    # 目次もマーカーも無いファイルでも例外にせず、読めなかった領域として記録する
+    path = tmp_path / "empty.spe"
+    path.write_bytes(b"SOFH\r\nSpectralRegDef: 1 1 C1s 6 10 -0.1 290 280 1 0\r\nEOFH\r\n")
+    with binary_scan.PhiSpeFile(path, decoder=decoder) as spe:
+        assert spe.region("C1s") is None
+        assert spe.errors
+
+
+def _old_spectrum_csv(csv_path, names, x_list, y_list):
+    """以前の書き方 (DataFrame の iterrows + csv.writer で1点ずつ)"""
+    pd = pytest.importorskip("pandas")
+    import csv
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for name, x, y in zip(names, x_list, y_list):
+            writer.writerow([name])
+            df = pd.DataFrame({'x': x, 'y': np.array(y)})
+            for _, row in df.iterrows():
+                writer.writerow([row['x'], row['y']])
+
+
+def test_spectrum_csv_matches_old_writer(tmp_path):
+    # float32 の y (目次から読んだそのままの型) と、区切りの悪い x で比べる
+    regions = _regions()
+    names = [name for name, _, _, _ in regions]
+    x_list = [np.linspace(start, end, len(y)) for _, start, end, y in regions]
+    y_list = [y for _, _, _, y in regions]
+    assert y_list[0].dtype == np.float32
+
+    binary_scan.write_spectrum_csv(tmp_path / "new.csv", names, x_list, y_list)
+    _old_spectrum_csv(tmp_path / "old.csv", names, x_list, y_list)
+    assert (tmp_path / "new.csv").read_bytes() == (tmp_path / "old.csv").read_bytes()
+    for x, y in zip(x_list, y_list):
+        assert binary_scan.format_xy_rows(x, y).count("\r\n") == len(x)
+
+
+def test_convert_directory(tmp_path):
+    import XPSASC
+    import XPSBIN
+    regions = _regions()
+    root, out = tmp_path / "dump", tmp_path / "out"
+    (root / "sub" / "deeper").mkdir(parents=True)
+    write_spe(root / "a.spe", regions)
+    write_spe(root / "sub" / "b.spe", regions, corrupt=1)
+    write_spe(root / "sub" / "deeper" / "c.spe", regions, corrupt=2)
+
+    manifest = binary_scan.convert_directory(str(root), out_dir=str(out), workers=2, verbose=False)
+    files = {e["source"]: e for e in manifest["files"]}
+    a, b, c = "a.spe", os.path.join("sub", "b.spe"), os.path.join("sub", "deeper", "c.spe")
+    assert set(files) == {a, b, c}
+    assert manifest["counts"] == {"ok": 2, "partial": 1}
+    assert files[a]["decode_paths"] == {"C1s": "header", "Cu2p3": "header", "O1s": "header"}
+    assert files[b]["decode_paths"]["Cu2p3"] == "heuristic" and "Cu2p3" in files[b]["fallbacks"]
+    assert files[c]["status"] == "partial" and files[c]["decoded"] == ["C1s", "Cu2p3"]
+    assert files[c]["errors"][0].startswith("O1s:")
+    with open(out / binary_scan.MANIFEST_NAME, encoding="utf-8") as f:
+        assert json.load(f)["files"] == manifest["files"]
+
+    # 出力は入力と同じフォルダ構成になり、CSV・.xpsb とも XPSASC.load_allspe で読める
+    for source, entry in files.items():
+        csv_path = out / (os.path.splitext(source)[0] + "_spectrum.csv")
+        assert entry["outputs"]["spectrum"] == str(csv_path)
+        assert os.path.exists(entry["outputs"]["settings"]) and os.path.exists(entry["outputs"]["binary"])
+        for spectra in (XPSASC.load_allspe(str(csv_path), binary_cache=False),
+                        XPSASC.load_allspe(str(csv_path))):
+            tags, x_list, y_list = spectra
+            assert tags == entry["decoded"]
+            for name, start, end, y in regions:
+                if name in tags:
+                    np.testing.assert_array_equal(y_list[tags.index(name)], y)
+                    np.testing.assert_allclose(x_list[tags.index(name)], np.linspace(start, end, len(y)))
+        assert XPSBIN.is_fresh(entry["outputs"]["binary"], str(csv_path))
+
+    # 2回目は変換せず、前回の記録を引き継ぐ
+    again = binary_scan.convert_directory(str(root), out_dir=str(out), workers=2, verbose=False)
+    assert again["counts"] == {"skipped": 3}
+    for entry in again["files"]:
+        before = files[entry["source"]]
+        assert entry["last_status"] == before["status"]
+        for key in ("decoded", "decode_paths", "fallbacks", "errors", "names", "points"):
+            assert entry[key] == before[key]
+    assert again["decode_counts"] == manifest["decode_counts"]
+
+    forced = binary_scan.convert_directory(str(root), out_dir=str(out), workers=2, force=True, verbose=False)
+    assert forced["counts"] == {"ok": 2, "partial": 1}
+    assert all("last_status" not in e for e in forced["files"])
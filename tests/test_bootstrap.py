@@ -0,0 +1,59 @@
+#ブートストラップの信頼区間 (XPSBOOT): 並列数によらない再現性と、真の値を含むか
+import copy
+
+import numpy as np
+import pytest
+
+import XPSBOOT
+import XPSFIT
+
+PEAKS = [
+    {"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"level": "C1s", "name": "C-O", "center": 286.3, "center_error": 0.8, "FWHM": 1.2, "FWHM_error": 0.4},
+]
+TRUE_CENTERS = [284.9, 286.2]
+
+
+def _fit(seed):
+    x = np.linspace(280.0, 292.0, 241)
+    y = XPSFIT.multi_peak_model(x, 1000.0, TRUE_CENTERS[0], 1.1, 0.3, 400.0, TRUE_CENTERS[1], 1.3, 0.3)
+    y = y + np.random.default_rng(seed).normal(0, 10.0, len(x))
+    peaks, y_total = XPSFIT.perform_fitting(x, y, PEAKS, verbose=False)
+    return x, y, peaks, y_total
+
+
+def _ci_keys(peak):
+    return {k: v for k, v in peak.items() if k.endswith("_ci") or k.endswith("_std") or k == "n_boot"}
+
+
+@pytest.mark.parametrize("method", XPSBOOT.BOOTSTRAP_METHODS)
+def test_same_seed_same_result_for_any_workers(method):
+    x, y, peaks, y_total = _fit(0)
+    n = 2 * XPSBOOT.CHUNK_SIZE + 10  # 3つに分けて並列に計算する
+    one = XPSBOOT.bootstrap_fit(x, y, PEAKS, copy.deepcopy(peaks), y_total, n=n, method=method, workers=1, seed=5)
+    two = XPSBOOT.bootstrap_fit(x, y, PEAKS, copy.deepcopy(peaks), y_total, n=n, method=method, workers=2, seed=5)
+    for a, b in zip(one, two):
+        assert _ci_keys(a) == _ci_keys(b)
+        assert a["n_boot"] == n
+        assert a["center_std"] > 0
+    other = XPSBOOT.bootstrap_fit(x, y, PEAKS, copy.deepcopy(peaks), y_total, n=n, method=method, workers=1, seed=6)
+    assert _ci_keys(other[0]) != _ci_keys(one[0])
+
+
+def test_ci_covers_true_center():
+    # 95% の区間なので、ノイズを変えた 10 回 × 2 成分のほとんどで真の中心を含む
+    covered = 0
+    for noise_seed in range(10):
+        x, y, peaks, y_total = _fit(noise_seed)
+        XPSBOOT.bootstrap_fit(x, y, PEAKS, peaks, y_total, n=60, workers=1, seed=noise_seed)
+        for peak, center in zip(peaks, TRUE_CENTERS):
+            lo, hi = peak["center_ci"]
+            assert lo <= peak["center"] <= hi and hi - lo < 0.2
+            covered += lo <= center <= hi
+    assert covered >= 17
+
+
+def test_unknown_method():
+    x, y, peaks, y_total = _fit(0)
+    with pytest.raises(ValueError):
+        XPSBOOT.bootstrap_fit(x, y, PEAKS, peaks, y_total, n=10, method="jackknife")
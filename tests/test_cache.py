@@ -0,0 +1,109 @@
+#フィッティング結果のディスクキャッシュ (XPSCACHE)
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import XPSCACHE
+import XPSFIT
+
+PEAKS = [{"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3}]
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    """XPSFIT.perform_fitting を呼ばれた回数を数えるものに差し替える"""
+    calls = []
+    real = XPSFIT.perform_fitting
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(XPSFIT, "perform_fitting", counting)
+    return calls
+
+
+def _spectrum():
+    x = np.linspace(280.0, 290.0, 201)
+    y = XPSFIT.multi_peak_model(x, 1000.0, 284.9, 1.1, 0.3) + np.random.default_rng(0).normal(0, 2.0, len(x))
+    return x, y
+
+
+def test_hit_and_miss(tmp_path, fits):
+    cache = XPSCACHE.FitCache(str(tmp_path), enabled=True)
+    x, y = _spectrum()
+    first = XPSCACHE.cached_perform_fitting(x, y, PEAKS, cache=cache, verbose=False)
+    second = XPSCACHE.cached_perform_fitting(x, y, PEAKS, cache=cache, verbose=False)
+    assert len(fits) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(second[1], first[1])
+    assert [p["center"] for p in second[0]] == [p["center"] for p in first[0]]
+
+
+def test_key_changes_with_inputs(monkeypatch):
+    cache = XPSCACHE.FitCache(enabled=True)
+    x, y = _spectrum()
+
+    def key(x=x, y=y, peaks=PEAKS, options=None):
+        return cache.key("perform_fitting", [x, y], {"peaks": peaks, "options": options or {}})
+
+    base = key()
+    assert key() == base
+    y2 = y.copy()
+    y2[100] += 1e-9
+    assert key(y=y2) != base
+    assert key(peaks=[dict(PEAKS[0], FWHM=1.1)]) != base
+    assert key(options={"engine": "varpro"}) != base
+    monkeypatch.setattr(XPSCACHE, "_code_version", "0" * 16)
+    assert key() != base
+
+
+def test_failed_fit_is_cached(tmp_path, monkeypatch, capsys):
+    calls = []
+
+    def failing(x, y, peak_infos, verbose=True, **kwargs):
+        calls.append(1)
+        return None, None
+
+    monkeypatch.setattr(XPSFIT, "perform_fitting", failing)
+    cache = XPSCACHE.FitCache(str(tmp_path), enabled=True)
+    x, y = _spectrum()
+    for _ in range(2):
+        assert XPSCACHE.cached_perform_fitting(x, y, PEAKS, cache=cache) == (None, None)
+    assert len(calls) == 1 and cache.hits == 1
+    assert "(cached)" in capsys.readouterr().out
+
+
+def test_lru_eviction(tmp_path):
+    cache = XPSCACHE.FitCache(str(tmp_path), max_bytes=10_000, enabled=True)
+    payload = b"\0" * 1000
+    past = os.path.getmtime(tmp_path) - 100
+    for k in range(9):
+        cache.put(f"k{k}", payload)
+        os.utime(cache._path(f"k{k}"), (past + k, past + k))
+    size = os.path.getsize(cache._path("k0"))
+    assert 9 * size <= 10_000 < 10 * size
+    cache.get("k0")  # 使ったものは最終利用時刻が新しくなり、残る
+
+    cache.put("k9", payload)  # 上限を超えるので、90% 以下まで古い順に削除する
+    remaining = sorted(e.name for e in os.scandir(tmp_path))
+    assert len(remaining) * size <= 10_000 * XPSCACHE.EVICT_TARGET_RATIO < (len(remaining) + 1) * size
+    assert "k0.pkl" in remaining and "k9.pkl" in remaining
+    assert "k1.pkl" not in remaining and "k2.pkl" not in remaining
+    assert cache._size == len(remaining) * size
+
+
+def test_no_cache_env(tmp_path):
+    # XPS_NO_CACHE は import 時に読むので、別のプロセスで確かめる
+    code = ("import XPSCACHE; c = XPSCACHE.FitCache(%r); c.put('k', 1); "
+            "print(c.enabled, c.get('k'), XPSCACHE.CACHE_DISABLED_BY_ENV)" % str(tmp_path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for value, expected in (("1", "False None True"), ("0", "True 1 False")):
+        env = dict(os.environ, XPS_NO_CACHE=value)
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True,
+                             check=True).stdout
+        assert out.split() == expected.split()
+    assert os.listdir(tmp_path) == ["k.pkl"]
@@ -0,0 +1,99 @@
+#結果の出力 (XPSOUTPUTXL): ストリーミングの xlsx と通常の xlsx の一致, CSVフォルダ出力
+import importlib.util
+import math
+import os
+
+import numpy as np
+import pytest
+
+import XPSBATCH
+import XPSFIT
+import XPSOUTPUTXL
+
+openpyxl = pytest.importorskip("openpyxl")
+pd = pytest.importorskip("pandas")
+
+PEAKS = [
+    {"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"level": "C1s", "name": "C-O", "center": 286.3, "center_error": 0.8, "FWHM": 1.2, "FWHM_error": 0.4},
+    {"level": "O 1s", "name": "Cu-O", "center": 529.8, "center_error": 0.6, "FWHM": 1.1, "FWHM_error": 0.3},
+]
+
+
+@pytest.fixture(scope="module")
+def results():
+    """Su1s (フィットしない), C1s (2成分), 'O 1s' (ファイル名に使えない文字を含むタグ) の結果"""
+    rng = np.random.default_rng(0)
+    tags = ["Su1s", "C1s", "O 1s"]
+    x_list = [np.linspace(1000.0, 0.0, 101), np.linspace(292.0, 280.0, 121), np.linspace(536.0, 524.0, 121)]
+    y_list = [100 + rng.uniform(0, 5, 101),
+              120 + XPSFIT.multi_peak_model(x_list[1], 1000.0, 284.9, 1.1, 0.3, 400.0, 286.2, 1.3, 0.3),
+              80 + XPSFIT.multi_peak_model(x_list[2], 600.0, 529.9, 1.2, 0.3)]
+    fit_results_list = XPSBATCH.fit_regions(tags, x_list, y_list, PEAKS, verbose=False)
+    assert fit_results_list[0] is None and fit_results_list[1] is not None
+    return dict(tags=tags, x_list=x_list, y_list=y_list, fit_results_list=fit_results_list,
+                atomic_percent=[0.0, 61.5, 38.5])
+
+
+def _read_xlsx(path):
+    wb = openpyxl.load_workbook(path, read_only=True)
+    sheets = {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+    wb.close()
+    return sheets
+
+
+def test_streaming_xlsx_matches_export_to_excel(tmp_path, results):
+    assert XPSOUTPUTXL.export_to_excel(str(tmp_path / "a.xlsx"), **results)
+    assert XPSOUTPUTXL.export_to_excel_streaming(str(tmp_path / "b.xlsx"), **results)
+    normal, streamed = _read_xlsx(tmp_path / "a.xlsx"), _read_xlsx(tmp_path / "b.xlsx")
+
+    assert list(streamed) == list(normal) == ["Su1s", "C1s", "O 1s", XPSOUTPUTXL.SUMMARY_SHEET_NAME]
+    for name in normal:
+        # 書き込み専用モードは空のセルを書かないので、行末の None は除いて比べる
+        a = [row[:max([i + 1 for i, v in enumerate(row) if v is not None], default=0)] for row in normal[name]]
+        b = [row[:max([i + 1 for i, v in enumerate(row) if v is not None], default=0)] for row in streamed[name]]
+        assert a == b, name
+    assert normal["C1s"][0] == ["Binding Energy (eV)", "Raw Intensity", "Background", "Total Fit",
+                                "Comp: C-C", "Comp: C-O"]
+    assert normal["Su1s"][0] == ["Binding Energy (eV)", "Raw Intensity"]
+
+
+def test_csv_folder(tmp_path, results):
+    out = tmp_path / "s_result"
+    assert XPSOUTPUTXL.export_to_folder(str(out), fmt="csv", **results)
+    assert sorted(os.listdir(out)) == ["00_Su1s.csv", "01_C1s.csv", "02_O_1s.csv",
+                                       "Summary_Atomic.csv", "Summary_Fitting.csv"]
+
+    for i, name in enumerate(["00_Su1s.csv", "01_C1s.csv", "02_O_1s.csv"]):
+        df = pd.read_csv(out / name)
+        expected = XPSOUTPUTXL.region_columns(i, results["x_list"], results["y_list"], results["fit_results_list"])
+        assert list(df.columns) == list(expected)
+        for column, values in expected.items():
+            np.testing.assert_allclose(df[column], values, rtol=1e-15)
+
+    atomic = pd.read_csv(out / "Summary_Atomic.csv")
+    assert atomic["Element"].tolist() == results["tags"]
+    assert atomic["Atomic %"].tolist() == results["atomic_percent"]
+
+    fitting = pd.read_csv(out / "Summary_Fitting.csv")
+    peaks = [(tag, p) for tag, res in zip(results["tags"], results["fit_results_list"]) if res
+             for p in res["peaks"]]
+    assert fitting["Spectrum"].tolist() == [tag for tag, _ in peaks]
+    assert fitting["Component Name"].tolist() == ["C-C", "C-O", "Cu-O"]
+    for column, key in (("Position (eV)", "center"), ("FWHM (eV)", "fwhm"), ("Area", "area"),
+                        ("Area Ratio (%)", "ratio")):
+        assert all(math.isclose(v, p[key], rel_tol=1e-15) for v, (_, p) in zip(fitting[column], peaks))
+
+    # xlsx の Summary_Result と同じ表
+    XPSOUTPUTXL.export_to_excel(str(tmp_path / "a.xlsx"), **results)
+    summary = _read_xlsx(tmp_path / "a.xlsx")[XPSOUTPUTXL.SUMMARY_SHEET_NAME]
+    assert summary[0][:2] == ["Element", "Atomic %"]
+    assert [row[:2] for row in summary[1:4]] == atomic.values.tolist()
+    assert summary[7][:6] == list(fitting.columns)
+    assert [row[1] for row in summary[8:11]] == fitting["Component Name"].tolist()
+
+
+@pytest.mark.skipif(importlib.util.find_spec("pyarrow") is not None, reason="pyarrow がある環境")
+def test_parquet_without_pyarrow(tmp_path, results, capsys):
+    assert not XPSOUTPUTXL.export_to_folder(str(tmp_path / "p"), fmt="parquet", **results)
+    assert "pyarrow" in capsys.readouterr().out
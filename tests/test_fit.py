@@ -0,0 +1,111 @@
+#ピークフィッティング: 解析的ヤコビアン, varpro と curve_fit の一致, 連動パラメータ
+import numpy as np
+import pytest
+
+import XPSFIT
+
+PEAKS = [
+    {"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"level": "C1s", "name": "C-O", "center": 286.3, "center_error": 0.8, "FWHM": 1.2, "FWHM_error": 0.4},
+]
+
+
+def _synthetic(params, noise=0.0, seed=0):
+    x = np.linspace(280.0, 292.0, 481)
+    y = XPSFIT.multi_peak_model(x, *params)
+    if noise:
+        y = y + np.random.default_rng(seed).normal(0, noise, len(x))
+    return x, y
+
+
+def _finite_difference(model, x, params, h=1e-6):
+    """中心差分によるヤコビアン"""
+    params = np.asarray(params, dtype=float)
+    jac = np.empty((len(x), len(params)))
+    for j in range(len(params)):
+        step = h * max(1.0, abs(params[j]))
+        up, down = params.copy(), params.copy()
+        up[j] += step
+        down[j] -= step
+        jac[:, j] = (model(x, *up) - model(x, *down)) / (2 * step)
+    return jac
+
+
+def test_jacobian_matches_finite_difference():
+    params = [1000.0, 284.9, 1.1, 0.3, 400.0, 286.2, 1.3, 0.6]
+    x = np.linspace(280.0, 292.0, 481)
+    analytic = XPSFIT.multi_peak_jacobian(x, *params)
+    numeric = _finite_difference(XPSFIT.multi_peak_model, x, params)
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-5, atol=1e-6 * np.abs(numeric).max())
+
+
+@pytest.mark.parametrize("engine", XPSFIT.FIT_ENGINES)
+def test_fit_recovers_parameters(engine):
+    truth = [1000.0, 284.9, 1.1, 0.3, 400.0, 286.2, 1.3, 0.3]
+    x, y = _synthetic(truth, noise=2.0)
+    peaks, _, info = XPSFIT.perform_fitting(x, y, PEAKS, verbose=False, full_output=True, engine=engine)
+    assert info["success"]
+    np.testing.assert_allclose([p["center"] for p in peaks], [284.9, 286.2], atol=0.01)
+    np.testing.assert_allclose([p["fwhm"] for p in peaks], [1.1, 1.3], atol=0.02)
+
+
+def test_varpro_matches_curve_fit():
+    x, y = _synthetic([1000.0, 284.9, 1.1, 0.3, 400.0, 286.2, 1.3, 0.3], noise=2.0)
+    _, _, cf = XPSFIT.perform_fitting(x, y, PEAKS, verbose=False, full_output=True, engine="curve_fit")
+    _, _, vp = XPSFIT.perform_fitting(x, y, PEAKS, verbose=False, full_output=True, engine="varpro")
+    assert cf["success"] and vp["success"]
+    np.testing.assert_allclose(vp["popt"], cf["popt"], rtol=1e-3, atol=1e-3)
+    assert vp["chi2"] == pytest.approx(cf["chi2"], rel=1e-4)
+
+
+LINKED_PEAKS = [
+    {"level": "Cu2p3", "name": "main", "center": 932.6, "center_error": 0.5, "FWHM": 1.2, "FWHM_error": 0.4},
+    {"level": "Cu2p3", "name": "sat", "ref": "main", "center_offset": 2.0, "fwhm_ratio": 1.5,
+     "share_mix": True, "area_ratio": 0.4},
+]
+
+
+@pytest.mark.parametrize("engine", XPSFIT.FIT_ENGINES)
+def test_linked_parameters_hold_after_fit(engine):
+    x = np.linspace(926.0, 942.0, 641)
+    truth = [1000.0, 932.7, 1.3, 0.25]
+    sat = [truth[0] * 0.4 / 1.5, truth[1] + 2.0, truth[2] * 1.5, truth[3]]
+    y = XPSFIT.multi_peak_model(x, *truth, *sat) + np.random.default_rng(1).normal(0, 2.0, len(x))
+
+    peaks, _, info = XPSFIT.perform_fitting(x, y, LINKED_PEAKS, verbose=False, full_output=True, engine=engine)
+    assert info["success"]
+    main, sat_fit = peaks
+    assert sat_fit["center"] == pytest.approx(main["center"] + 2.0)
+    assert sat_fit["fwhm"] == pytest.approx(main["fwhm"] * 1.5)
+    assert sat_fit["mix_ratio"] == pytest.approx(main["mix_ratio"])
+    assert sat_fit["amplitude"] == pytest.approx(main["amplitude"] * 0.4 / 1.5)
+    # 面積はデータの範囲で積分するので、ローレンツ成分の裾の分だけ 0.4 からずれる
+    assert sat_fit["area"] / main["area"] == pytest.approx(0.4, rel=2e-2)
+    assert main["center"] == pytest.approx(932.7, abs=0.01)
+
+
+def test_linked_jacobian_matches_finite_difference():
+    # 連動があるときは、独立なパラメータについての微分は J @ M になる
+    M, c, free_index = XPSFIT.parameter_links(LINKED_PEAKS)
+    free = np.array([1000.0, 932.7, 1.3, 0.25])
+    assert free_index == [0, 1, 2, 3]
+    x = np.linspace(926.0, 942.0, 641)
+    analytic = XPSFIT.multi_peak_jacobian(x, *(M @ free + c)) @ M
+    numeric = _finite_difference(lambda x, *p: XPSFIT.multi_peak_model(x, *(M @ np.asarray(p) + c)), x, free)
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-5, atol=1e-6 * np.abs(numeric).max())
+
+
+def test_parameter_links_errors():
+    assert XPSFIT.parameter_links(PEAKS) is None
+    cycle = [
+        {"name": "a", "ref": "b", "center_offset": 1.0},
+        {"name": "b", "ref": "a", "center_offset": 1.0},
+    ]
+    with pytest.raises(ValueError):
+        XPSFIT.parameter_links(cycle)
+    missing = [{"name": "a", "ref": "zzz", "center_offset": 1.0}]
+    with pytest.raises(ValueError):
+        XPSFIT.parameter_links(missing)
+    no_fwhm = [dict(LINKED_PEAKS[0]), {"name": "sat", "ref": "main", "area_ratio": 0.4}]
+    with pytest.raises(ValueError):
+        XPSFIT.parameter_links(no_fwhm)
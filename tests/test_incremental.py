@@ -0,0 +1,113 @@
+#差分再解析 (XPSBATCH.analyze_file(..., incremental=True)): 変わった領域だけ計算し直すか
+import copy
+
+import numpy as np
+import pytest
+
+import XPSBATCH
+import XPSFIT
+
+RSF = [{"level": "C1s", "rsf": 6.198}, {"level": "O1s", "rsf": 14.892}]
+PEAKS = [
+    {"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"level": "O1s", "name": "Cu-O", "center": 529.8, "center_error": 0.6, "FWHM": 1.1, "FWHM_error": 0.3},
+]
+
+
+def _write(path, o1s_height=600.0):
+    """Su1s (サーベイ), C1s, O1s の合成スペクトルをCSVに書く"""
+    rng = np.random.default_rng(0)
+    regions = [
+        ("Su1s", np.linspace(1000.0, 0.0, 201), None),
+        ("C1s", np.linspace(292.0, 280.0, 241), (1000.0, 284.4)),
+        ("O1s", np.linspace(536.0, 524.0, 241), (o1s_height, 530.0)),
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for tag, x, peak in regions:
+            y = 100 + rng.uniform(0, 5, len(x))
+            if peak is not None:
+                y = y + XPSFIT.multi_peak_model(x, peak[0], peak[1], 1.2, 0.3) + 30 * (x > peak[1])
+            f.write(tag + "\n")
+            np.savetxt(f, np.column_stack([x, y]), delimiter=",", fmt="%.6f")
+    return str(path)
+
+
+@pytest.fixture
+def fitted(monkeypatch):
+    """フィッティングした領域の level を記録する (どの領域を計算し直したか)"""
+    calls = []
+    real = XPSFIT.perform_fitting
+
+    def recording(x, y, peak_infos, **kwargs):
+        calls.append(peak_infos[0]["level"])
+        return real(x, y, peak_infos, **kwargs)
+
+    monkeypatch.setattr(XPSFIT, "perform_fitting", recording)
+    return calls
+
+
+def _run(path, out_dir, rsf=RSF, peaks=PEAKS):
+    summary = XPSBATCH.analyze_file(path, rsf, peaks, out_dir=str(out_dir), export=False, use_cache=False,
+                                    incremental=True)
+    assert summary["status"] == "ok", summary["error"]
+    return summary
+
+
+def test_unchanged_regions_are_reused(tmp_path, fitted):
+    path = _write(tmp_path / "s.csv")
+    first = _run(path, tmp_path)
+    assert first["incremental"] == {"areas_reused": 0, "areas_computed": 2, "fits_reused": 0, "fits_computed": 2}
+    assert sorted(fitted) == ["C1s", "O1s"]
+
+    fitted.clear()
+    second = _run(path, tmp_path)
+    assert second["incremental"] == {"areas_reused": 2, "areas_computed": 0, "fits_reused": 2, "fits_computed": 0}
+    assert fitted == []
+    assert second["atomic_percent"] == first["atomic_percent"]
+    assert second["fits"] == first["fits"]
+
+
+def test_edited_y_recomputes_that_region(tmp_path, fitted):
+    path = _write(tmp_path / "s.csv")
+    first = _run(path, tmp_path)
+    _write(path, o1s_height=900.0)
+
+    fitted.clear()
+    second = _run(path, tmp_path)
+    assert second["incremental"] == {"areas_reused": 1, "areas_computed": 1, "fits_reused": 1, "fits_computed": 1}
+    assert fitted == ["O1s"]
+    assert second["atomic_percent"]["O1s"] > first["atomic_percent"]["O1s"]
+
+
+def test_edited_rsf_renormalizes_without_refitting(tmp_path, fitted):
+    # RSF は面積を割るだけなので、面積・フィッティングは再利用して原子組成比だけ計算し直す
+    path = _write(tmp_path / "s.csv")
+    first = _run(path, tmp_path)
+    rsf = copy.deepcopy(RSF)
+    rsf[1]["rsf"] *= 2
+
+    fitted.clear()
+    second = _run(path, tmp_path, rsf=rsf)
+    assert second["incremental"] == {"areas_reused": 2, "areas_computed": 0, "fits_reused": 2, "fits_computed": 0}
+    assert fitted == []
+    assert second["atomic_percent"]["O1s"] < first["atomic_percent"]["O1s"]
+    assert second["atomic_percent"] == _run(path, tmp_path / "fresh", rsf=rsf)["atomic_percent"]
+
+    # バックグラウンドの種類が変われば、その領域の面積とフィッティングを計算し直す
+    rsf[1]["background"] = "tougaard"
+    fitted.clear()
+    third = _run(path, tmp_path, rsf=rsf)
+    assert third["incremental"] == {"areas_reused": 1, "areas_computed": 1, "fits_reused": 1, "fits_computed": 1}
+    assert fitted == ["O1s"]
+
+
+def test_edited_peakfit_entry_refits_that_region(tmp_path, fitted):
+    path = _write(tmp_path / "s.csv")
+    _run(path, tmp_path)
+    peaks = copy.deepcopy(PEAKS)
+    peaks[1]["FWHM"] = 1.3
+
+    fitted.clear()
+    second = _run(path, tmp_path, peaks=peaks)
+    assert second["incremental"] == {"areas_reused": 2, "areas_computed": 0, "fits_reused": 1, "fits_computed": 1}
+    assert fitted == ["O1s"]
@@ -0,0 +1,56 @@
+#マルチスタート・フィッティング (XPSMULTI): 通常のフィットとの一致, 乱数シードでの再現, 時間切れ
+import numpy as np
+import pytest
+
+import XPSFIT
+import XPSMULTI
+
+PEAKS = [
+    {"level": "Cu2p3", "name": "Cu2O", "center": 932.5, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.4},
+    {"level": "Cu2p3", "name": "CuO", "center": 933.8, "center_error": 0.8, "FWHM": 1.3, "FWHM_error": 0.5},
+]
+
+
+def _spectrum():
+    x = np.linspace(928.0, 940.0, 241)
+    y = XPSFIT.multi_peak_model(x, 800.0, 932.6, 1.1, 0.3, 500.0, 934.0, 1.5, 0.4)
+    return x, y + np.random.default_rng(2).normal(0, 3.0, len(x))
+
+
+def _popt(result):
+    return np.array([[p["amplitude"], p["center"], p["fwhm"], p["mix_ratio"]] for p in result[0]])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_single_start_matches_plain_fit(workers):
+    x, y = _spectrum()
+    plain = XPSFIT.perform_fitting(x, y, PEAKS, verbose=False, full_output=True, maxfev=XPSMULTI.MULTISTART_MAXFEV)
+    multi = XPSMULTI.multistart_fit(x, y, PEAKS, n_starts=1, workers=workers, verbose=False)
+    assert multi[2]["n_starts"] == 1 and multi[2]["best_start"] == 0
+    np.testing.assert_allclose(_popt(multi), _popt(plain), rtol=1e-12)
+    assert multi[2]["chi2"] == plain[2]["chi2"]
+
+
+def test_seeded_run_is_reproducible():
+    x, y = _spectrum()
+    points = XPSMULTI.start_points(x, y, PEAKS, 6, seed=3)
+    np.testing.assert_array_equal(np.array(points), np.array(XPSMULTI.start_points(x, y, PEAKS, 6, seed=3)))
+    assert not np.array_equal(np.array(points[1:]), np.array(XPSMULTI.start_points(x, y, PEAKS, 6, seed=4)[1:]))
+
+    runs = [XPSMULTI.multistart_fit(x, y, PEAKS, n_starts=6, seed=3, workers=w, verbose=False) for w in (1, 2, 2)]
+    for run in runs[1:]:
+        np.testing.assert_array_equal(_popt(run), _popt(runs[0]))
+        for key in ("n_starts", "n_best", "best_start", "chi2", "nfev"):
+            assert run[2][key] == runs[0][2][key]
+
+
+def test_time_budget_terminates_pool():
+    # 時間切れのときは実行中の初期値ごとプールを止め、次の呼び出しで新しいプールを作る
+    x, y = _spectrum()
+    with XPSMULTI.StartPool(2) as pool:
+        first = XPSMULTI.multistart_fit(x, y, PEAKS, n_starts=8, time_budget=0.0, workers=2, verbose=False,
+                                        pool=pool)
+        assert first[2]["timed_out"] and first[2]["n_starts"] < 8
+        assert pool._pool is None
+        second = XPSMULTI.multistart_fit(x, y, PEAKS, n_starts=3, workers=2, verbose=False, pool=pool)
+        assert not second[2]["timed_out"] and second[2]["n_starts"] == 3
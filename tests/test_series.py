@@ -0,0 +1,72 @@
+#系列フィッティング (XPSSERIES.fit_series): 前サイクルからの開始と、発散したときのやり直し
+import numpy as np
+import pytest
+
+import XPSFIT
+import XPSSERIES
+
+PEAKS = [
+    {"level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"level": "C1s", "name": "C-O", "center": 286.3, "center_error": 0.8, "FWHM": 1.2, "FWHM_error": 0.4},
+]
+
+
+def _depth_series(n_cycles=8, step_at=5, step=30.0):
+    """C-O が少しずつ減る深さ方向の系列。step_at 以降は強度が step 倍になる (ポアソンノイズ)"""
+    rng = np.random.default_rng(0)
+    x = np.linspace(292.0, 280.0, 241)
+    x_list, y_list = [], []
+    for cycle in range(n_cycles):
+        scale = step if cycle >= step_at else 1.0
+        y = 50 + XPSFIT.multi_peak_model(x, 1000.0, 284.9, 1.1, 0.3, 500.0 - 40 * cycle, 286.3, 1.3, 0.3)
+        x_list.append(x)
+        y_list.append(rng.poisson(scale * y).astype(float))
+    return x_list, y_list
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    """perform_fitting に渡された初期値 p0 と、返した popt を記録する"""
+    calls = []
+    real = XPSFIT.perform_fitting
+
+    def recording(x, y, peak_infos, **kwargs):
+        result = real(x, y, peak_infos, **kwargs)
+        calls.append((kwargs.get("p0"), result[2]["popt"] if result[2]["success"] else None))
+        return result
+
+    monkeypatch.setattr(XPSFIT, "perform_fitting", recording)
+    return calls
+
+
+def test_warm_start_and_fallback(fits):
+    x_list, y_list = _depth_series()
+    df = XPSSERIES.fit_series(x_list, y_list, PEAKS)
+    assert df["success"].all()
+    warm = df.groupby("cycle")["warm_started"].first().tolist()
+    assert warm == [False, True, True, True, True, False, True, True]
+
+    # 前サイクルの収束結果から始め、強度が変わったサイクル (χ² が 10 倍以上) だけJSONの初期値でやり直す
+    p0s = [p0 for p0, _ in fits]
+    assert [p0 is None for p0 in p0s] == [True, False, False, False, False, False, True, False, False]
+    for k in range(1, len(fits)):
+        if p0s[k] is not None:
+            # 直前に採用した結果 (発散した後はやり直した結果) から始める
+            np.testing.assert_array_equal(p0s[k], fits[k - 1][1])
+    chi2 = df.groupby("cycle")["chi2"].first()
+    assert chi2[5] > XPSSERIES.DIVERGENCE_RATIO * chi2[4]
+    nfev = df.groupby("cycle")["nfev"].first()
+    assert nfev[5] > nfev[4]  # 発散したサイクルは2回分の評価回数
+
+    # やり直した結果は、そのサイクルだけをJSONの初期値からフィットした結果と同じ
+    alone = XPSSERIES.fit_series(x_list[5:6], y_list[5:6], PEAKS)
+    cycle5 = df[df["cycle"] == 5].reset_index(drop=True)
+    for key in ("amplitude", "center", "fwhm", "mix_ratio", "chi2"):
+        np.testing.assert_array_equal(cycle5[key], alone[key])
+
+
+def test_without_warm_start(fits):
+    x_list, y_list = _depth_series(n_cycles=3)
+    df = XPSSERIES.fit_series(x_list, y_list, PEAKS, warm_start=False)
+    assert not df["warm_started"].any()
+    assert all(p0 is None for p0, _ in fits) and len(fits) == 3
@@ -0,0 +1,98 @@
+#常駐解析サービス (XPSSERVE.AnalysisService) をプロセス内で動かし、HTTP で依頼する
+import asyncio
+import json
+import os
+
+import numpy as np
+
+import XPSBATCH
+import XPSFIT
+import XPSSERVE
+
+
+def _csv(path):
+    x = np.linspace(292.0, 280.0, 241)
+    y = 100 + XPSFIT.multi_peak_model(x, 1000.0, 284.6, 1.2, 0.3)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("C1s\n")
+        np.savetxt(f, np.column_stack([x, y]), delimiter=",", fmt="%.6f")
+    return str(path)
+
+
+def _run(data_roots, requests, **kwargs):
+    """サービスを起動し、(本文, Content-Type) の依頼を順に HTTP で送って (ステータス, 結果) のリストを返す"""
+    async def main():
+        service = XPSSERVE.AnalysisService(XPSBATCH.DEFAULT_RSF_PATH, XPSBATCH.DEFAULT_PEAKFIT_PATH, workers=1,
+                                           use_cache=False, data_roots=data_roots, **kwargs)
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await _post(port, body, content_type) for body, content_type in requests]
+        finally:
+            await service.close()
+    return asyncio.run(main())
+
+
+async def _post(port, body, content_type):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((f"POST /analyze HTTP/1.1\r\nHost: x\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(data)
+
+
+def _path(path):
+    return json.dumps({"path": path}).encode(), "application/json"
+
+
+def test_status_codes(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    inside = _csv(data / "s.csv")
+    outside = _csv(tmp_path / "t.csv")
+    os.symlink(outside, data / "link.csv")
+    with open(inside, "rb") as f:
+        csv_body = f.read()
+
+    results = _run([str(data)], [
+        (csv_body, "text/csv"),
+        _path(inside),
+        _path(os.path.join(str(data), "..", "t.csv")),
+        _path(str(data / "link.csv")),  # 許可したフォルダの中のリンクでも、実体が外なら断る
+        _path(str(data / "none.csv")),
+        (b'{"spectra": {"tags": ["C1s"]}}', "application/json"),
+        (b"not a spectrum", "text/csv"),
+    ])
+    status = [s for s, _ in results]
+    assert status == [200, 200, 403, 403, 400, 400, 400]
+    assert results[0][1]["tags"] == ["C1s"] and results[0][1]["atomic_percent"] == results[1][1]["atomic_percent"]
+    assert "t.csv" in results[2][1]["error"]
+
+
+def test_path_requests_refused_without_data_roots(tmp_path):
+    [(status, result)] = _run(None, [_path(_csv(tmp_path / "s.csv"))])
+    assert status == 403 and result["status"] == "error"
+
+
+def test_busy_service_answers_503(tmp_path):
+    # 処理中の件数が max_pending に達していれば、待たせずに 503 を返す
+    with open(_csv(tmp_path / "s.csv"), "rb") as f:
+        body = f.read()
+
+    async def main():
+        service = XPSSERVE.AnalysisService(XPSBATCH.DEFAULT_RSF_PATH, XPSBATCH.DEFAULT_PEAKFIT_PATH, workers=1,
+                                           use_cache=False, max_pending=1)
+        await service.warm_up()
+        try:
+            results = await asyncio.gather(*[service.analyze(body, "text/csv") for _ in range(3)])
+            return results, service.health()
+        finally:
+            await service.close()
+
+    results, health = asyncio.run(main())
+    assert [s for s, _ in results] == [200, 503, 503]
+    assert all(r["status"] == "busy" for _, r in results[1:])
+    assert health["requests"] == {"ok": 1, "error": 0, "rejected": 2, "timeout": 0}
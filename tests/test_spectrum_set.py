@@ -0,0 +1,90 @@
+#SpectrumSet: リストとの相互変換, CSV (load_allspe) と .xpsb の保存・読み込み
+import numpy as np
+
+import XPSASC
+import XPSBIN
+import XPSSET
+
+TAGS = ["Su1s", "C1s", "O1s"]
+
+
+def _lists():
+    rng = np.random.default_rng(0)
+    x_list = [np.linspace(0.0, 1000.0, 51), np.linspace(280.0, 295.0, 31), np.linspace(525.0, 540.0, 41)]
+    y_list = [np.round(rng.uniform(0, 1000, len(x)), 3) for x in x_list]
+    return TAGS, x_list, y_list
+
+
+def _assert_same(spectra, tags, x_list, y_list):
+    assert spectra.tags == tags
+    assert len(spectra.x_list) == len(x_list)
+    for a, b in zip(spectra.x_list, x_list):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(spectra.y_list, y_list):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_from_lists_round_trip():
+    tags, x_list, y_list = _lists()
+    spectra = XPSSET.SpectrumSet.from_lists(tags, x_list, y_list)
+    _assert_same(spectra, tags, x_list, y_list)
+
+    tags_back, x_back, y_back = spectra
+    assert tags_back == tags
+    # 分けた各領域は連結配列のビュー
+    assert all(np.shares_memory(x, spectra.x) for x in x_back)
+    x_c1s, y_c1s = spectra["C1s"]
+    np.testing.assert_array_equal(x_c1s, x_list[1])
+    np.testing.assert_array_equal(y_c1s, y_list[1])
+
+
+def test_shift_energy_in_place():
+    tags, x_list, y_list = _lists()
+    spectra = XPSSET.SpectrumSet.from_lists(tags, x_list, y_list)
+    buffer = spectra.x
+    spectra.shift_energy(1.5)
+    assert spectra.x is buffer
+    assert spectra.energy_shift == 1.5
+    for a, b in zip(spectra.x_list, x_list):
+        np.testing.assert_allclose(a, b + 1.5)
+
+
+def test_csv_round_trip(tmp_path):
+    tags, x_list, y_list = _lists()
+    path = tmp_path / "s.csv"
+    with open(path, "w", encoding="utf-8") as f:
+        for tag, x, y in zip(tags, x_list, y_list):
+            f.write(tag + "\n")
+            np.savetxt(f, np.column_stack([x, y]), delimiter=",", fmt="%.6f")
+
+    spectra = XPSASC.load_allspe(str(path), binary_cache=False)
+    assert spectra.tags == tags
+    for a, b in zip(spectra.x_list, x_list):
+        np.testing.assert_allclose(a, b, atol=1e-6)
+    for a, b in zip(spectra.y_list, y_list):
+        np.testing.assert_allclose(a, b, atol=1e-6)
+    # 既定では .xpsb を作らない
+    assert not (tmp_path / "s.xpsb").exists()
+
+
+def test_binary_round_trip(tmp_path):
+    tags, x_list, y_list = _lists()
+    spectra = XPSSET.SpectrumSet.from_lists(tags, x_list, y_list, metadata={"sample": "A"})
+    path = str(tmp_path / "s.xpsb")
+    XPSBIN.save_spectra(path, spectra)
+
+    loaded = XPSBIN.load_binary(path)
+    _assert_same(loaded, tags, x_list, y_list)
+    assert loaded.metadata == {"sample": "A"}
+    # メモリマップをそのまま使う (コピーしないので読み取り専用)
+    assert not loaded.x.flags.writeable
+
+    x, y = XPSBIN.load_region(path, "O1s")
+    np.testing.assert_array_equal(x, x_list[2])
+    np.testing.assert_array_equal(y, y_list[2])
+    assert XPSBIN.load_region(path, "N1s") is None
+
+    # 帯電補正はコピーしてから行い、ファイルは変わらない
+    loaded.shift_energy(2.0)
+    np.testing.assert_allclose(loaded.x_list[1], x_list[1] + 2.0)
+    _assert_same(XPSBIN.load_binary(path), tags, x_list, y_list)